@@ -0,0 +1,119 @@
+import logging
+import re
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import connections
+from django.template.loader import render_to_string
+
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Rafraîchissements en cours (voir attendre_rafraichissements).
+_rafraichissements = set()
+
+
+def get_version(namespace):
+    """Numéro de version courant d'un espace de cache."""
+    key = 'version:%s' % namespace
+    version = cache.get(key)
+    if version is None:
+        # Partir de l'horodatage évite de retomber sur une ancienne version
+        # si la clé a été évincée du cache.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Invalide d'un coup toutes les entrées d'un espace de cache."""
+    key = 'version:%s' % namespace
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
+
+
+def get_or_build(namespace, name, builder, timeout=DEFAULT_TIMEOUT):
+    """Retourne la valeur `name` de l'espace `namespace`, construite au besoin.
+
+    La clé contient la version de l'espace : une fois la version incrémentée,
+    les anciennes entrées ne sont plus jamais lues et expirent d'elles-mêmes.
+    """
+    key = '%s:%s:%s' % (namespace, get_version(namespace), name)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = builder()
+        cache.set(key, value, timeout)
+    return value
+
+
+def _rafraichir(key, builder, version, fresh_for, timeout):
+    try:
+        cache.set(key, (version, time.time() + fresh_for, builder()), timeout)
+    except Exception:
+        logger.exception("Rafraîchissement de %s impossible", key)
+    finally:
+        cache.delete(key + ':verrou')
+        connections.close_all()
+        _rafraichissements.discard(threading.current_thread())
+
+
+def get_or_build_stale(namespace, name, builder, fresh_for, depends_on=(), timeout=DEFAULT_TIMEOUT):
+    """Comme get_or_build, mais une valeur périmée reste servie pendant son rafraîchissement.
+
+    Une valeur est périmée après `fresh_for` secondes, ou quand la version de
+    `namespace` ou d'un espace de `depends_on` a changé. Le premier processus
+    qui obtient le verrou la reconstruit dans un thread ; les autres
+    continuent de servir l'ancienne copie au lieu de reconstruire tous en
+    même temps. Seule une entrée absente est construite pendant la requête.
+    `builder` tourne alors hors de toute requête : il ne doit pas en dépendre.
+    """
+    key = '%s:%s' % (namespace, name)
+    version = tuple(get_version(ns) for ns in (namespace,) + tuple(depends_on))
+    entry = cache.get(key)
+    if entry is None:
+        value = builder()
+        cache.set(key, (version, time.time() + fresh_for, value), timeout)
+        return value
+
+    built_for, expires, value = entry
+    if (built_for != version or expires <= time.time()) and cache.add(key + ':verrou', 1, fresh_for):
+        thread = threading.Thread(
+            target=_rafraichir, args=(key, builder, version, fresh_for, timeout), daemon=True,
+        )
+        _rafraichissements.add(thread)
+        thread.start()
+    return value
+
+
+def attendre_rafraichissements(timeout=None):
+    """Attend la fin des rafraîchissements lancés par get_or_build_stale.
+
+    Utilisé avant de fermer la base (fin des tests) : un thread encore actif
+    s'y reconnecterait après coup.
+    """
+    for thread in list(_rafraichissements):
+        thread.join(timeout)
+
+
+_TROU = re.compile(r'<!--trou:([\w.-]+)-->')
+
+
+def remplir_trous(html, request, contexte=None):
+    """Remplace les marqueurs {% trou %} d'une page en cache par leur rendu pour `request`."""
+    rendus = {}
+
+    def remplir(trouve):
+        nom = trouve.group(1)
+        if nom not in rendus:
+            rendus[nom] = render_to_string(nom, contexte, request)
+        return rendus[nom]
+
+    return _TROU.sub(remplir, html)
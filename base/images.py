@@ -0,0 +1,118 @@
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .cache import bump_version, get_or_build
+from .models import FichierContenu
+
+
+logger = logging.getLogger(__name__)
+
+# Largeurs (px) des variantes, de la vignette de liste à la fiche en grand.
+LARGEURS = (270, 540, 1080)
+
+# Format → (extension, options d'enregistrement Pillow).
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+DOSSIER = 'variantes'
+
+# Présence des variantes de chaque image ; la version change dès que des
+# variantes sont écrites ou supprimées (pages en cache comprises).
+VARIANTES_CACHE = 'variantes'
+
+
+def chemin_variante(nom, largeur, format='jpeg'):
+    """Chemin de la variante `largeur`/`format` du fichier `nom` dans le stockage média."""
+    racine, _ = os.path.splitext(nom)
+    return '%s/%s-%s.%s' % (DOSSIER, racine, largeur, FORMATS[format][0])
+
+
+def _redimensionner(image, largeur):
+    if image.width <= largeur:
+        return image
+    hauteur = max(1, round(image.height * largeur / image.width))
+    return image.resize((largeur, hauteur), Image.LANCZOS)
+
+
+def generer_variantes(nom, stockage=None, forcer=False):
+    """Crée les variantes redimensionnées (WebP et JPEG) d'une image de `stockage`.
+
+    Un nouveau fichier source porte toujours un nouveau nom : si la plus
+    grande variante existe déjà, l'image n'a pas changé et rien n'est refait.
+    Les variantes vont dans le stockage par défaut. Retourne le nombre de
+    fichiers écrits.
+    """
+    stockage = stockage or default_storage
+    if not nom or (not forcer and default_storage.exists(chemin_variante(nom, LARGEURS[-1], 'webp'))):
+        return 0
+
+    try:
+        with stockage.open(nom) as fichier:
+            source = ImageOps.exif_transpose(Image.open(fichier))
+            source.load()
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError):
+        logger.warning("Variantes impossibles pour %s", nom, exc_info=True)
+        return 0
+
+    ecrits = 0
+    for largeur in LARGEURS:
+        image = _redimensionner(source, largeur)
+        for format, (_, options) in FORMATS.items():
+            converti = image
+            if format == 'jpeg' and image.mode != 'RGB':
+                converti = image.convert('RGB')
+            elif format == 'webp' and image.mode not in ('RGB', 'RGBA'):
+                converti = image.convert('RGBA')
+            contenu = io.BytesIO()
+            converti.save(contenu, **options)
+            chemin = chemin_variante(nom, largeur, format)
+            if default_storage.exists(chemin):
+                default_storage.delete(chemin)
+            default_storage.save(chemin, ContentFile(contenu.getvalue()))
+            ecrits += 1
+    bump_version(VARIANTES_CACHE)
+    return ecrits
+
+
+def supprimer_variantes(nom):
+    for largeur in LARGEURS:
+        for format in FORMATS:
+            default_storage.delete(chemin_variante(nom, largeur, format))
+    bump_version(VARIANTES_CACHE)
+
+
+def variantes_pretes(nom):
+    """Vrai si les variantes de `nom` existent.
+
+    Le stockage n'est interrogé qu'une fois par image et par version de
+    VARIANTES_CACHE : une image ancienne, l'image par défaut avant le
+    rattrapage ou une image dont la génération a échoué n'en ont pas.
+    """
+    return get_or_build(
+        VARIANTES_CACHE, nom, lambda: default_storage.exists(chemin_variante(nom, LARGEURS[-1]))
+    )
+
+
+def generer_variantes_en_attente(stockage, limite=100):
+    """Crée les variantes des fichiers de `stockage` qui n'en ont pas encore. Retourne leur nombre.
+
+    Chaque fichier est marqué traité, même si ses variantes n'ont pas pu être
+    créées (il est alors servi tel quel) : aucun n'est repris indéfiniment.
+    """
+    noms = list(
+        FichierContenu.objects.filter(variantes=False, references__gt=0)
+        .order_by('id').values_list('nom', flat=True)[:limite]
+    )
+    for nom in noms:
+        generer_variantes(nom, stockage)
+    FichierContenu.objects.filter(nom__in=noms).update(variantes=True)
+    return len(noms)
@@ -0,0 +1,67 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class _CompteurRequetes:
+    """execute_wrapper qui compte les requêtes SQL et cumule leur durée."""
+
+    def __init__(self):
+        self.nombre = 0
+        self.duree = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duree += time.perf_counter() - debut
+            self.nombre += 1
+
+
+class QueryBudgetMiddleware:
+    """Mesure les requêtes SQL de chaque vue et les compare à son budget.
+
+    Les budgets sont déclarés par nom de vue dans `settings.QUERY_BUDGETS`.
+    Le résultat est exposé dans l'en-tête `Server-Timing`. Un dépassement est
+    journalisé, ou lève `QueryBudgetExceeded` si `QUERY_BUDGET_STRICT` est
+    activé (utile dans les tests).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        compteur = _CompteurRequetes()
+        debut = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(compteur))
+            response = self.get_response(request)
+        duree = time.perf_counter() - debut
+
+        response['Server-Timing'] = 'db;dur=%.1f;desc="%d requetes", app;dur=%.1f' % (
+            compteur.duree * 1000, compteur.nombre, duree * 1000,
+        )
+
+        match = request.resolver_match
+        vue = match.url_name if match else None
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(vue)
+        if budget is not None and compteur.nombre > budget:
+            message = "Budget SQL dépassé pour '%s' : %d requêtes (budget %d), %.1f ms" % (
+                vue, compteur.nombre, budget, compteur.duree * 1000,
+            )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
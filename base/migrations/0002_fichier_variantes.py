@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-17 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0001_fichiers_contenu'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fichiercontenu',
+            name='variantes',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,3 +1,21 @@
 from django.db import models
 
 # Create your models here.
+
+
+class FichierContenu(models.Model):
+    """Nombre de champs qui désignent un fichier de base.storage.StockageContenu."""
+
+    nom = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+    # Variantes redimensionnées créées (base.images.generer_variantes_en_attente).
+    variantes = models.BooleanField(default=False)
+
+    date_add = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Fichier'
+        verbose_name_plural = 'Fichiers'
+
+    def __str__(self):
+        return f"{self.nom} ({self.references})"
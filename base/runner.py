@@ -0,0 +1,15 @@
+from django.test.runner import DiscoverRunner
+
+from .cache import attendre_rafraichissements
+
+
+class TestRunner(DiscoverRunner):
+    """Lanceur de tests qui attend les rafraîchissements de cache en arrière-plan.
+
+    Sans cela, un thread de base.cache encore actif à la suppression de la
+    base de test se reconnecterait à la base configurée (db.sqlite3).
+    """
+
+    def teardown_databases(self, old_config, **kwargs):
+        attendre_rafraichissements()
+        super().teardown_databases(old_config, **kwargs)
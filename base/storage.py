@@ -0,0 +1,100 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .models import FichierContenu
+
+
+@deconstructible
+class StockageContenu(FileSystemStorage):
+    """Stockage adressé par le contenu : un fichier est rangé sous l'empreinte de ses octets.
+
+    `produis/images/photo.jpg` devient `produis/images/3f/a2/3fa2….jpg` : deux
+    envois identiques donnent le même nom et ne sont écrits qu'une fois, et
+    les deux niveaux de sous-dossiers évitent un dossier unique géant. Chaque
+    enregistrement compte une référence (base.models.FichierContenu) ;
+    delete() en retire une et n'efface le fichier qu'à la dernière.
+    """
+
+    def _empreinte(self, content):
+        empreinte = hashlib.blake2b(digest_size=16)
+        for morceau in content.chunks():
+            empreinte.update(morceau)
+        content.seek(0)
+        return empreinte.hexdigest()
+
+    def nom_contenu(self, name, content):
+        dossier, nom = os.path.split(name)
+        extension = os.path.splitext(nom)[1].lower()
+        empreinte = self._empreinte(content)
+        return '/'.join(filter(None, (dossier, empreinte[:2], empreinte[2:4], empreinte + extension)))
+
+    def nom_pour(self, name, content):
+        """Nom sous lequel save() rangerait `content` envoyé sous `name`."""
+        return self.nom_contenu(self.generate_filename(name), content)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.nom_pour(name, content)
+        # La référence est prise avant de regarder le disque : un delete()
+        # concurrent ne peut plus effacer le fichier (voir delete()), ou l'a
+        # déjà fait et il est alors réécrit ici.
+        with transaction.atomic():
+            self._referencer(name, 1)
+            if not self.exists(name):
+                ecrit = self._save(name, content)
+                if ecrit != name:
+                    # Écrit en même temps par un autre processus : même contenu.
+                    super().delete(ecrit)
+        return name
+
+    def delete(self, name):
+        """Retire une référence ; retourne True si le fichier a été effacé.
+
+        Le fichier n'est effacé que si le DELETE conditionnel de sa ligne
+        (références toujours à zéro) aboutit, dans la même transaction : un
+        save() concurrent du même contenu attend la fin de celle-ci, puis
+        recrée la ligne et réécrit le fichier.
+        """
+        if not name:
+            return False
+        with transaction.atomic():
+            if self._referencer(name, -1) != 0:
+                return False
+            if not FichierContenu.objects.filter(nom=name, references__lte=0).delete()[0]:
+                return False
+            super().delete(name)
+        return True
+
+    def references(self, name):
+        return FichierContenu.objects.filter(nom=name).values_list('references', flat=True).first() or 0
+
+    def _referencer(self, name, delta):
+        """Ajoute `delta` aux références de `name` et retourne le nouveau total.
+
+        Un fichier inconnu du compteur (enregistré avant ce stockage) n'est
+        jamais considéré comme libre.
+        """
+        with transaction.atomic():
+            mis_a_jour = FichierContenu.objects.filter(nom=name).update(references=F('references') + delta)
+            if not mis_a_jour:
+                if delta < 0:
+                    return None
+                try:
+                    with transaction.atomic():
+                        FichierContenu.objects.create(nom=name, references=delta)
+                except IntegrityError:
+                    FichierContenu.objects.filter(nom=name).update(references=F('references') + delta)
+            return self.references(name)
+
+
+stockage_contenu = StockageContenu()
@@ -0,0 +1,49 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from base.images import LARGEURS, chemin_variante, variantes_pretes
+
+
+register = template.Library()
+
+
+def _srcset(fichier, format):
+    return ', '.join(
+        '%s %sw' % (default_storage.url(chemin_variante(fichier.name, largeur, format)), largeur)
+        for largeur in LARGEURS
+    )
+
+
+@register.filter
+def variante(fichier, largeur):
+    """URL de la variante JPEG d'une image, par exemple pour un fond CSS.
+
+    Sans variantes, l'URL de l'image d'origine.
+    """
+    if not fichier:
+        return ''
+    if not variantes_pretes(fichier.name):
+        return fichier.url
+    return default_storage.url(chemin_variante(fichier.name, int(largeur)))
+
+
+@register.simple_tag
+def image_responsive(fichier, alt='', sizes='270px', largeur=540, **attributs):
+    """<picture> avec les variantes WebP et JPEG de `fichier` en srcset.
+
+    {% image_responsive produit.image alt=produit.nom sizes="(max-width: 576px) 100vw, 270px" %}
+
+    Sans variantes, un simple <img> de l'image d'origine.
+    """
+    if not fichier:
+        return ''
+    autres = format_html(''.join(' %s="{}"' % nom.replace('_', '-') for nom in attributs), *attributs.values())
+    if not variantes_pretes(fichier.name):
+        return format_html('<img src="{}" alt="{}" loading="lazy"{}>', fichier.url, alt, autres)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy"{}></picture>',
+        _srcset(fichier, 'webp'), sizes,
+        variante(fichier, largeur), _srcset(fichier, 'jpeg'), sizes, alt, autres,
+    )
@@ -0,0 +1,35 @@
+from django import template
+
+
+register = template.Library()
+
+MARQUE = '<!--trou:%s-->'
+
+
+class TrouNode(template.Node):
+
+    def __init__(self, nom):
+        self.nom = nom
+
+    def render(self, context):
+        nom = self.nom.resolve(context)
+        if context.get('rendu_partage'):
+            # Page mise en cache pour tous : la partie propre au visiteur est
+            # rendue à chaque requête par base.cache.remplir_trous.
+            return MARQUE % nom
+        gabarit = context.template.engine.get_template(nom)
+        with context.push():
+            return gabarit.render(context)
+
+
+@register.tag
+def trou(parser, token):
+    """{% trou 'gabarit.html' %} : inclut un gabarit propre au visiteur.
+
+    Se comporte comme {% include %}, sauf dans une page rendue pour le cache
+    partagé (`rendu_partage`), où il laisse un marqueur à remplir plus tard.
+    """
+    morceaux = token.split_contents()
+    if len(morceaux) != 2:
+        raise template.TemplateSyntaxError("%r attend un nom de gabarit" % morceaux[0])
+    return TrouNode(parser.compile_filter(morceaux[1]))
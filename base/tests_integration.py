@@ -1,5 +1,11 @@
-from django.test import TestCase
+import threading
+
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from django.template import Template, Context
+from django.urls import reverse
+from base.cache import bump_version, get_or_build_stale
+from base.middleware import QueryBudgetExceeded
 
 
 class TestBaseIntegration(TestCase):
@@ -27,3 +33,62 @@ class TestBaseIntegration(TestCase):
 
         html = template.render(Context(context))
         self.assertIn("CONTENT", html)
+
+
+class TestBudgetRequetes(TestCase):
+
+    def setUp(self):
+        # La page d'accueil en cache ne ferait aucune requête
+        cache.clear()
+
+    def test_en_tete_server_timing(self):
+        response = self.client.get(reverse("index"))
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+    @override_settings(QUERY_BUDGETS={"index": 0}, QUERY_BUDGET_STRICT=True)
+    def test_depassement_echoue_en_mode_strict(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse("index"))
+
+    @override_settings(QUERY_BUDGETS={"index": 0}, QUERY_BUDGET_STRICT=False)
+    def test_depassement_journalise(self):
+        with self.assertLogs("base.middleware", level="WARNING"):
+            response = self.client.get(reverse("index"))
+        self.assertEqual(response.status_code, 200)
+
+
+class TestCachePerime(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.appels = 0
+        self.reconstruit = threading.Event()
+
+    def construire(self):
+        self.appels += 1
+        if self.appels > 1:
+            self.reconstruit.set()
+        return self.appels
+
+    def test_valeur_perimee_servie_pendant_le_rafraichissement(self):
+        self.assertEqual(get_or_build_stale("essai", "x", self.construire, 0), 1)
+
+        self.assertEqual(get_or_build_stale("essai", "x", self.construire, 0), 1)
+        self.assertTrue(self.reconstruit.wait(5))
+        self.assertEqual(get_or_build_stale("essai", "x", self.construire, 60), 2)
+
+    def test_un_seul_rafraichissement_a_la_fois(self):
+        get_or_build_stale("essai", "x", self.construire, 0)
+        cache.add("essai:x:verrou", 1)
+
+        for _ in range(3):
+            self.assertEqual(get_or_build_stale("essai", "x", self.construire, 0), 1)
+        self.assertEqual(self.appels, 1)
+
+    def test_changement_de_version(self):
+        get_or_build_stale("essai", "x", self.construire, 60, depends_on=("autre",))
+
+        bump_version("autre")
+
+        self.assertEqual(get_or_build_stale("essai", "x", self.construire, 60, depends_on=("autre",)), 1)
+        self.assertTrue(self.reconstruit.wait(5))
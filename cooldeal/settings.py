@@ -83,6 +83,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -93,10 +94,30 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Nombre maximal de requêtes SQL par vue (voir base.middleware).
+# En mode strict, un dépassement lève une exception au lieu d'être journalisé.
+QUERY_BUDGETS = {
+    'index': 10,
+    'shop': 10,
+    'categorie': 10,
+    'product_detail': 10,
+    'produits_page': 10,
+    'recherche': 10,
+    'cart': 8,
+    'checkout': 10,
+    'dashboard': 15,
+    'commande': 15,
+}
+QUERY_BUDGET_STRICT = False
+
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 
 CRON_CLASSES = [
     "customer.cron.CleanExpiredTokensCronJob",
+    "shop.cron.BalayerPromotionsCronJob",
+    "shop.cron.TraiterImagesCronJob",
+    "shop.cron.CompleterDealsAssociesCronJob",
+    "customer.cron.LibererReservationsCronJob",
 ]
 
 
@@ -127,7 +148,6 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'website.context_processors.categories',
                 'website.context_processors.site_infos',
-                'website.context_processors.cities',
                 'website.context_processors.cart',
                 'website.context_processors.galeries',
                 'website.context_processors.horaires',
@@ -138,6 +158,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'cooldeal.wsgi.application'
 
+# Attend les rafraîchissements de cache en arrière-plan avant de supprimer la base de test
+TEST_RUNNER = 'base.runner.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -160,6 +183,37 @@ DATABASES = {
 # }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# En production le cache doit être partagé entre les workers gunicorn.
+
+if os.environ.get('ENV') == 'PRODUCTION':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+            'TIMEOUT': 60 * 60 * 24,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'TIMEOUT': 60 * 60 * 24,
+        }
+    }
+
+
+# Panier des visiteurs anonymes (cookie signé, voir customer.utils)
+
+CART_COOKIE_NAME = 'panier'
+CART_COOKIE_AGE = 60 * 60 * 24 * 30
+
+# Durée (s) pendant laquelle le stock d'un panier reste réservé au paiement (customer.stock)
+
+STOCK_RESERVATION_DUREE = 15 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,65 @@
+from django.db.models import F, Q
+from django.utils.timezone import localdate
+
+from base.cache import get_or_build
+from . import models
+
+
+COUPONS_CACHE = 'coupons'
+# Court : un coupon qui expire ou s'épuise disparaît vite, même sans signal.
+COUPONS_TIMEOUT = 60
+
+
+class CouponInvalide(Exception):
+    pass
+
+
+def normaliser(code):
+    """Forme canonique d'un code promo : sans espaces, en majuscules."""
+    return ''.join((code or '').split()).upper()
+
+
+def coupon_valide(prefixe=''):
+    """Condition d'un coupon utilisable aujourd'hui : actif, non expiré, non épuisé.
+
+    `prefixe` permet de l'appliquer à travers une relation (ex. 'panier__coupon__').
+    """
+    return Q(**{
+        prefixe + 'etat': True,
+        prefixe + 'status': True,
+        prefixe + 'date_fin__gte': localdate(),
+    }) & (Q(**{prefixe + 'nombre_u__isnull': True}) | Q(**{prefixe + 'nombre_u__gt': 0}))
+
+
+def _actifs():
+    return {
+        code: (id, date_fin)
+        for code, id, date_fin in models.CodePromotionnel.objects.filter(coupon_valide())
+        .values_list('code_promo', 'id', 'date_fin')
+    }
+
+
+def trouver(code):
+    """Id du coupon actif portant ce code, lu dans le cache des coupons actifs.
+
+    Le nombre d'utilisations n'y est qu'indicatif : seul utiliser() fait foi.
+    Lève CouponInvalide si le code est inconnu, inactif ou expiré.
+    """
+    trouve = get_or_build(COUPONS_CACHE, 'actifs', _actifs, COUPONS_TIMEOUT).get(normaliser(code))
+    if trouve is None or trouve[1] < localdate():
+        raise CouponInvalide
+    return trouve[0]
+
+
+def utiliser(coupon_id):
+    """Décompte une utilisation du coupon par un UPDATE conditionnel.
+
+    Deux commandes simultanées ne peuvent pas consommer la même dernière
+    utilisation. Un coupon sans limite (nombre_u NULL) le reste. Lève
+    CouponInvalide si le coupon n'est plus utilisable.
+    """
+    utilise = models.CodePromotionnel.objects.filter(coupon_valide(), id=coupon_id).update(
+        nombre_u=F('nombre_u') - 1,
+    )
+    if not utilise:
+        raise CouponInvalide
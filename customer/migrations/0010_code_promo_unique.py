@@ -0,0 +1,42 @@
+# Generated by Django 4.2.9 on 2026-10-17 01:59
+
+from django.db import migrations, models
+
+
+def normaliser_codes(apps, schema_editor):
+    CodePromotionnel = apps.get_model('customer', 'CodePromotionnel')
+    coupons = list(CodePromotionnel.objects.order_by('id'))
+    codes = {
+        coupon.id: ''.join((coupon.code_promo or '').split()).upper()
+        for coupon in coupons
+    }
+    # Les codes conservés tels quels ne doivent pas servir de suffixe
+    reserves = set(codes.values())
+    vus = set()
+    for coupon in coupons:
+        code = codes[coupon.id]
+        # Un doublon après normalisation garde son id en suffixe, répété
+        # tant que le code obtenu est déjà pris
+        if code in vus:
+            suffixe = code
+            while suffixe in vus or suffixe in reserves:
+                suffixe = '%s-%s' % (suffixe, coupon.id)
+            code = suffixe
+        vus.add(code)
+        if code != coupon.code_promo:
+            CodePromotionnel.objects.filter(id=coupon.id).update(code_promo=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0009_reservationstock'),
+    ]
+
+    operations = [
+        migrations.RunPython(normaliser_codes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='codepromotionnel',
+            constraint=models.UniqueConstraint(fields=('code_promo',), name='code_promo_unique'),
+        ),
+    ]
@@ -3,9 +3,12 @@ from django.contrib.auth.models import User
 from django.contrib.sessions.models import Session
 # from cinetpay_sdk.s_d_k import Cinetpay
 from shop import models as Produit
+from shop.models import en_promotion, prix_effectif
 from django.utils.timezone import now
 from datetime import timedelta
 from cities_light.models import City
+from .coupons import normaliser
+from .prix import calculer_prix
 
 
 # Create your models here.
@@ -59,11 +62,24 @@ class CodePromotionnel(models.Model):
 
         verbose_name = 'Code promotionnel'
         verbose_name_plural = 'Codes Promotionnels'
+        # Les codes sont enregistrés normalisés : l'unicité vaut sans tenir compte de la casse.
+        constraints = [
+            models.UniqueConstraint(fields=['code_promo'], name='code_promo_unique'),
+        ]
 
     def __str__(self):
         """Unicode representation of CodePromotionnel."""
         return self.libelle
 
+    def clean(self):
+        # Avant la validation des contraintes : `summer` est alors refusé
+        # comme doublon de `SUMMER` au lieu d'échouer à l'enregistrement.
+        self.code_promo = normaliser(self.code_promo)
+
+    def save(self, *args, **kwargs):
+        self.code_promo = normaliser(self.code_promo)
+        super(CodePromotionnel, self).save(*args, **kwargs)
+
 
 class Panier(models.Model):
     """Model definition for Panier."""
@@ -85,28 +101,33 @@ class Panier(models.Model):
         """Unicode representation of Panier."""
         return "panier"
 
+    @property
+    def lignes(self):
+        """Lignes du panier avec leur produit et leur prix effectif, en une requête."""
+        return self.produit_panier.with_effective_price()
+
+    @property
+    def prix(self):
+        """Sous-total, réduction et total (customer.prix), calculés une fois par instance."""
+        if '_prix' not in self.__dict__:
+            self._prix = calculer_prix(self)
+        return self._prix
+
+    def invalider_prix(self):
+        """À appeler après avoir modifié les lignes ou le coupon de ce panier."""
+        self.__dict__.pop('_prix', None)
+
     @property
     def total(self):
-        panier = Panier.objects.get(id=self.id)
-        sum = 0
-        for i in panier.produit_panier.all():
-            sum = sum + i.total
-        return int(sum)
+        return self.prix['sous_total']
 
     @property
     def total_with_coupon(self):
-        reduction = 0
-        if self.coupon:
-            reduction = self.coupon.reduction * self.total
-        return int(self.total - reduction)
+        return self.prix['total']
 
     @property
     def check_empty(self):
-        panier = Panier.objects.get(id=self.id)
-        if panier.produit_panier.count() > 0:
-            return True
-        else:
-            return False
+        return self.prix['lignes'] > 0
 
 
 class Commande(models.Model):
@@ -145,6 +166,16 @@ class Commande(models.Model):
             return False
 
 
+class ProduitPanierQuerySet(models.QuerySet):
+
+    def with_effective_price(self):
+        """Charge le produit et annote `en_promotion` et `prix_effectif` de la ligne."""
+        return self.select_related('produit').annotate(
+            en_promotion=en_promotion('produit__'),
+            prix_effectif=prix_effectif('produit__'),
+        )
+
+
 class ProduitPanier(models.Model):
     produit = models.ForeignKey('shop.Produit', related_name="commande", on_delete=models.CASCADE)
     panier = models.ForeignKey(Panier, related_name="produit_panier", on_delete=models.CASCADE, null=True)
@@ -154,6 +185,8 @@ class ProduitPanier(models.Model):
     date_update = models.DateTimeField(auto_now=True)
     status = models.BooleanField(default=True)
 
+    objects = ProduitPanierQuerySet.as_manager()
+
     class Meta:
         """Meta definition for UserRessource."""
 
@@ -162,11 +195,29 @@ class ProduitPanier(models.Model):
 
     @property
     def total(self):
-        if self.produit.check_promotion:
-            return self.produit.prix_promotionnel * self.quantite
-        else:
-            return self.produit.prix * self.quantite
-        
+        prix = getattr(self, 'prix_effectif', None)
+        if prix is None:
+            prix = self.produit.prix_de_vente
+        return prix * self.quantite
+
 
+class ReservationStock(models.Model):
+    """Quantité d'un produit retirée du stock pour un panier ou une commande.
 
+    Une réservation de panier expire (`expire`) et son stock est alors rendu
+    (customer.stock) ; une réservation confirmée par une commande n'expire plus.
+    """
 
+    produit = models.ForeignKey('shop.Produit', related_name="reservations", on_delete=models.CASCADE)
+    panier = models.ForeignKey(Panier, related_name="reservations", on_delete=models.SET_NULL, null=True)
+    commande = models.ForeignKey(Commande, related_name="reservations", on_delete=models.SET_NULL, null=True)
+    quantite = models.PositiveIntegerField()
+    expire = models.DateTimeField(null=True, db_index=True)
+    date_add = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Réservation de stock'
+        verbose_name_plural = 'Réservations de stock'
+
+    def __str__(self):
+        return "reservation"
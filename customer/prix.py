@@ -0,0 +1,53 @@
+from django.db.models import Count, Exists, F, Max, OuterRef, Sum
+
+from shop.models import prix_effectif
+from . import models
+from .coupons import coupon_valide
+
+
+def _resultat(sous_total, taux, articles, lignes, eligible=None):
+    if eligible is None:
+        eligible = sous_total
+    total = int(sous_total - taux * eligible)
+    sous_total = int(sous_total)
+    return {
+        'sous_total': sous_total,
+        'reduction': sous_total - total,
+        'total': total,
+        'articles': articles,
+        'lignes': lignes,
+    }
+
+
+def calculer_prix(panier):
+    """Sous-total, réduction et total d'un Panier, en une seule requête agrégée.
+
+    Le prix de chaque ligne est le prix effectif du produit (promotion en
+    cours comprise), calculé par la base ; le taux du coupon est lu dans la
+    même requête, s'il est encore valide. Un coupon limité à un forfait ne
+    réduit que les lignes de ses produits : l'éligibilité de chaque ligne est
+    décidée par la base, dans cette même requête.
+    """
+    forfait = models.CodePromotionnel.forfait.through.objects.filter(
+        codepromotionnel_id=OuterRef('panier__coupon_id'),
+    )
+    montant = F('quantite') * prix_effectif('produit__')
+    valeurs = models.ProduitPanier.objects.filter(panier=panier).aggregate(
+        sous_total=Sum(montant),
+        eligible=Sum(montant, filter=~Exists(forfait) | Exists(forfait.filter(produit_id=OuterRef('produit_id')))),
+        taux=Max('panier__coupon__reduction', filter=coupon_valide('panier__coupon__')),
+        articles=Sum('quantite'),
+        lignes=Count('id'),
+    )
+    return _resultat(
+        valeurs['sous_total'] or 0, valeurs['taux'] or 0, valeurs['articles'] or 0, valeurs['lignes'],
+        valeurs['eligible'] or 0,
+    )
+
+
+def calculer_prix_lignes(lignes, taux=0):
+    """Même résultat que calculer_prix() pour des lignes déjà annotées (panier cookie)."""
+    return _resultat(
+        sum(ligne.total for ligne in lignes), taux,
+        sum(ligne.quantite for ligne in lignes), len(lignes),
+    )
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from base.cache import bump_version
+from .coupons import COUPONS_CACHE
+from .models import CodePromotionnel
+
+
+@receiver([post_save, post_delete], sender=CodePromotionnel)
+def invalider_coupons(sender, **kwargs):
+    bump_version(COUPONS_CACHE)
@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from shop import models as shop_models
+from . import models
+
+
+class StockInsuffisant(Exception):
+    """Levée par reserver() ; `erreurs` décrit chaque ligne qui n'a pas pu être servie."""
+
+    def __init__(self, erreurs):
+        super().__init__(erreurs)
+        self.erreurs = erreurs
+
+
+class _Annuler(Exception):
+    pass
+
+
+def _rendre(reservations):
+    # Chaque réservation n'est rendue qu'une fois : le DELETE conditionnel
+    # départage un balayage et un nouveau passage en caisse simultanés.
+    rendues = 0
+    for reservation in reservations:
+        with transaction.atomic():
+            if models.ReservationStock.objects.filter(id=reservation.id, commande=None).delete()[0]:
+                shop_models.Produit.objects.filter(id=reservation.produit_id).update(
+                    quantite=F('quantite') + reservation.quantite,
+                )
+                rendues += 1
+    return rendues
+
+
+def _erreurs(manquants, demandes):
+    produits = shop_models.Produit.objects.filter(id__in=manquants).values('id', 'nom', 'quantite', 'status')
+    return [
+        {
+            'produit': produit['id'],
+            'nom': produit['nom'],
+            'demande': demandes[produit['id']],
+            'disponible': max(produit['quantite'] or 0, 0) if produit['status'] else 0,
+        }
+        for produit in sorted(produits, key=lambda produit: produit['id'])
+    ]
+
+
+def _demandes(panier):
+    demandes = {}
+    for produit, quantite in panier.produit_panier.values_list('produit_id', 'quantite'):
+        demandes[produit] = demandes.get(produit, 0) + quantite
+    return demandes
+
+
+def reserver(panier, duree=None):
+    """Retire du stock les quantités du panier, tout ou rien, jusqu'à expiration.
+
+    Chaque ligne est un UPDATE conditionnel (quantite >= demandée) : la base
+    arbitre seule entre des centaines d'acheteurs simultanés d'un même deal,
+    sans SELECT préalable ni verrou applicatif. Les produits sont pris par id
+    croissant, pour que deux paniers ne s'interbloquent jamais. Les
+    réservations encore ouvertes du panier sont rendues dans la même
+    transaction. Un produit sans quantité (NULL) n'est pas limité.
+    Lève StockInsuffisant, avec une erreur par ligne, si une ligne manque.
+    """
+    if duree is None:
+        duree = settings.STOCK_RESERVATION_DUREE
+    demandes = _demandes(panier)
+
+    manquants = []
+    try:
+        with transaction.atomic():
+            _rendre(panier.reservations.filter(commande=None))
+            for produit, quantite in sorted(demandes.items()):
+                servi = shop_models.Produit.objects.filter(
+                    Q(quantite__isnull=True) | Q(quantite__gte=quantite), id=produit, status=True,
+                ).update(quantite=F('quantite') - quantite)
+                if not servi:
+                    manquants.append(produit)
+            if manquants:
+                raise _Annuler
+            expire = now() + timedelta(seconds=duree)
+            models.ReservationStock.objects.bulk_create([
+                models.ReservationStock(produit_id=produit, panier=panier, quantite=quantite, expire=expire)
+                for produit, quantite in demandes.items()
+            ])
+    except _Annuler:
+        raise StockInsuffisant(_erreurs(manquants, demandes))
+
+
+def confirmer(panier, commande):
+    """Rattache à `commande` la réservation prise au lancement du paiement : elle n'expire plus.
+
+    Les réservations encore valides sont d'abord soustraites au balayage
+    (expire vidé par un UPDATE conditionnel, sans course avec
+    liberer_expirees). Si elles ne couvrent plus exactement le panier
+    (expirées, absentes ou panier modifié depuis), le panier est réservé de
+    nouveau. À appeler dans la transaction qui crée la commande ; lève
+    StockInsuffisant si le stock manque.
+    """
+    panier.reservations.filter(commande=None, expire__gt=now()).update(expire=None)
+    tenues = dict(panier.reservations.filter(commande=None, expire=None).values_list('produit_id', 'quantite'))
+    if tenues != _demandes(panier):
+        reserver(panier)
+        panier.reservations.filter(commande=None).update(expire=None)
+    return panier.reservations.filter(commande=None, expire=None).update(commande=commande, panier=None)
+
+
+def liberer_expirees():
+    """Rend au stock les réservations de panier expirées. Retourne leur nombre."""
+    return _rendre(models.ReservationStock.objects.filter(commande=None, expire__lte=now()).iterator())
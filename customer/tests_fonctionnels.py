@@ -276,6 +276,24 @@ class TestCodePromotionnel(BaseCustomerTestCase):
         self.panier.refresh_from_db()
         self.assertEqual(self.panier.coupon, self.code)
 
+    def test_code_sur_panier_anonyme(self):
+        self.client.logout()
+
+        response = self.client.post(
+            reverse("add_coupon"),
+            data=json.dumps({
+                "panier": "",
+                "coupon": "PROMO10"
+            }),
+            content_type="application/json"
+        )
+
+        self.assertFalse(response.json()["success"])
+        self.assertEqual(
+            response.json()["message"],
+            "Connectez-vous pour utiliser un code coupon"
+        )
+
 
 # =====================================================
 # DÉCONNEXION
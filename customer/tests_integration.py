@@ -1,17 +1,22 @@
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.forms import modelform_factory
 from customer.models import (
     Customer, Panier, ProduitPanier,
-    CodePromotionnel, PasswordResetToken
+    CodePromotionnel, PasswordResetToken, Commande
 )
-from shop.models import Produit, CategorieProduit, Etablissement, CategorieEtablissement
+from customer.coupons import CouponInvalide, utiliser
+from shop.models import Produit, CategorieProduit, Etablissement, CategorieEtablissement, CoAchat
 from cities_light.models import City, Country
 from django.core.files.uploadedfile import SimpleUploadedFile
 from PIL import Image
 import json
 import io
 from datetime import datetime, timedelta
+from unittest import mock
 
 
 class BaseIntegrationTestCase(TestCase):
@@ -224,3 +229,211 @@ class TestCoherenceRelations(BaseIntegrationTestCase):
 
         self.assertFalse(Customer.objects.filter(id=customer.id).exists())
         self.assertFalse(Panier.objects.filter(id=panier.id).exists())
+
+
+# =====================================================
+# COMMANDE → DEALS ASSOCIÉS
+# =====================================================
+
+class TestIntegrationCommandeDealsAssocies(BaseIntegrationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cat_etab = CategorieEtablissement.objects.create(nom="T", status=True)
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123", last_name="V"
+        )
+        etab = Etablissement.objects.create(
+            nom="T", ville=self.ville, nom_du_responsable="V",
+            prenoms_duresponsable="V", categorie=cat_etab, user=vendeur,
+            status=True
+        )
+        cat_prod = CategorieProduit.objects.create(nom="T", status=True)
+        self.produits = [
+            Produit.objects.create(
+                nom=f"P{i}", prix=1000, quantite=5,
+                categorie=cat_prod, etablissement=etab, status=True
+            )
+            for i in range(2)
+        ]
+
+        user = User.objects.create_user(username="client", password="Pass123")
+        customer = Customer.objects.create(
+            user=user, adresse="T", contact_1="0708", ville=self.ville
+        )
+        self.client.login(username="client", password="Pass123")
+        self.panier = Panier.objects.create(
+            session_id_id=self.client.session.session_key, customer=customer
+        )
+        ProduitPanier.objects.bulk_create([
+            ProduitPanier(panier=self.panier, produit=produit, quantite=1)
+            for produit in self.produits
+        ])
+
+    def _payer(self):
+        return self.client.post(
+            reverse("paiement_detail"),
+            data=json.dumps({
+                "transaction_id": "T1", "notify_url": "n", "return_url": "r",
+                "panier": self.panier.id,
+            }),
+            content_type="application/json"
+        )
+
+    def test_co_achats_comptes_apres_la_commande(self):
+        with self.captureOnCommitCallbacks(execute=True) as rappels:
+            response = self._payer()
+
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(len(rappels), 1)
+        self.assertEqual(CoAchat.objects.count(), 2)
+        self.assertFalse(Panier.objects.filter(id=self.panier.id).exists())
+
+    def test_erreur_des_deals_associes_sans_effet_sur_la_commande(self):
+        with mock.patch("shop.views.enregistrer_commande", side_effect=RuntimeError), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self._payer()
+
+        self.assertTrue(response.json()["success"])
+        self.assertTrue(Commande.objects.exists())
+        self.assertFalse(Panier.objects.filter(id=self.panier.id).exists())
+
+
+# =====================================================
+# MOTEUR DE COUPONS
+# =====================================================
+
+class TestIntegrationMoteurCoupons(BaseIntegrationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        cat_etab = CategorieEtablissement.objects.create(nom="T", status=True)
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123", last_name="V"
+        )
+        etab = Etablissement.objects.create(
+            nom="T", ville=self.ville, nom_du_responsable="V",
+            prenoms_duresponsable="V", categorie=cat_etab, user=vendeur,
+            status=True
+        )
+        cat_prod = CategorieProduit.objects.create(nom="T", status=True)
+        self.a = Produit.objects.create(
+            nom="A", prix=1000, quantite=10,
+            categorie=cat_prod, etablissement=etab, status=True
+        )
+        self.b = Produit.objects.create(
+            nom="B", prix=2000, quantite=10,
+            categorie=cat_prod, etablissement=etab, status=True
+        )
+
+        self.coupon = CodePromotionnel.objects.create(
+            libelle="Dix", etat=True,
+            date_fin=datetime.now().date() + timedelta(days=5),
+            reduction=0.1, nombre_u=2, code_promo=" promo 10 "
+        )
+
+        self.user = User.objects.create_user(username="client", password="Pass123")
+        customer = Customer.objects.create(
+            user=self.user, adresse="T", contact_1="0708", ville=self.ville
+        )
+        self.client.login(username="client", password="Pass123")
+        self.panier = Panier.objects.create(
+            session_id_id=self.client.session.session_key, customer=customer
+        )
+        ProduitPanier.objects.bulk_create([
+            ProduitPanier(panier=self.panier, produit=self.a, quantite=2),
+            ProduitPanier(panier=self.panier, produit=self.b, quantite=1),
+        ])
+
+    def _appliquer(self, code):
+        return self.client.post(
+            reverse("add_coupon"),
+            data=json.dumps({"panier": self.panier.id, "coupon": code}),
+            content_type="application/json"
+        )
+
+    def _total(self):
+        return Panier.objects.get(id=self.panier.id).total_with_coupon
+
+    def test_code_normalise_et_unique(self):
+        self.assertEqual(self.coupon.code_promo, "PROMO10")
+
+        with self.assertRaises(IntegrityError):
+            CodePromotionnel.objects.create(
+                libelle="Doublon", etat=True, date_fin=datetime.now().date(),
+                reduction=0.5, code_promo="Promo10"
+            )
+
+    def test_doublon_refuse_par_le_formulaire(self):
+        Formulaire = modelform_factory(
+            CodePromotionnel, fields=["libelle", "etat", "date_fin", "reduction", "code_promo"]
+        )
+        formulaire = Formulaire(data={
+            "libelle": "Doublon", "etat": True, "reduction": 0.5,
+            "date_fin": datetime.now().date(), "code_promo": "promo 10",
+        })
+
+        self.assertFalse(formulaire.is_valid())
+        self.assertIn("code_promo", formulaire.errors)
+        self.assertEqual(CodePromotionnel.objects.count(), 1)
+
+    def test_application_insensible_a_la_casse(self):
+        response = self._appliquer("promo10")
+
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(self._total(), 3600)
+
+    def test_coupons_inutilisables_refuses(self):
+        CodePromotionnel.objects.bulk_create([
+            CodePromotionnel(
+                libelle="Expiré", etat=True, reduction=0.5, code_promo="EXPIRE",
+                date_fin=datetime.now().date() - timedelta(days=1)
+            ),
+            CodePromotionnel(
+                libelle="Épuisé", etat=True, reduction=0.5, code_promo="EPUISE",
+                date_fin=datetime.now().date(), nombre_u=0
+            ),
+            CodePromotionnel(
+                libelle="Inactif", etat=False, reduction=0.5, code_promo="INACTIF",
+                date_fin=datetime.now().date()
+            ),
+        ])
+
+        for code in ("EXPIRE", "EPUISE", "INACTIF", "INCONNU"):
+            self.assertFalse(self._appliquer(code).json()["success"])
+
+    def test_coupon_expire_ne_reduit_plus(self):
+        Panier.objects.filter(id=self.panier.id).update(coupon=self.coupon)
+        self.assertEqual(self._total(), 3600)
+
+        CodePromotionnel.objects.filter(id=self.coupon.id).update(
+            date_fin=datetime.now().date() - timedelta(days=1)
+        )
+
+        self.assertEqual(self._total(), 4000)
+
+    def test_utilisations_decomptees_atomiquement(self):
+        utiliser(self.coupon.id)
+        utiliser(self.coupon.id)
+
+        self.assertRaises(CouponInvalide, utiliser, self.coupon.id)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.nombre_u, 0)
+
+    def test_commande_consomme_le_coupon(self):
+        Panier.objects.filter(id=self.panier.id).update(coupon=self.coupon)
+
+        response = self.client.post(
+            reverse("paiement_detail"),
+            data=json.dumps({
+                "transaction_id": "T1", "notify_url": "n", "return_url": "r",
+                "panier": self.panier.id,
+            }),
+            content_type="application/json"
+        )
+
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(Commande.objects.get().prix_total, 3600)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.nombre_u, 1)
@@ -1,9 +1,17 @@
 from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.core.cache import cache
 from django.db import connection
 from django.test.utils import CaptureQueriesContext
-from customer.models import Customer, Panier, ProduitPanier, CodePromotionnel
+from django.test import RequestFactory
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.conf import settings
+from customer.utils import get_cart_summary
+from customer.coupons import CouponInvalide, trouver
+from customer.stock import liberer_expirees, reserver
+from customer.models import Customer, Panier, ProduitPanier, CodePromotionnel, Commande, ReservationStock
 from shop.models import Produit, CategorieProduit, Etablissement, CategorieEtablissement
 from cities_light.models import City, Country
 import json
@@ -169,3 +177,646 @@ class TestPerformanceVolume(BasePerformanceTestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertLessEqual(len(ctx), 10)
+
+
+# =====================================================
+# PANIER PARESSEUX — VISITEUR ANONYME
+# =====================================================
+
+@override_settings(DEBUG=True)
+class TestPerformancePanierParesseux(BasePerformanceTestCase):
+
+    def test_visiteur_anonyme_sans_ecriture(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("shop"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Panier.objects.exists())
+        self.assertFalse(
+            any(q["sql"].startswith("INSERT") for q in ctx.captured_queries)
+        )
+
+    def _ajouter_au_panier(self, nombre=1):
+        cat_etab = CategorieEtablissement.objects.create(nom="T", status=True)
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123", last_name="V"
+        )
+        etab = Etablissement.objects.create(
+            nom="T", ville=self.ville, nom_du_responsable="V",
+            prenoms_duresponsable="V", categorie=cat_etab, user=vendeur,
+            status=True
+        )
+        cat_prod = CategorieProduit.objects.create(nom="T", status=True)
+
+        for i in range(nombre):
+            produit = Produit.objects.create(
+                nom=f"P{i}", prix=1000, quantite=10,
+                categorie=cat_prod, etablissement=etab, status=True
+            )
+            response = self.client.post(
+                reverse("add_to_cart"),
+                data=json.dumps({
+                    "panier": "",
+                    "produit": produit.id,
+                    "quantite": 2
+                }),
+                content_type="application/json"
+            )
+        return response
+
+    def test_ajout_anonyme_sans_ecriture_en_base(self):
+        response = self._ajouter_au_panier()
+
+        self.assertTrue(response.json()["success"])
+        self.assertIn(settings.CART_COOKIE_NAME, response.cookies)
+        self.assertFalse(Panier.objects.exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_panier_cookie_enregistre_a_la_connexion(self):
+        self._ajouter_au_panier()
+        user = User.objects.create_user(username="client", password="Pass123")
+        Customer.objects.create(
+            user=user, adresse="T", contact_1="0708", ville=self.ville
+        )
+
+        response = self.client.post(
+            reverse("post"),
+            data=json.dumps({"username": "client", "password": "Pass123"}),
+            content_type="application/json"
+        )
+
+        self.assertTrue(response.json()["success"])
+        panier = Panier.objects.get(customer__user=user)
+        self.assertEqual(panier.produit_panier.get().quantite, 2)
+        self.assertEqual(response.cookies[settings.CART_COOKIE_NAME].value, "")
+
+    def test_resume_mini_panier_une_requete(self):
+        self._ajouter_au_panier(nombre=20)
+
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        request.COOKIES = {
+            k: v.value for k, v in self.client.cookies.items()
+        }
+
+        with self.assertNumQueries(1):
+            resume = get_cart_summary(request)
+            noms = [ligne.produit.nom for ligne in resume["lignes"]]
+
+        self.assertEqual(resume["count"], 20)
+        self.assertEqual(len(noms), 20)
+
+    def test_total_panier_en_une_requete(self):
+        self._ajouter_au_panier(nombre=10)
+        user = User.objects.create_user(username="client", password="Pass123")
+        Customer.objects.create(
+            user=user, adresse="T", contact_1="0708", ville=self.ville
+        )
+        self.client.post(
+            reverse("post"),
+            data=json.dumps({"username": "client", "password": "Pass123"}),
+            content_type="application/json"
+        )
+        panier = Panier.objects.get(customer__user=user)
+
+        with self.assertNumQueries(1):
+            total = panier.total
+
+        self.assertEqual(total, 10 * 2 * 1000)
+
+
+# =====================================================
+# FUSION DU PANIER À LA CONNEXION
+# =====================================================
+
+class TestPerformanceFusionPanier(BasePerformanceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cat_etab = CategorieEtablissement.objects.create(nom="T", status=True)
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123", last_name="V"
+        )
+        etab = Etablissement.objects.create(
+            nom="T", ville=self.ville, nom_du_responsable="V",
+            prenoms_duresponsable="V", categorie=cat_etab, user=vendeur,
+            status=True
+        )
+        self.cat_prod = CategorieProduit.objects.create(nom="T", status=True)
+        self.etab = etab
+
+        user = User.objects.create_user(username="client", password="Pass123")
+        Customer.objects.create(
+            user=user, adresse="T", contact_1="0708", ville=self.ville
+        )
+        self.user = user
+
+    def _preparer_panier_anonyme(self, nombre):
+        produits = [
+            Produit.objects.create(
+                nom=f"P{i}", prix=1000, quantite=10,
+                categorie=self.cat_prod, etablissement=self.etab, status=True
+            )
+            for i in range(nombre)
+        ]
+
+        # Panier cookie : 2 exemplaires du premier produit
+        self.client.post(
+            reverse("add_to_cart"),
+            data=json.dumps({
+                "panier": "", "produit": produits[0].id, "quantite": 2
+            }),
+            content_type="application/json"
+        )
+
+        # Ancien Panier anonyme rattaché à la session
+        session = self.client.session
+        session.save()
+        ancien = Panier.objects.create(session_id_id=session.session_key)
+        ProduitPanier.objects.bulk_create([
+            ProduitPanier(panier=ancien, produit=produit, quantite=3)
+            for produit in produits
+        ])
+        return produits, ancien
+
+    def _connexion(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                reverse("post"),
+                data=json.dumps({"username": "client", "password": "Pass123"}),
+                content_type="application/json"
+            )
+        self.assertTrue(response.json()["success"])
+        return len(ctx.captured_queries)
+
+    def test_quantites_additionnees_et_ancien_panier_supprime(self):
+        produits, ancien = self._preparer_panier_anonyme(3)
+
+        self._connexion()
+
+        panier = Panier.objects.get(customer__user=self.user)
+        quantites = dict(
+            panier.produit_panier.values_list("produit_id", "quantite")
+        )
+        self.assertEqual(quantites[produits[0].id], 5)
+        self.assertEqual(quantites[produits[1].id], 3)
+        self.assertEqual(len(quantites), 3)
+        self.assertFalse(Panier.objects.filter(id=ancien.id).exists())
+        self.assertEqual(ProduitPanier.objects.count(), 3)
+
+    def test_fusion_requetes_independantes_du_nombre_de_lignes(self):
+        self._preparer_panier_anonyme(2)
+        petit = self._connexion()
+
+        self.client.logout()
+        Panier.objects.all().delete()
+        Produit.objects.all().delete()
+        self._preparer_panier_anonyme(20)
+        grand = self._connexion()
+
+        self.assertEqual(petit, grand)
+
+
+# =====================================================
+# MOTEUR DE PRIX DU PANIER
+# =====================================================
+
+class TestPerformanceMoteurPrix(BasePerformanceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cat_etab = CategorieEtablissement.objects.create(nom="T", status=True)
+        vendeur = User.objects.create_user(username="vendeur", password="Pass123")
+        etab = Etablissement.objects.create(
+            nom="T", ville=self.ville, nom_du_responsable="V",
+            prenoms_duresponsable="V", categorie=cat_etab, user=vendeur,
+            status=True
+        )
+        cat_prod = CategorieProduit.objects.create(nom="T", status=True)
+        aujourdhui = datetime.now().date()
+        self.normal = Produit.objects.create(
+            nom="Normal", prix=1000, quantite=10,
+            categorie=cat_prod, etablissement=etab, status=True
+        )
+        self.promo = Produit.objects.create(
+            nom="Promo", prix=3000, prix_promotionnel=2000, quantite=10,
+            date_debut_promo=aujourdhui - timedelta(days=1),
+            date_fin_promo=aujourdhui + timedelta(days=1),
+            categorie=cat_prod, etablissement=etab, status=True
+        )
+
+        self.user = User.objects.create_user(username="client", password="Pass123")
+        customer = Customer.objects.create(
+            user=self.user, adresse="T", contact_1="0708", ville=self.ville
+        )
+        coupon = CodePromotionnel.objects.create(
+            libelle="Dix", etat=True, date_fin=aujourdhui, reduction=0.1,
+            code_promo="DIX"
+        )
+        self.client.login(username="client", password="Pass123")
+        session = self.client.session
+        session.save()
+        self.panier = Panier.objects.create(
+            session_id_id=session.session_key, customer=customer, coupon=coupon
+        )
+        ProduitPanier.objects.bulk_create([
+            ProduitPanier(panier=self.panier, produit=self.normal, quantite=3),
+            ProduitPanier(panier=self.panier, produit=self.promo, quantite=2),
+        ])
+
+    def test_totaux_en_une_requete(self):
+        panier = Panier.objects.get(id=self.panier.id)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(panier.total, 3 * 1000 + 2 * 2000)
+            self.assertEqual(panier.total_with_coupon, 6300)
+            self.assertEqual(panier.prix["reduction"], 700)
+            self.assertTrue(panier.check_empty)
+
+    def test_invalidation_apres_modification(self):
+        self.assertEqual(self.panier.total, 7000)
+
+        ProduitPanier.objects.filter(panier=self.panier, produit=self.normal).update(quantite=1)
+        self.panier.invalider_prix()
+
+        self.assertEqual(self.panier.total, 5000)
+
+    def test_panier_vide(self):
+        ProduitPanier.objects.filter(panier=self.panier).delete()
+        panier = Panier.objects.get(id=self.panier.id)
+
+        self.assertEqual(panier.prix["total"], 0)
+        self.assertFalse(panier.check_empty)
+
+    def test_page_panier_un_seul_calcul(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("cart"))
+
+        self.assertContains(response, "6300 F CFA")
+        agregats = [q for q in ctx.captured_queries if "SUM(" in q["sql"]]
+        self.assertEqual(len(agregats), 1)
+
+    def test_prix_de_la_commande(self):
+        response = self.client.post(
+            reverse("paiement_detail"),
+            data=json.dumps({
+                "transaction_id": "T1", "notify_url": "n", "return_url": "r",
+                "panier": self.panier.id,
+            }),
+            content_type="application/json"
+        )
+
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(self.user.customer.user_commande.get().prix_total, 6300)
+
+
+# =====================================================
+# MODIFICATION GROUPÉE DU PANIER
+# =====================================================
+
+class TestPerformancePanierGroupe(BasePerformanceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cat_etab = CategorieEtablissement.objects.create(nom="T", status=True)
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123", last_name="V"
+        )
+        etab = Etablissement.objects.create(
+            nom="T", ville=self.ville, nom_du_responsable="V",
+            prenoms_duresponsable="V", categorie=cat_etab, user=vendeur,
+            status=True
+        )
+        cat_prod = CategorieProduit.objects.create(nom="T", status=True)
+        self.produits = Produit.objects.bulk_create([
+            Produit(
+                nom=f"P{i}", prix=1000, quantite=10,
+                categorie=cat_prod, etablissement=etab, status=True
+            )
+            for i in range(20)
+        ])
+
+        user = User.objects.create_user(username="client", password="Pass123")
+        Customer.objects.create(
+            user=user, adresse="T", contact_1="0708", ville=self.ville
+        )
+
+    def _modifier(self, operations):
+        return self.client.post(
+            reverse("batch_cart"),
+            data=json.dumps({"operations": operations}),
+            content_type="application/json"
+        )
+
+    def _operations(self, nombre, op="set", quantite=3):
+        return [
+            {"op": op, "produit": produit.id, "quantite": quantite}
+            for produit in self.produits[:nombre]
+        ]
+
+    def test_nombre_de_requetes_constant(self):
+        self.client.login(username="client", password="Pass123")
+        self._modifier(self._operations(20, "add", 1))
+
+        with CaptureQueriesContext(connection) as peu:
+            self._modifier(self._operations(2))
+        with CaptureQueriesContext(connection) as beaucoup:
+            response = self._modifier(self._operations(20))
+
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(len(beaucoup), len(peu))
+        self.assertEqual(
+            set(ProduitPanier.objects.values_list("quantite", flat=True)), {3}
+        )
+
+    def test_ajout_modification_suppression(self):
+        self.client.login(username="client", password="Pass123")
+        a, b, c = self.produits[:3]
+
+        response = self._modifier([
+            {"op": "add", "produit": a.id, "quantite": 1},
+            {"op": "add", "produit": a.id, "quantite": 2},
+            {"op": "set", "produit": b.id, "quantite": 4},
+            {"op": "add", "produit": c.id, "quantite": 1},
+            {"op": "remove", "produit": c.id},
+        ])
+
+        resume = response.json()["panier"]
+        self.assertEqual(resume["quantites"], {str(a.id): 3, str(b.id): 4})
+        self.assertEqual(resume["articles"], 7)
+        self.assertEqual(resume["total"], 7000)
+        self.assertEqual(Panier.objects.count(), 1)
+
+        response = self._modifier([{"op": "set", "produit": b.id, "quantite": 0}])
+
+        self.assertEqual(response.json()["panier"]["quantites"], {str(a.id): 3})
+
+    def test_tout_ou_rien(self):
+        self.client.login(username="client", password="Pass123")
+        self._modifier(self._operations(2, "add", 1))
+        inactif = self.produits[5]
+        Produit.objects.filter(id=inactif.id).update(status=False)
+
+        response = self._modifier([
+            {"op": "set", "produit": self.produits[0].id, "quantite": 5},
+            {"op": "add", "produit": inactif.id, "quantite": 1},
+        ])
+
+        self.assertFalse(response.json()["success"])
+        self.assertEqual(
+            set(ProduitPanier.objects.values_list("quantite", flat=True)), {1}
+        )
+
+    def test_operation_invalide_refusee(self):
+        self.client.login(username="client", password="Pass123")
+
+        for operations in ([], [{"op": "add", "produit": self.produits[0].id, "quantite": -1}],
+                           [{"op": "vider"}], ["x"]):
+            response = self._modifier(operations)
+            self.assertFalse(response.json()["success"])
+        self.assertFalse(Panier.objects.exists())
+
+    def test_panier_cookie_anonyme(self):
+        a, b = self.produits[:2]
+
+        response = self._modifier([
+            {"op": "add", "produit": a.id, "quantite": 2},
+            {"op": "set", "produit": b.id, "quantite": 1},
+        ])
+
+        self.assertEqual(response.json()["panier"]["total"], 3000)
+        self.assertIn(settings.CART_COOKIE_NAME, response.cookies)
+        self.assertFalse(Panier.objects.exists())
+
+        response = self._modifier([{"op": "remove", "produit": a.id}])
+
+        self.assertEqual(response.json()["panier"]["quantites"], {str(b.id): 1})
+        self.assertIn(settings.CART_COOKIE_NAME, response.cookies)
+
+    def test_compte_marchand_sans_panier(self):
+        self.client.login(username="vendeur", password="Pass123")
+
+        response = self._modifier(self._operations(1, "add", 1))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()["success"])
+        self.assertFalse(Panier.objects.exists())
+
+
+# =====================================================
+# RÉSERVATION DU STOCK
+# =====================================================
+
+class TestPerformanceReservationStock(BasePerformanceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cat_etab = CategorieEtablissement.objects.create(nom="T", status=True)
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123", last_name="V"
+        )
+        etab = Etablissement.objects.create(
+            nom="T", ville=self.ville, nom_du_responsable="V",
+            prenoms_duresponsable="V", categorie=cat_etab, user=vendeur,
+            status=True
+        )
+        cat_prod = CategorieProduit.objects.create(nom="T", status=True)
+        self.deal = Produit.objects.create(
+            nom="Super deal", prix=1000, quantite=3,
+            categorie=cat_prod, etablissement=etab, status=True
+        )
+        self.illimite = Produit.objects.create(
+            nom="Illimité", prix=500, quantite=None,
+            categorie=cat_prod, etablissement=etab, status=True
+        )
+
+        self.user = User.objects.create_user(username="client", password="Pass123")
+        self.customer = Customer.objects.create(
+            user=self.user, adresse="T", contact_1="0708", ville=self.ville
+        )
+        self.client.login(username="client", password="Pass123")
+        self.panier = self._panier(self.client.session.session_key, deal=2)
+
+    def _panier(self, session_key, deal):
+        if session_key is None:
+            autre = Client()
+            autre.get(reverse("login"))
+            autre.session.save()
+            session_key = autre.session.session_key
+        panier = Panier.objects.create(session_id_id=session_key, customer=self.customer)
+        ProduitPanier.objects.bulk_create([
+            ProduitPanier(panier=panier, produit=self.deal, quantite=deal),
+            ProduitPanier(panier=panier, produit=self.illimite, quantite=5),
+        ])
+        return panier
+
+    def _stock(self):
+        return Produit.objects.get(id=self.deal.id).quantite
+
+    def _payer(self):
+        return self.client.post(
+            reverse("paiement_detail"),
+            data=json.dumps({
+                "transaction_id": "T1", "notify_url": "n", "return_url": "r",
+                "panier": self.panier.id,
+            }),
+            content_type="application/json"
+        )
+
+    def test_commande_decremente_le_stock(self):
+        response = self._payer()
+
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(self._stock(), 1)
+        self.assertIsNone(Produit.objects.get(id=self.illimite.id).quantite)
+        commande = Commande.objects.get()
+        self.assertEqual(commande.reservations.count(), 2)
+        self.assertFalse(commande.reservations.exclude(expire=None).exists())
+
+    def test_reservation_au_lancement_du_paiement(self):
+        response = self.client.post(
+            reverse("reserver_paiement"),
+            data=json.dumps({"panier": self.panier.id}),
+            content_type="application/json"
+        )
+
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(self._stock(), 1)
+        self.assertFalse(ReservationStock.objects.filter(expire=None).exists())
+
+        self.assertTrue(self._payer().json()["success"])
+        self.assertEqual(self._stock(), 1)
+        self.assertEqual(Commande.objects.get().reservations.count(), 2)
+        self.assertEqual(liberer_expirees(), 0)
+
+    def test_reservation_expiree_reprise_au_paiement(self):
+        reserver(self.panier, duree=0)
+
+        self.assertTrue(self._payer().json()["success"])
+        self.assertEqual(self._stock(), 1)
+        self.assertEqual(ReservationStock.objects.count(), 2)
+        self.assertEqual(liberer_expirees(), 0)
+
+    def test_pas_de_survente(self):
+        autre = self._panier(None, deal=2)
+        reserver(autre)
+
+        response = self._payer()
+
+        self.assertFalse(response.json()["success"])
+        self.assertEqual(response.json()["erreurs"], [{
+            "produit": self.deal.id, "nom": "Super deal",
+            "demande": 2, "disponible": 1,
+        }])
+        self.assertFalse(Commande.objects.exists())
+        self.assertEqual(self._stock(), 1)
+        self.assertFalse(ReservationStock.objects.filter(panier=self.panier).exists())
+
+    def test_nouvelle_reservation_rend_la_precedente(self):
+        reserver(self.panier)
+        reserver(self.panier)
+
+        self.assertEqual(self._stock(), 1)
+        self.assertEqual(ReservationStock.objects.count(), 2)
+
+    def test_reservations_expirees_rendues(self):
+        reserver(self.panier, duree=0)
+
+        self.assertEqual(liberer_expirees(), 2)
+        self.assertEqual(liberer_expirees(), 0)
+        self.assertEqual(self._stock(), 3)
+        self.assertFalse(ReservationStock.objects.exists())
+
+    def test_une_requete_par_ligne(self):
+        with CaptureQueriesContext(connection) as ctx:
+            reserver(self.panier)
+
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        selects = [q for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        self.assertEqual(len(updates), 2)
+        # Lignes du panier et réservations ouvertes : aucune lecture du stock
+        self.assertEqual(len(selects), 2)
+
+    def test_page_paiement_en_lecture_seule(self):
+        self.client.get(reverse("checkout"))  # caches du site et des catégories
+
+        with self.settings(QUERY_BUDGET_STRICT=True), CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx), settings.QUERY_BUDGETS["checkout"])
+        self.assertFalse(any(
+            q["sql"].startswith(("INSERT", "UPDATE", "DELETE")) for q in ctx.captured_queries
+        ))
+        self.assertEqual(self._stock(), 3)
+        self.assertFalse(ReservationStock.objects.exists())
+
+
+# =====================================================
+# MOTEUR DE COUPONS
+# =====================================================
+
+class TestPerformanceCoupons(BasePerformanceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        cat_etab = CategorieEtablissement.objects.create(nom="T", status=True)
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123", last_name="V"
+        )
+        etab = Etablissement.objects.create(
+            nom="T", ville=self.ville, nom_du_responsable="V",
+            prenoms_duresponsable="V", categorie=cat_etab, user=vendeur,
+            status=True
+        )
+        cat_prod = CategorieProduit.objects.create(nom="T", status=True)
+        self.a = Produit.objects.create(
+            nom="A", prix=1000, quantite=10,
+            categorie=cat_prod, etablissement=etab, status=True
+        )
+        self.b = Produit.objects.create(
+            nom="B", prix=2000, quantite=10,
+            categorie=cat_prod, etablissement=etab, status=True
+        )
+
+        self.coupon = CodePromotionnel.objects.create(
+            libelle="Dix", etat=True,
+            date_fin=datetime.now().date() + timedelta(days=5),
+            reduction=0.1, nombre_u=2, code_promo=" promo 10 "
+        )
+
+        self.user = User.objects.create_user(username="client", password="Pass123")
+        customer = Customer.objects.create(
+            user=self.user, adresse="T", contact_1="0708", ville=self.ville
+        )
+        self.client.login(username="client", password="Pass123")
+        self.panier = Panier.objects.create(
+            session_id_id=self.client.session.session_key, customer=customer
+        )
+        ProduitPanier.objects.bulk_create([
+            ProduitPanier(panier=self.panier, produit=self.a, quantite=2),
+            ProduitPanier(panier=self.panier, produit=self.b, quantite=1),
+        ])
+
+    def test_coupons_actifs_en_cache(self):
+        trouver("PROMO10")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(trouver("promo10"), self.coupon.id)
+
+        self.coupon.etat = False
+        self.coupon.save()
+
+        self.assertRaises(CouponInvalide, trouver, "PROMO10")
+
+    def test_reduction_limitee_au_forfait(self):
+        self.coupon.forfait.add(self.b)
+        Panier.objects.filter(id=self.panier.id).update(coupon=self.coupon)
+        panier = Panier.objects.get(id=self.panier.id)
+
+        with self.assertNumQueries(1):
+            prix = panier.prix
+
+        self.assertEqual(prix["sous_total"], 4000)
+        self.assertEqual(prix["reduction"], 200)
@@ -0,0 +1,331 @@
+from django.conf import settings
+from django.db import transaction
+
+from shop import models as shop_models
+from . import models
+from .prix import calculer_prix_lignes
+
+
+COOKIE_SALT = 'customer.panier'
+
+
+class _Lignes(list):
+    """Liste de lignes qui répond comme `panier.produit_panier` dans les templates."""
+
+    def all(self):
+        return self
+
+    def count(self):
+        return len(self)
+
+
+class PanierCookie:
+    """Panier d'un visiteur anonyme, stocké dans un cookie signé.
+
+    Il expose la même interface que `Panier` pour les templates ; ses lignes
+    sont des `ProduitPanier` non enregistrés.
+    """
+
+    id = ''
+    coupon = None
+
+    def __init__(self, lignes):
+        self.produit_panier = _Lignes(lignes)
+
+    @property
+    def lignes(self):
+        return self.produit_panier
+
+    @property
+    def prix(self):
+        return calculer_prix_lignes(self.produit_panier)
+
+    @property
+    def total(self):
+        return self.prix['sous_total']
+
+    @property
+    def total_with_coupon(self):
+        return self.prix['total']
+
+    @property
+    def check_empty(self):
+        return len(self.produit_panier) > 0
+
+
+def lire_panier_cookie(request):
+    """Lignes du cookie panier sous la forme {id produit: quantité}."""
+    valeur = request.get_signed_cookie(settings.CART_COOKIE_NAME, default='', salt=COOKIE_SALT)
+    lignes = {}
+    for element in valeur.split('|'):
+        try:
+            produit, quantite = element.split(':')
+            lignes[int(produit)] = int(quantite)
+        except ValueError:
+            continue
+    return lignes
+
+
+def ecrire_panier_cookie(response, lignes):
+    if not lignes:
+        response.delete_cookie(settings.CART_COOKIE_NAME)
+        return
+    valeur = '|'.join('%d:%d' % (produit, quantite) for produit, quantite in lignes.items())
+    response.set_signed_cookie(
+        settings.CART_COOKIE_NAME, valeur, salt=COOKIE_SALT,
+        max_age=settings.CART_COOKIE_AGE, httponly=True, samesite='Lax',
+    )
+
+
+def _construire_lignes_cookie(quantites):
+    lignes = []
+    if quantites:
+        produits = shop_models.Produit.objects.with_effective_price().filter(id__in=quantites, status=True)
+        for produit in produits:
+            ligne = models.ProduitPanier(produit=produit, quantite=quantites[produit.id])
+            ligne.en_promotion = produit.en_promotion
+            ligne.prix_effectif = produit.prix_effectif
+            lignes.append(ligne)
+    return lignes
+
+
+def _lignes_cookie(request):
+    # Mémorisé sur la requête : le panier et le mini-panier partagent la requête.
+    if not hasattr(request, '_lignes_panier_cookie'):
+        request._lignes_panier_cookie = _construire_lignes_cookie(lire_panier_cookie(request))
+    return request._lignes_panier_cookie
+
+
+def get_cart(request):
+    """Retourne le panier de la requête sans rien écrire en base.
+
+    Aucune session n'est créée et aucun Panier n'est enregistré : un visiteur
+    anonyme a au plus un panier cookie, et un client qui n'a jamais rien
+    ajouté n'a pas de panier (None). Le panier est mémorisé sur la requête,
+    avec ses prix : oublier_panier() après une modification.
+    """
+    if not hasattr(request, '_panier'):
+        request._panier = _lire_panier(request)
+    return request._panier
+
+
+def _lire_panier(request):
+    if not request.user.is_authenticated:
+        lignes = _lignes_cookie(request)
+        return PanierCookie(lignes) if lignes else None
+
+    session_key = request.session.session_key
+    if not session_key:
+        return None
+    return models.Panier.objects.filter(
+        session_id_id=session_key, customer__user=request.user,
+    ).first()
+
+
+def oublier_panier(request):
+    """Le panier de la requête a changé : il sera relu, prix compris, au prochain accès."""
+    for attribut in ('_panier', '_lignes_panier_cookie'):
+        if hasattr(request, attribut):
+            delattr(request, attribut)
+
+
+def get_cart_summary(request):
+    """Résumé du panier pour l'en-tête, en une seule requête jointe.
+
+    Les lignes sont lues directement avec leur produit, sans passer par le
+    Panier : l'en-tête coûte la même chose avec 1 ou 50 articles.
+    """
+    if not request.user.is_authenticated:
+        lignes = _lignes_cookie(request)
+        return {'count': len(lignes), 'lignes': lignes}
+
+    session_key = request.session.session_key
+    if not session_key:
+        return {'count': 0, 'lignes': []}
+
+    lignes = list(models.ProduitPanier.objects.filter(
+        panier__session_id_id=session_key, panier__customer__user=request.user,
+    ).with_effective_price())
+    return {'count': len(lignes), 'lignes': lignes}
+
+
+def get_or_create_cart(request):
+    """Retourne le Panier du client connecté en le créant au premier ajout."""
+    panier = get_cart(request)
+    if panier is not None:
+        return panier
+
+    if not request.session.exists(request.session.session_key):
+        request.session.create()
+
+    request._panier = models.Panier.objects.create(
+        session_id_id=request.session.session_key,
+        customer=models.Customer.objects.get(user=request.user),
+    )
+    return request._panier
+
+
+def panier_anonyme(request):
+    """Paniers et quantités du visiteur anonyme, à lire avant `login()`.
+
+    `login()` renouvelle la clé de session et supprime l'ancienne : le Panier
+    qui y était rattaché disparaît en cascade, il faut donc le lire avant.
+    Retourne (ids des Panier anonymes, {id produit: quantité}).
+    """
+    quantites = lire_panier_cookie(request)
+    paniers = set()
+    session_key = request.session.session_key
+    if session_key:
+        lignes = models.ProduitPanier.objects.filter(
+            panier__session_id_id=session_key, panier__customer__isnull=True,
+        ).values_list('panier_id', 'produit_id', 'quantite')
+        for panier, produit, quantite in lignes:
+            paniers.add(panier)
+            quantites[produit] = quantites.get(produit, 0) + quantite
+    return paniers, quantites
+
+
+def fusionner_panier(request, response, anonyme):
+    """Fusionne le panier anonyme dans le Panier du client qui vient de se connecter.
+
+    Les quantités d'un même produit s'additionnent. Tout se fait dans une
+    transaction et en requêtes groupées : le nombre de requêtes ne dépend pas
+    du nombre de lignes.
+    """
+    paniers, quantites = anonyme
+    oublier_panier(request)
+    ecrire_panier_cookie(response, {})
+    if not quantites and not paniers:
+        return
+
+    actifs = shop_models.Produit.objects.filter(id__in=quantites, status=True).values_list('id', flat=True)
+    quantites = {produit: quantites[produit] for produit in actifs}
+
+    with transaction.atomic():
+        if quantites:
+            panier = get_or_create_cart(request)
+            existantes = list(models.ProduitPanier.objects.filter(panier=panier, produit_id__in=quantites))
+            for ligne in existantes:
+                ligne.quantite += quantites.pop(ligne.produit_id)
+            models.ProduitPanier.objects.bulk_update(existantes, ['quantite'])
+            models.ProduitPanier.objects.bulk_create([
+                models.ProduitPanier(panier=panier, produit_id=produit, quantite=quantite)
+                for produit, quantite in quantites.items()
+            ])
+        if paniers:
+            models.Panier.objects.filter(id__in=paniers, customer__isnull=True).delete()
+    oublier_panier(request)
+
+
+OPERATIONS = ('add', 'set', 'remove')
+
+
+def _lire_operations(operations):
+    """Valide les opérations reçues et les retourne en (op, id produit, quantité).
+
+    `add` ajoute une quantité positive, `set` fixe la quantité (0 retire la
+    ligne), `remove` retire la ligne. Lève ValueError au premier élément invalide.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError
+    lues = []
+    for operation in operations:
+        try:
+            op = operation.get('op')
+            produit = int(operation['produit'])
+            quantite = int(operation.get('quantite') or 0)
+        except (AttributeError, KeyError, TypeError):
+            raise ValueError
+        if op not in OPERATIONS or (op == 'add' and quantite < 1) or quantite < 0:
+            raise ValueError
+        lues.append((op, produit, quantite))
+    return lues
+
+
+def _appliquer(quantites, operations):
+    """Applique les opérations, dans l'ordre, à {id produit: quantité}. Retourne les produits touchés."""
+    touches = set()
+    for op, produit, quantite in operations:
+        if op == 'add':
+            quantites[produit] = quantites.get(produit, 0) + quantite
+        elif op == 'set':
+            quantites[produit] = quantite
+        else:
+            quantites[produit] = 0
+        touches.add(produit)
+    return touches
+
+
+def _verifier_produits(quantites, touches):
+    # Une seule requête pour tous les produits ajoutés ou modifiés
+    demandes = {produit for produit in touches if quantites[produit]}
+    actifs = set(shop_models.Produit.objects.filter(id__in=demandes, status=True).values_list('id', flat=True))
+    if demandes - actifs:
+        raise ValueError
+
+
+def modifier_panier(request, operations):
+    """Applique une liste d'opérations au panier de la requête, tout ou rien.
+
+    Les opérations sont d'abord repliées en mémoire en quantités finales, puis
+    écrites en requêtes groupées dans une transaction (un DELETE, un UPDATE
+    groupé, un INSERT groupé) : le coût ne dépend pas du nombre de lignes.
+    Lève ValueError si une opération est invalide ; rien n'est alors modifié.
+    Retourne (panier mis à jour ou None, lignes du cookie à écrire) ; les
+    lignes ne sont pas None que pour un visiteur anonyme (ecrire_panier_cookie).
+    """
+    operations = _lire_operations(operations)
+
+    if not request.user.is_authenticated:
+        quantites = lire_panier_cookie(request)
+        touches = _appliquer(quantites, operations)
+        _verifier_produits(quantites, touches)
+        quantites = {produit: quantite for produit, quantite in quantites.items() if quantite}
+        # Le cookie de la requête est désormais périmé : le panier est reconstruit ici.
+        oublier_panier(request)
+        request._lignes_panier_cookie = _construire_lignes_cookie(quantites)
+        return get_cart(request), quantites
+
+    panier = get_cart(request)
+    existantes = {}
+    if panier is not None:
+        existantes = {ligne.produit_id: ligne for ligne in models.ProduitPanier.objects.filter(panier=panier)}
+    quantites = {produit: ligne.quantite for produit, ligne in existantes.items()}
+    touches = _appliquer(quantites, operations)
+    _verifier_produits(quantites, touches)
+
+    retirees = [produit for produit in touches if not quantites[produit] and produit in existantes]
+    modifiees = []
+    for produit in touches:
+        if quantites[produit] and produit in existantes and existantes[produit].quantite != quantites[produit]:
+            existantes[produit].quantite = quantites[produit]
+            modifiees.append(existantes[produit])
+    nouvelles = {produit: quantites[produit] for produit in touches if quantites[produit] and produit not in existantes}
+
+    with transaction.atomic():
+        if nouvelles:
+            # Premier ajout : c'est seulement ici que le panier est créé
+            panier = get_or_create_cart(request)
+            models.ProduitPanier.objects.bulk_create([
+                models.ProduitPanier(panier=panier, produit_id=produit, quantite=quantite)
+                for produit, quantite in nouvelles.items()
+            ])
+        if retirees:
+            models.ProduitPanier.objects.filter(panier=panier, produit_id__in=retirees).delete()
+        if modifiees:
+            models.ProduitPanier.objects.bulk_update(modifiees, ['quantite'])
+
+    if panier is not None:
+        panier.invalider_prix()
+    return panier, None
+
+
+def resume_panier(panier):
+    """Résumé JSON d'un panier : prix (customer.prix) et quantités par produit."""
+    if panier is None:
+        return dict(calculer_prix_lignes([]), id='', quantites={})
+    if isinstance(panier, PanierCookie):
+        quantites = {ligne.produit_id: ligne.quantite for ligne in panier.lignes}
+    else:
+        quantites = dict(panier.produit_panier.values_list('produit_id', 'quantite'))
+    return dict(panier.prix, id=panier.id, quantites=quantites)
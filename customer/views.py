@@ -18,6 +18,8 @@ from django.urls import reverse
 
 from django.contrib.auth.hashers import make_password
 from .models import PasswordResetToken
+from .coupons import trouver as trouver_coupon
+from .utils import get_or_create_cart, lire_panier_cookie, ecrire_panier_cookie, panier_anonyme, fusionner_panier, oublier_panier, modifier_panier, resume_panier
 from django.core.exceptions import ValidationError
 from django.utils.timezone import now
 
@@ -72,12 +74,15 @@ def islogin(request):
 
             isSuccess = True
             _ = isSuccess
+            anonyme = panier_anonyme(request)
             login_request(request, user)
             datas = {
                 'success': True,
                 'message': 'Vous êtes connectés!!!',
             }
-            return JsonResponse(datas, safe=False)  # page si connect
+            response = JsonResponse(datas, safe=False)  # page si connect
+            _fusionner_panier(request, response, anonyme)
+            return response
         else:
 
             data = {
@@ -93,6 +98,14 @@ def islogin(request):
         return JsonResponse(data, safe=False)
 
 
+def _fusionner_panier(request, response, anonyme):
+    # Le panier anonyme ne devient un Panier client qu'à la connexion
+    try:
+        fusionner_panier(request, response, anonyme)
+    except models.Customer.DoesNotExist:
+        pass
+
+
 def deconnexion(request):
     logout(request)
     return redirect('login')
@@ -111,6 +124,7 @@ def inscription(request):
     adresse = request.POST.get('adresse')
     password = request.POST.get('password')
     passwordconf = request.POST.get('passwordconf')
+    anonyme = None
 
     if ville:
         ville = City.objects.get(id=int(ville))
@@ -154,6 +168,7 @@ def inscription(request):
                     message = "Votre Compte a été créé avec succès"
                     issuccess = True
                     if user is not None and user.is_active:
+                        anonyme = panier_anonyme(request)
                         login_request(request, user)
                         message = "Votre Compte a été créé avec succès"
                         issuccess = True
@@ -175,7 +190,30 @@ def inscription(request):
         'message': message
     }
 
-    return JsonResponse(datas, safe=False)
+    response = JsonResponse(datas, safe=False)
+    if anonyme is not None and request.user.is_authenticated:
+        _fusionner_panier(request, response, anonyme)
+    return response
+
+
+def _modifier_panier_cookie(request, produit, quantite, message):
+    """Ajoute, modifie (quantite > 0) ou retire (quantite = 0) une ligne du panier cookie."""
+    try:
+        produit = int(produit)
+        quantite = int(quantite)
+        if quantite < 0 or (quantite and not shop_models.Produit.objects.filter(id=produit, status=True).exists()):
+            raise ValueError
+    except (TypeError, ValueError):
+        return JsonResponse({'message': "Une erreur s'est produite", 'success': False}, safe=False)
+
+    lignes = lire_panier_cookie(request)
+    if quantite:
+        lignes[produit] = quantite
+    else:
+        lignes.pop(produit, None)
+    response = JsonResponse({'message': message, 'success': True}, safe=False)
+    ecrire_panier_cookie(response, lignes)
+    return response
 
 
 def add_to_cart(request):
@@ -187,8 +225,15 @@ def add_to_cart(request):
     produit = postdata['produit']
     quantite = postdata['quantite']
     isSuccess = False
+    if not panier and not request.user.is_authenticated:
+        # Visiteur anonyme : le panier vit dans un cookie signé
+        return _modifier_panier_cookie(request, produit, quantite, "Produit ajouté au panier avec succès")
     if panier is not None and produit is not None and quantite is not None:
-        panier = models.Panier.objects.get(id=panier)
+        if panier:
+            panier = models.Panier.objects.get(id=panier)
+        else:
+            # Premier ajout : c'est seulement ici que le panier est créé
+            panier = get_or_create_cart(request)
         produit = shop_models.Produit.objects.get(id=produit)
         try:
             produit_panier = models.ProduitPanier.objects.get(produit=produit, panier=panier)
@@ -200,6 +245,7 @@ def add_to_cart(request):
         produit_panier.produit = produit
         produit_panier.quantite = quantite
         produit_panier.save()
+        oublier_panier(request)
         isSuccess = True
         message = "Produit ajouté au panier avec succès"
     else:
@@ -221,9 +267,13 @@ def delete_from_cart(request):
     produit_panier = postdata['produit_panier']
 
     isSuccess = False
+    if not panier and not request.user.is_authenticated:
+        # Pour un panier cookie, la ligne est désignée par l'id du produit
+        return _modifier_panier_cookie(request, produit_panier, 0, "Produit supprimé avec succès")
     if panier is not None and produit_panier is not None :
         produit_panier = models.ProduitPanier.objects.get(id=produit_panier)
         produit_panier.delete()
+        oublier_panier(request)
         isSuccess = True
         message = "Produit supprimé avec succès"
     else:
@@ -245,12 +295,18 @@ def add_coupon(request):
     coupon = postdata['coupon']
 
     isSuccess = False
-    if panier is not None and coupon is not None :
+    if not panier and not request.user.is_authenticated:
+        # Panier cookie : le coupon est rattaché à un panier enregistré
+        isSuccess = False
+        message = "Connectez-vous pour utiliser un code coupon"
+    elif panier is not None and coupon is not None :
         try:
-            coupon = models.CodePromotionnel.objects.get(code_promo=coupon)
+            # Code normalisé, cherché parmi les coupons actifs en cache
+            coupon = trouver_coupon(coupon)
             panier = models.Panier.objects.get(id=panier)
-            panier.coupon = coupon
+            panier.coupon_id = coupon
             panier.save()
+            oublier_panier(request)
             isSuccess = True
             message = "Félicitations, vous avez ajouté un code coupon"
         except:
@@ -276,12 +332,15 @@ def update_cart(request):
     quantite = postdata['quantite']
 
     isSuccess = False
+    if not panier and not request.user.is_authenticated:
+        return _modifier_panier_cookie(request, produit, quantite, "Panier modifié avec succès")
     if panier is not None and produit is not None :
         panier = models.Panier.objects.get(id=panier)
         produit = shop_models.Produit.objects.get(id=produit)
         produit_panier = models.ProduitPanier.objects.get(panier=panier, produit=produit)
         produit_panier.quantite = quantite
         produit_panier.save()
+        oublier_panier(request)
         isSuccess = True
         message = "Panier modifié avec succès"
     else:
@@ -294,6 +353,37 @@ def update_cart(request):
     return JsonResponse(data, safe=False)
 
 
+def batch_cart(request):
+    """Applique en une requête plusieurs opérations au panier et retourne son résumé.
+
+    Corps : {"operations": [{"op": "add" | "set" | "remove", "produit": id, "quantite": n}, ...]}
+    """
+    try:
+        postdata = json.loads(request.body.decode('utf-8'))
+        panier, lignes_cookie = modifier_panier(request, postdata['operations'])
+    except (ValueError, KeyError, TypeError):
+        message = "Une erreur s'est produite"
+    except models.Customer.DoesNotExist:
+        # Compte marchand : pas de panier client
+        message = "Seul un compte client peut avoir un panier"
+    else:
+        data = {
+            'message': "Panier modifié avec succès",
+            'success': True,
+            'panier': resume_panier(panier),
+        }
+        response = JsonResponse(data, safe=False)
+        if lignes_cookie is not None:
+            ecrire_panier_cookie(response, lignes_cookie)
+        return response
+
+    data = {
+        'message': message,
+        'success': False
+    }
+    return JsonResponse(data, safe=False)
+
+
 # Étape 1 : Vue pour demander l'e-mail
 def request_reset_password(request):
     if request.method == 'POST':
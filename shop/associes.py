@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models import F, Func
+from django.utils import timezone
+
+from . import models
+from .utils import catalogue_modifie
+
+
+# Nombre de deals associés conservés par produit.
+TOP_K = 6
+
+
+def enregistrer_commande(commande):
+    """Compte les co-achats d'une commande et rafraîchit les deals associés de ses produits.
+
+    Les paires déjà connues sont incrémentées en un seul UPDATE, les nouvelles
+    créées en un seul INSERT.
+    """
+    ids = set(commande.produit_commande.values_list('produit_id', flat=True))
+    if len(ids) < 2:
+        return
+
+    with transaction.atomic():
+        paires = models.CoAchat.objects.filter(produit__in=ids, associe__in=ids)
+        connues = set(paires.values_list('produit_id', 'associe_id'))
+        paires.update(nombre=F('nombre') + 1)
+        models.CoAchat.objects.bulk_create([
+            models.CoAchat(produit_id=a, associe_id=b, nombre=1)
+            for a in ids for b in ids
+            if a != b and (a, b) not in connues
+        ], ignore_conflicts=True)
+        rafraichir(ids)
+    # Les fiches de ces produits affichent désormais d'autres deals associés.
+    catalogue_modifie()
+
+
+def _prix_proches(produit, exclus=()):
+    # Deals de la même catégorie, du prix le plus proche au plus éloigné
+    return (
+        models.Produit.objects.filter(categorie_id=produit.categorie_id, status=True)
+        .exclude(id__in=list(exclus) + [produit.id])
+        .order_by(Func(F('prix_courant') - produit.prix_courant, function='ABS'), 'id')
+    )
+
+
+def rafraichir(ids):
+    """Recalcule le top-K des produits `ids`.
+
+    D'abord les produits le plus souvent achetés avec lui, puis, pour compléter,
+    ceux de la même catégorie au prix le plus proche. Chaque produit est
+    marqué calculé, même quand il n'a aucun deal associé.
+    """
+    for produit in models.Produit.objects.filter(id__in=ids).only('id', 'categorie_id', 'prix_courant'):
+        choisis = list(
+            models.CoAchat.objects.filter(produit=produit, associe__status=True)
+            .order_by('-nombre', 'associe_id')
+            .values_list('associe_id', flat=True)[:TOP_K]
+        )
+        if len(choisis) < TOP_K:
+            choisis += list(_prix_proches(produit, choisis).values_list('id', flat=True)[:TOP_K - len(choisis)])
+
+        with transaction.atomic():
+            models.DealAssocie.objects.filter(produit=produit).delete()
+            models.DealAssocie.objects.bulk_create([
+                models.DealAssocie(produit=produit, associe_id=associe, rang=rang)
+                for rang, associe in enumerate(choisis)
+            ])
+            models.Produit.objects.filter(id=produit.id).update(date_deals_associes=timezone.now())
+
+
+def deals_associes(produit, nombre=3):
+    """Deals à afficher sur la fiche de `produit`, lus dans la table top-K.
+
+    Tant que le top-K n'est pas calculé (commande ou shop.cron), les deals de
+    même catégorie au prix le plus proche sont lus directement : afficher une
+    fiche n'écrit jamais en base.
+    """
+    resultat = list(
+        models.Produit.objects.with_effective_price()
+        .filter(associe_a__produit=produit, status=True)
+        .order_by('associe_a__rang')[:nombre]
+    )
+    if not resultat:
+        resultat = list(_prix_proches(produit).with_effective_price()[:nombre])
+    return resultat
+
+
+def completer(limite=500):
+    """Calcule le top-K des produits actifs pas encore calculés. Retourne leur nombre.
+
+    Un produit calculé sans aucun deal associé est marqué comme les autres :
+    chaque passage avance dans le catalogue au lieu de reprendre les mêmes.
+    """
+    ids = list(
+        models.Produit.objects.filter(status=True, date_deals_associes__isnull=True)
+        .order_by('id').values_list('id', flat=True)[:limite]
+    )
+    rafraichir(ids)
+    return len(ids)
+
+
+def a_recalculer(produits):
+    """Marque le top-K de `produits` (un QuerySet) à recalculer par completer()."""
+    produits.update(date_deals_associes=None)
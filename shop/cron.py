@@ -0,0 +1,47 @@
+from django_cron import CronJobBase, Schedule
+
+from base.images import generer_variantes_en_attente
+from base.storage import stockage_contenu
+from shop.associes import completer
+from shop.facettes import reconstruire
+from shop.televersements import traiter_images
+from shop.utils import balayer_promotions
+
+
+class BalayerPromotionsCronJob(CronJobBase):
+    RUN_EVERY_MINS = 60  # Toutes les heures : rattrape un passage de minuit manqué
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'shop.balayer_promotions'
+
+    def do(self):
+        count = balayer_promotions()
+        if count:
+            # Les UPDATE groupés ne passent pas par les signaux des facettes.
+            reconstruire()
+        print(f"{count} produits basculés.")
+
+
+class TraiterImagesCronJob(CronJobBase):
+    RUN_EVERY_MINS = 1
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'shop.traiter_images'
+
+    def do(self):
+        count = traiter_images()
+        print(f"{count} images traitées.")
+        # Variantes des images traitées et des autres envois (admin, catégories)
+        count = generer_variantes_en_attente(stockage_contenu)
+        print(f"{count} images déclinées en variantes.")
+
+
+class CompleterDealsAssociesCronJob(CronJobBase):
+    RUN_EVERY_MINS = 60
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'shop.completer_deals_associes'
+
+    def do(self):
+        count = completer()
+        print(f"{count} top-K de deals associés calculés.")
@@ -0,0 +1,311 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.http import urlencode
+from cities_light.models import City
+
+from base.cache import bump_version, get_or_build
+from . import models
+
+
+FACETTES_CACHE = 'facettes'
+
+# Bornes des tranches de prix (F CFA), appliquées au prix effectif.
+PALIERS_PRIX = (5000, 10000, 25000, 50000)
+
+# Lignes de facette modifiées par requête (limite de paramètres SQL).
+LOT_LIGNES = 100
+
+# Paramètre GET → titre affiché, dans l'ordre de la barre latérale.
+FACETTES = (
+    ('categorie_etab', 'Univers'),
+    ('categorie', 'Catégories'),
+    ('prix', 'Prix'),
+    ('ville', 'Villes'),
+    ('promo', 'Promotion'),
+    ('super_deal', 'Super deal'),
+)
+
+_CHAMPS = (
+    'id', 'status', 'categorie_id', 'categorie_etab_id', 'prix_courant', 'promo_active',
+    'super_deal', 'etablissement__ville_id',
+)
+
+
+def _palier(prix):
+    for i, borne in enumerate(PALIERS_PRIX):
+        if prix < borne:
+            return i
+    return len(PALIERS_PRIX)
+
+
+def _libelle_palier(i):
+    if i == 0:
+        return 'Moins de %s F' % PALIERS_PRIX[0]
+    if i == len(PALIERS_PRIX):
+        return 'Plus de %s F' % PALIERS_PRIX[-1]
+    return '%s à %s F' % (PALIERS_PRIX[i - 1], PALIERS_PRIX[i])
+
+
+def _cles(valeurs):
+    """Valeurs de facette (facette, valeur) d'un produit lu avec `_CHAMPS`."""
+    if not valeurs['status']:
+        return set()
+
+    cles = {('categorie', str(valeurs['categorie_id'])), ('prix', str(_palier(valeurs['prix_courant'])))}
+    if valeurs['categorie_etab_id']:
+        cles.add(('categorie_etab', str(valeurs['categorie_etab_id'])))
+    if valeurs['etablissement__ville_id']:
+        cles.add(('ville', str(valeurs['etablissement__ville_id'])))
+    if valeurs['promo_active']:
+        cles.add(('promo', '1'))
+    if valeurs['super_deal']:
+        cles.add(('super_deal', '1'))
+    return cles
+
+
+def cles_produit(produit_id):
+    """Valeurs de facette actuelles d'un produit, lues en une requête."""
+    valeurs = models.Produit.objects.filter(id=produit_id).values(*_CHAMPS).first()
+    if valeurs is None:
+        return set()
+    return _cles(valeurs)
+
+
+def contexte_de(cle):
+    """Contexte des compteurs d'une liste restreinte à la valeur `cle`."""
+    return '%s=%s' % cle
+
+
+def _lignes(cles):
+    """Lignes de la table des facettes auxquelles compte un produit de valeurs `cles`.
+
+    Chaque valeur est comptée sur tout le catalogue (contexte '') et sous
+    chacune des valeurs du produit (contexte 'facette=valeur') : une liste
+    restreinte à une valeur lit ses compteurs sans parcourir les deals.
+    """
+    for contexte in [''] + [contexte_de(cle) for cle in cles]:
+        for facette, valeur in cles:
+            yield (contexte, facette, valeur)
+
+
+def appliquer(deltas):
+    """Ajoute à chaque ligne (contexte, facette, valeur) son écart de `deltas`.
+
+    Les lignes manquantes sont créées à zéro, puis un UPDATE par écart
+    distinct (le plus souvent +1 et -1, par lots de LOT_LIGNES lignes) :
+    un deal modifié coûte le même nombre de requêtes quel que soit le
+    catalogue.
+    """
+    deltas = {ligne: delta for ligne, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    models.Facette.objects.bulk_create([
+        models.Facette(contexte=contexte, facette=facette, valeur=valeur)
+        for contexte, facette, valeur in deltas
+    ], batch_size=LOT_LIGNES, ignore_conflicts=True)
+    par_ecart = {}
+    for ligne, delta in deltas.items():
+        par_ecart.setdefault(delta, []).append(ligne)
+    for delta, lignes in par_ecart.items():
+        for debut in range(0, len(lignes), LOT_LIGNES):
+            condition = Q()
+            for contexte, facette, valeur in lignes[debut:debut + LOT_LIGNES]:
+                condition |= Q(contexte=contexte, facette=facette, valeur=valeur)
+            models.Facette.objects.filter(condition).update(nombre=F('nombre') + delta)
+    bump_version(FACETTES_CACHE)
+
+
+def ecarts(anciennes, nouvelles):
+    """Écarts de compteurs quand les valeurs d'un produit passent de `anciennes` à `nouvelles`."""
+    deltas = Counter(_lignes(nouvelles))
+    deltas.subtract(_lignes(anciennes))
+    return deltas
+
+
+def ajuster(anciennes, nouvelles):
+    appliquer(ecarts(anciennes, nouvelles))
+
+
+def deplacer_ville(etablissement, ancienne):
+    """Reporte les compteurs des deals de `etablissement` de la ville `ancienne` à la nouvelle.
+
+    Tous les écarts sont cumulés avant d'être appliqués : le nombre de
+    requêtes ne dépend pas du nombre de deals.
+    """
+    deltas = Counter()
+    for valeurs in etablissement.produits.filter(status=True).values(*_CHAMPS).iterator(chunk_size=2000):
+        nouvelles = _cles(valeurs)
+        anciennes = {cle for cle in nouvelles if cle[0] != 'ville'}
+        if ancienne:
+            anciennes.add(('ville', str(ancienne)))
+        deltas.update(ecarts(anciennes, nouvelles))
+    appliquer(deltas)
+
+
+def reconstruire():
+    """Recalcule toute la table des facettes.
+
+    Utilisé quand des produits changent sans passer par save(), comme lors du
+    balayage des promotions (shop.cron.BalayerPromotionsCronJob).
+    """
+    compteurs = Counter()
+    for valeurs in models.Produit.objects.filter(status=True).values(*_CHAMPS).iterator(chunk_size=2000):
+        compteurs.update(_lignes(_cles(valeurs)))
+
+    with transaction.atomic():
+        models.Facette.objects.all().delete()
+        models.Facette.objects.bulk_create([
+            models.Facette(contexte=contexte, facette=facette, valeur=valeur, nombre=nombre)
+            for (contexte, facette, valeur), nombre in compteurs.items()
+        ], batch_size=2000)
+    bump_version(FACETTES_CACHE)
+    return len(compteurs)
+
+
+def _construire_facettes():
+    if not models.Facette.objects.exists():
+        reconstruire()
+    lignes = list(
+        models.Facette.objects.filter(contexte='', nombre__gt=0).values_list('facette', 'valeur', 'nombre')
+    )
+
+    ids = {}
+    for facette, valeur, _ in lignes:
+        ids.setdefault(facette, []).append(valeur)
+    libelles = {
+        'categorie': dict(models.CategorieProduit.objects.filter(id__in=ids.get('categorie', [])).values_list('id', 'nom')),
+        'categorie_etab': dict(models.CategorieEtablissement.objects.filter(id__in=ids.get('categorie_etab', [])).values_list('id', 'nom')),
+        'ville': dict(City.objects.filter(id__in=ids.get('ville', [])).values_list('id', 'name')),
+    }
+
+    facettes = {facette: [] for facette, _ in FACETTES}
+    for facette, valeur, nombre in lignes:
+        if facette == 'prix':
+            libelle = _libelle_palier(int(valeur))
+        elif facette in ('promo', 'super_deal'):
+            libelle = 'Promotion en cours' if facette == 'promo' else 'Super deals'
+        else:
+            libelle = libelles[facette].get(int(valeur))
+            if libelle is None:
+                continue
+        facettes[facette].append({'valeur': valeur, 'libelle': libelle, 'nombre': nombre})
+
+    facettes['prix'].sort(key=lambda v: int(v['valeur']))
+    for facette in ('categorie', 'categorie_etab', 'ville'):
+        facettes[facette].sort(key=lambda v: -v['nombre'])
+    return facettes
+
+
+def get_facettes():
+    """Compteurs de toutes les facettes sur le catalogue actif, servis depuis le cache.
+
+    La table des facettes n'est lue qu'après une modification : le coût ne
+    dépend pas du nombre de deals.
+    """
+    return get_or_build(FACETTES_CACHE, 'facettes', _construire_facettes)
+
+
+def lire_filtres(params):
+    """Filtres de facette valides de la requête, sous la forme {facette: valeur}."""
+    filtres = {}
+    for facette, _ in FACETTES:
+        valeur = params.get(facette, '')
+        if facette in ('promo', 'super_deal'):
+            if valeur == '1':
+                filtres[facette] = '1'
+        elif valeur.isdigit():
+            if facette != 'prix' or int(valeur) <= len(PALIERS_PRIX):
+                filtres[facette] = valeur
+    return filtres
+
+
+def filtrer_produits(produits, filtres):
+    if 'categorie' in filtres:
+        produits = produits.filter(categorie_id=filtres['categorie'])
+    if 'categorie_etab' in filtres:
+        produits = produits.filter(categorie_etab_id=filtres['categorie_etab'])
+    if 'ville' in filtres:
+        produits = produits.filter(etablissement__ville_id=filtres['ville'])
+    if 'promo' in filtres:
+        produits = produits.filter(promo_active=True)
+    if 'super_deal' in filtres:
+        produits = produits.filter(super_deal=True)
+    if 'prix' in filtres:
+        palier = int(filtres['prix'])
+        if palier > 0:
+            produits = produits.filter(prix_courant__gte=PALIERS_PRIX[palier - 1])
+        if palier < len(PALIERS_PRIX):
+            produits = produits.filter(prix_courant__lt=PALIERS_PRIX[palier])
+    return produits
+
+
+def _lire_contextes(contextes):
+    comptes = {contexte: {} for contexte in contextes}
+    lignes = models.Facette.objects.filter(contexte__in=contextes, nombre__gt=0)
+    for contexte, facette, valeur, nombre in lignes.values_list('contexte', 'facette', 'valeur', 'nombre'):
+        comptes[contexte].setdefault(facette, {})[valeur] = nombre
+    return comptes
+
+
+def compter_facettes(filtres, base=None):
+    """Compteurs de facette de la liste filtrée, lus dans la table des facettes.
+
+    Chaque facette est comptée sans son propre filtre, sous les autres
+    filtres et la valeur `base` de la page (catégorie affichée). Sous une
+    seule valeur, le compte est exact ; sous plusieurs, c'est celui de la
+    plus sélective d'entre elles : un majorant, nul seulement quand aucun
+    deal ne correspond. Aucun deal n'est parcouru ; une seule requête,
+    mise en cache jusqu'au prochain changement de facette.
+    """
+    catalogue = {
+        (facette, valeur['valeur']): valeur['nombre']
+        for facette, valeurs in get_facettes().items() for valeur in valeurs
+    }
+    choisis = {}
+    for facette, _ in FACETTES:
+        autres = [cle for cle in filtres.items() if cle[0] != facette]
+        if base is not None:
+            autres.append(base)
+        # La valeur la plus rare restreint le plus la liste.
+        cle = min(autres, key=lambda cle: catalogue.get(cle, 0), default=None)
+        choisis[facette] = '' if cle is None else contexte_de(cle)
+
+    contextes = sorted(set(choisis.values()))
+    lus = get_or_build(FACETTES_CACHE, 'contextes:%s' % '|'.join(contextes), lambda: _lire_contextes(contextes))
+    return {facette: lus[contexte].get(facette, {}) for facette, contexte in choisis.items()}
+
+
+def barre_facettes(filtres, base=None):
+    """Facettes à afficher, avec le lien qui active ou retire chaque valeur.
+
+    Sans filtre ni `base` (la valeur de facette de la catégorie affichée),
+    les compteurs du catalogue suffisent ; sinon ceux de compter_facettes
+    sont affichés et les valeurs sans aucun deal sont masquées.
+    """
+    facettes = get_facettes()
+    comptes = None
+    if filtres or base is not None:
+        comptes = compter_facettes(filtres, base)
+
+    groupes = []
+    for facette, titre in FACETTES:
+        valeurs = []
+        for valeur in facettes[facette]:
+            actif = filtres.get(facette) == valeur['valeur']
+            if comptes is not None:
+                valeur = dict(valeur, nombre=comptes[facette].get(valeur['valeur'], 0))
+                if not valeur['nombre'] and not actif:
+                    continue
+            lien = dict(filtres)
+            if actif:
+                del lien[facette]
+            else:
+                lien[facette] = valeur['valeur']
+            valeurs.append(dict(valeur, actif=actif, lien=urlencode(lien)))
+        if comptes is not None and facette in ('categorie', 'categorie_etab', 'ville'):
+            valeurs.sort(key=lambda v: -v['nombre'])
+        if valeurs:
+            groupes.append({'titre': titre, 'valeurs': valeurs})
+    return groupes
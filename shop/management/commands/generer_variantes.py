@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from base.images import generer_variantes
+from shop.signals import CHAMPS_IMAGES
+
+
+class Command(BaseCommand):
+    help = "Crée les variantes redimensionnées des images déjà enregistrées."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forcer', action='store_true', help="Refait aussi les variantes existantes.")
+
+    def handle(self, *args, **options):
+        total = 0
+        for modele, champs in CHAMPS_IMAGES.items():
+            noms = set()
+            for valeurs in modele.objects.values_list(*champs).iterator(chunk_size=2000):
+                noms.update(nom for nom in valeurs if nom)
+            for nom in noms:
+                total += generer_variantes(nom, forcer=options['forcer'])
+        self.stdout.write("%s variantes écrites." % total)
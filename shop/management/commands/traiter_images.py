@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.televersements import traiter_images
+
+
+class Command(BaseCommand):
+    help = "Traite en continu les images téléversées par les marchands."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--une-fois', action='store_true', help="Traite la file une fois puis s'arrête.")
+        parser.add_argument('--pause', type=float, default=2, help="Attente (secondes) quand la file est vide.")
+
+    def handle(self, *args, **options):
+        while True:
+            nombre = traiter_images()
+            if nombre:
+                self.stdout.write("%s images traitées." % nombre)
+            if options['une_fois']:
+                return
+            if not nombre:
+                time.sleep(options['pause'])
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+# Index plein texte des produits (SQLite FTS5), tenu à jour par shop.signals.
+# Sur un autre moteur la migration ne fait rien et la recherche passe par l'ORM.
+
+CREER_INDEX = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS shop_produit_fts USING fts5(
+        nom, description, description_deal, etablissement, categories,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+REMPLIR_INDEX = """
+    INSERT INTO shop_produit_fts (rowid, nom, description, description_deal, etablissement, categories)
+    SELECT p.id, p.nom, p.description, p.description_deal, e.nom,
+           COALESCE(cp.nom, '') || ' ' || COALESCE(ce.nom, '')
+    FROM shop_produit p
+    JOIN shop_etablissement e ON e.id = p.etablissement_id
+    LEFT JOIN shop_categorieproduit cp ON cp.id = p.categorie_id
+    LEFT JOIN shop_categorieetablissement ce ON ce.id = p.categorie_etab_id
+    WHERE p.status = 1
+"""
+
+
+def creer_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(CREER_INDEX)
+        schema_editor.execute(REMPLIR_INDEX)
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS shop_produit_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_produit_quantite'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
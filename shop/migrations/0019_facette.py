@@ -0,0 +1,27 @@
+# Generated by Django 4.2.9 on 2026-10-17 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_produit_recherche'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Facette',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facette', models.CharField(max_length=30)),
+                ('valeur', models.CharField(max_length=50)),
+                ('nombre', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Facette',
+                'verbose_name_plural': 'Facettes',
+                'unique_together': {('facette', 'valeur')},
+            },
+        ),
+    ]
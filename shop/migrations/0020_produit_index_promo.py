@@ -0,0 +1,21 @@
+# Generated by Django 4.2.9 on 2026-10-17 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_facette'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['date_debut_promo'], name='shop_produi_date_de_123616_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['date_fin_promo'], name='shop_produi_date_fi_2401ef_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.9 on 2026-10-17 01:06
+
+import datetime
+
+from django.db import migrations, models
+
+
+def remplir_prix_courant(apps, schema_editor):
+    Produit = apps.get_model('shop', 'Produit')
+    aujourdhui = datetime.date.today()
+    Produit.objects.update(prix_courant=models.F('prix'))
+    Produit.objects.filter(date_debut_promo__lte=aujourdhui, date_fin_promo__gte=aujourdhui).update(
+        promo_active=True, prix_courant=models.F('prix_promotionnel'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_produit_index_promo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='prix_courant',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='promo_active',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['prix_courant', 'id'], name='shop_produi_prix_co_f469bd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['promo_active', 'date_fin_promo'], name='shop_produi_promo_a_f70bfe_idx'),
+        ),
+        migrations.RunPython(remplir_prix_courant, migrations.RunPython.noop),
+    ]
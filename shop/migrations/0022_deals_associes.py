@@ -0,0 +1,57 @@
+# Generated by Django 4.2.9 on 2026-10-17 01:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Compteurs de co-achat tirés des commandes déjà passées.
+REMPLIR_CO_ACHATS = """
+    INSERT INTO shop_coachat (produit_id, associe_id, nombre)
+    SELECT a.produit_id, b.produit_id, COUNT(DISTINCT a.commande_id)
+    FROM customer_produitpanier a
+    JOIN customer_produitpanier b
+      ON b.commande_id = a.commande_id AND b.produit_id <> a.produit_id
+    WHERE a.commande_id IS NOT NULL
+    GROUP BY a.produit_id, b.produit_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_produit_prix_courant'),
+        ('customer', '0008_customer_ville'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DealAssocie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rang', models.PositiveSmallIntegerField()),
+                ('associe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='associe_a', to='shop.produit')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deals_associes', to='shop.produit')),
+            ],
+            options={
+                'verbose_name': 'Deal associé',
+                'verbose_name_plural': 'Deals associés',
+                'unique_together': {('produit', 'rang')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CoAchat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.IntegerField(default=0)),
+                ('associe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.produit')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_achats', to='shop.produit')),
+            ],
+            options={
+                'verbose_name': 'Co-achat',
+                'verbose_name_plural': 'Co-achats',
+                'indexes': [models.Index(fields=['produit', '-nombre'], name='shop_coacha_produit_6182a7_idx')],
+                'unique_together': {('produit', 'associe')},
+            },
+        ),
+        migrations.RunSQL(REMPLIR_CO_ACHATS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-17 01:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0022_deals_associes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageEnAttente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('champ', models.CharField(max_length=30)),
+                ('fichier', models.FileField(upload_to='attente/images')),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('refusee', 'Refusée')], default='en_attente', max_length=20)),
+                ('erreur', models.CharField(blank=True, max_length=254)),
+                ('date_add', models.DateTimeField(auto_now_add=True)),
+                ('date_update', models.DateTimeField(auto_now=True)),
+                ('etablissement', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='images_en_attente', to='shop.etablissement')),
+                ('produit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='images_en_attente', to='shop.produit')),
+            ],
+            options={
+                'verbose_name': 'Image en attente',
+                'verbose_name_plural': 'Images en attente',
+                'indexes': [models.Index(fields=['statut', 'date_add'], name='shop_imagee_statut_54c7b9_idx')],
+            },
+        ),
+    ]
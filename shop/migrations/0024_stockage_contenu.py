@@ -0,0 +1,49 @@
+# Generated by Django 4.2.9 on 2026-10-17 01:43
+
+import base.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0023_images_en_attente'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categorieetablissement',
+            name='couverture',
+            field=models.ImageField(null=True, storage=base.storage.StockageContenu(), upload_to='media/categories/etablissements/couvertures'),
+        ),
+        migrations.AlterField(
+            model_name='categorieproduit',
+            name='couverture',
+            field=models.ImageField(null=True, storage=base.storage.StockageContenu(), upload_to='media/categories/produits/couvertures'),
+        ),
+        migrations.AlterField(
+            model_name='etablissement',
+            name='couverture',
+            field=models.ImageField(storage=base.storage.StockageContenu(), upload_to='media/etablissements/couvertures'),
+        ),
+        migrations.AlterField(
+            model_name='etablissement',
+            name='logo',
+            field=models.ImageField(storage=base.storage.StockageContenu(), upload_to='media/etablissements/logo'),
+        ),
+        migrations.AlterField(
+            model_name='produit',
+            name='image',
+            field=models.ImageField(default='b-1.jpg', storage=base.storage.StockageContenu(), upload_to='produis/images'),
+        ),
+        migrations.AlterField(
+            model_name='produit',
+            name='image_2',
+            field=models.ImageField(default='b-1.jpg', storage=base.storage.StockageContenu(), upload_to='produis/images'),
+        ),
+        migrations.AlterField(
+            model_name='produit',
+            name='image_3',
+            field=models.ImageField(default='b-1.jpg', storage=base.storage.StockageContenu(), upload_to='produis/images'),
+        ),
+    ]
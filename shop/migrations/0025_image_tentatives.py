@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-17 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0024_stockage_contenu'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageenattente',
+            name='tentatives',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-17 02:51
+
+from django.db import migrations, models
+
+
+def vider_facettes(apps, schema_editor):
+    # Les compteurs par contexte manquent : la table est reconstruite à la
+    # première lecture (shop.facettes.get_facettes).
+    apps.get_model('shop', 'Facette').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0025_image_tentatives'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='facette',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='facette',
+            name='contexte',
+            field=models.CharField(blank=True, default='', max_length=90),
+        ),
+        migrations.AlterUniqueTogether(
+            name='facette',
+            unique_together={('contexte', 'facette', 'valeur')},
+        ),
+        migrations.RunPython(vider_facettes, migrations.RunPython.noop),
+    ]
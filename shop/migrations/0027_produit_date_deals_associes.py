@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-17 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0026_facette_contexte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='date_deals_associes',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+    ]
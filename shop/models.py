@@ -4,6 +4,7 @@ import datetime
 from django.contrib.sessions.models import Session
 from django.contrib.auth.models import User
 from cities_light.models import City
+from base.storage import stockage_contenu
 
 
 # Create your models here.
@@ -11,7 +12,7 @@ class CategorieEtablissement(models.Model):
 
     nom = models.CharField(max_length=254)
     description = models.TextField()
-    couverture = models.ImageField(upload_to="media/categories/etablissements/couvertures", null=True)
+    couverture = models.ImageField(upload_to="media/categories/etablissements/couvertures", null=True, storage=stockage_contenu)
 
     date_add = models.DateTimeField(auto_now_add=True)
     date_update = models.DateTimeField(auto_now=True)
@@ -32,7 +33,7 @@ class CategorieProduit(models.Model):
     nom = models.CharField(max_length=254)
     description = models.TextField()
     categorie = models.ForeignKey(CategorieEtablissement, related_name="categorie_produits", on_delete=models.CASCADE, null=True)
-    couverture = models.ImageField(upload_to="media/categories/produits/couvertures", null=True)
+    couverture = models.ImageField(upload_to="media/categories/produits/couvertures", null=True, storage=stockage_contenu)
 
     date_add = models.DateTimeField(auto_now_add=True)
     date_update = models.DateTimeField(auto_now=True)
@@ -52,8 +53,8 @@ class Etablissement(models.Model):
     user = models.OneToOneField(User, related_name='etablissement', on_delete=models.CASCADE)
     nom = models.CharField(max_length=254)
     description = models.TextField()
-    logo = models.ImageField(upload_to="media/etablissements/logo")
-    couverture = models.ImageField(upload_to="media/etablissements/couvertures")
+    logo = models.ImageField(upload_to="media/etablissements/logo", storage=stockage_contenu)
+    couverture = models.ImageField(upload_to="media/etablissements/couvertures", storage=stockage_contenu)
     categorie = models.ForeignKey(CategorieEtablissement, related_name="produit", on_delete=models.CASCADE)
     nom_du_responsable = models.CharField(max_length=254, null=True)
     prenoms_duresponsable = models.CharField(max_length=254, null=True)
@@ -89,6 +90,41 @@ class Etablissement(models.Model):
         return self.nom
 
 
+def promotion_en_cours(prefixe=''):
+    """Condition SQL d'une promotion en cours (`prefixe` : 'produit__' depuis une ligne de panier)."""
+    aujourdhui = datetime.date.today()
+    return models.Q(**{
+        prefixe + 'date_debut_promo__lte': aujourdhui,
+        prefixe + 'date_fin_promo__gte': aujourdhui,
+    })
+
+
+def en_promotion(prefixe=''):
+    return models.Case(
+        models.When(promotion_en_cours(prefixe), then=models.Value(True)),
+        default=models.Value(False),
+        output_field=models.BooleanField(),
+    )
+
+
+def prix_effectif(prefixe=''):
+    """Prix de vente : le prix promotionnel si la promotion est en cours."""
+    return models.Case(
+        models.When(promotion_en_cours(prefixe), then=models.F(prefixe + 'prix_promotionnel')),
+        default=models.F(prefixe + 'prix'),
+        output_field=models.FloatField(),
+    )
+
+
+class ProduitQuerySet(models.QuerySet):
+
+    def with_effective_price(self):
+        """Annote `en_promotion` et `prix_effectif`, calculés par la base."""
+        if 'prix_effectif' in self.query.annotations:
+            return self
+        return self.annotate(en_promotion=en_promotion(), prix_effectif=prix_effectif())
+
+
 class Produit(models.Model):
     nom = models.CharField(max_length=254)
     description = models.TextField()
@@ -101,40 +137,60 @@ class Produit(models.Model):
     categorie_etab = models.ForeignKey(CategorieEtablissement, related_name="produit_etab", on_delete=models.CASCADE, null=True, blank=True)
     categorie = models.ForeignKey(CategorieProduit, related_name="produit", on_delete=models.CASCADE)
     etablissement = models.ForeignKey(Etablissement, related_name="produits", on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='produis/images', default="b-1.jpg")
-    image_2 = models.ImageField(upload_to='produis/images', default="b-1.jpg")
-    image_3 = models.ImageField(upload_to='produis/images', default="b-1.jpg")
+    image = models.ImageField(upload_to='produis/images', default="b-1.jpg", storage=stockage_contenu)
+    image_2 = models.ImageField(upload_to='produis/images', default="b-1.jpg", storage=stockage_contenu)
+    image_3 = models.ImageField(upload_to='produis/images', default="b-1.jpg", storage=stockage_contenu)
     super_deal = models.BooleanField(default=False)
+    # État de la promotion et prix de vente enregistrés : recalculés par save()
+    # et, au changement de jour, par shop.cron.BalayerPromotionsCronJob.
+    promo_active = models.BooleanField(default=False, editable=False)
+    prix_courant = models.FloatField(default=0, editable=False)
+    # Dernier calcul du top-K (shop.associes.rafraichir) ; vide : à calculer.
+    date_deals_associes = models.DateTimeField(null=True, editable=False, db_index=True)
 
     date_add = models.DateTimeField(auto_now_add=True)
     date_update = models.DateTimeField(auto_now=True)
     status = models.BooleanField(default=True)
     slug = models.SlugField(unique=True, editable=False, null=True,  blank=True)
 
+    objects = ProduitQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_debut_promo']),
+            models.Index(fields=['date_fin_promo']),
+            models.Index(fields=['prix_courant', 'id']),
+            models.Index(fields=['promo_active', 'date_fin_promo']),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug or self.slug is None:
             self.slug = '-'.join((slugify(self.nom), slugify(datetime.datetime.now().microsecond)))
         self.categorie_etab = self.etablissement.categorie
+        self.promo_active = self._promotion_en_cours(datetime.date.today())
+        self.prix_courant = self.prix_promotionnel if self.promo_active else self.prix
         super(Produit, self).save(*args, **kwargs)
 
+    def _promotion_en_cours(self, aujourdhui):
+        if not self.date_debut_promo or not self.date_fin_promo:
+            return False
+        return self.date_debut_promo <= aujourdhui <= self.date_fin_promo
+
     def __str__(self):
         return self.nom
 
     @property
     def check_promotion(self):
-        result = True
-        if self.date_debut_promo:
-            if self.date_debut_promo > datetime.date.today():
-                result = False
-        else:
-            result = False
-        if self.date_fin_promo:
-            if self.date_fin_promo < datetime.date.today():
-                result = False
-        else:
-            result=False
-        
-        return result
+        # Déjà calculé par la base si le produit vient de with_effective_price().
+        if hasattr(self, 'en_promotion'):
+            return self.en_promotion
+        return self._promotion_en_cours(datetime.date.today())
+
+    @property
+    def prix_de_vente(self):
+        if hasattr(self, 'prix_effectif'):
+            return self.prix_effectif
+        return self.prix_promotionnel if self.check_promotion else self.prix
 
 
 class Favorite(models.Model):
@@ -151,3 +207,88 @@ class Favorite(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.produit.nom}"
 
+
+
+class Facette(models.Model):
+    """Nombre de deals actifs par valeur de facette, tenu à jour par shop.signals.
+
+    `contexte` vide : tout le catalogue ; 'facette=valeur' : les seuls deals
+    ayant cette valeur (voir shop.facettes).
+    """
+
+    contexte = models.CharField(max_length=90, default='', blank=True)
+    facette = models.CharField(max_length=30)
+    valeur = models.CharField(max_length=50)
+    nombre = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Facette'
+        verbose_name_plural = 'Facettes'
+        unique_together = ('contexte', 'facette', 'valeur')
+
+    def __str__(self):
+        return f"{self.facette}={self.valeur} ({self.nombre})"
+
+
+class CoAchat(models.Model):
+    """Nombre de commandes contenant à la fois `produit` et `associe`."""
+
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='co_achats')
+    associe = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='+')
+    nombre = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Co-achat'
+        verbose_name_plural = 'Co-achats'
+        unique_together = ('produit', 'associe')
+        indexes = [
+            models.Index(fields=['produit', '-nombre']),
+        ]
+
+
+class DealAssocie(models.Model):
+    """Les K deals à proposer sur la fiche d'un produit, dans l'ordre de `rang`."""
+
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='deals_associes')
+    associe = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='associe_a')
+    rang = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = 'Deal associé'
+        verbose_name_plural = 'Deals associés'
+        unique_together = ('produit', 'rang')
+
+
+class ImageEnAttente(models.Model):
+    """Image téléversée par un marchand, en attente de traitement par shop.cron.TraiterImagesCronJob."""
+
+    EN_ATTENTE = 'en_attente'
+    EN_COURS = 'en_cours'
+    REFUSEE = 'refusee'
+    STATUTS = (
+        (EN_ATTENTE, 'En attente'),
+        (EN_COURS, 'En cours'),
+        (REFUSEE, 'Refusée'),
+    )
+
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, null=True, blank=True, related_name='images_en_attente')
+    etablissement = models.ForeignKey(Etablissement, on_delete=models.CASCADE, null=True, blank=True, related_name='images_en_attente')
+    champ = models.CharField(max_length=30)
+    fichier = models.FileField(upload_to='attente/images')
+    statut = models.CharField(max_length=20, choices=STATUTS, default=EN_ATTENTE)
+    erreur = models.CharField(max_length=254, blank=True)
+    # Nombre de réservations par un worker ; `date_update` date la dernière.
+    tentatives = models.PositiveSmallIntegerField(default=0)
+
+    date_add = models.DateTimeField(auto_now_add=True)
+    date_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Image en attente'
+        verbose_name_plural = 'Images en attente'
+        indexes = [
+            models.Index(fields=['statut', 'date_add']),
+        ]
+
+    def __str__(self):
+        return f"{self.champ} ({self.get_statut_display()})"
@@ -0,0 +1,116 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+
+from . import models
+
+
+TABLE = 'shop_produit_fts'
+RESULTATS_PAR_PAGE = 12
+
+# Marqueurs hors texte posés par snippet(), remplacés après échappement HTML.
+_DEBUT, _FIN = '\x02', '\x03'
+
+# Poids bm25 des colonnes : nom, description, description_deal, établissement, catégories.
+_POIDS = '10.0, 1.0, 2.0, 4.0, 3.0'
+
+_SELECT_DOCUMENTS = """
+    SELECT p.id, p.nom, p.description, p.description_deal, e.nom,
+           COALESCE(cp.nom, '') || ' ' || COALESCE(ce.nom, '')
+    FROM {produit} p
+    JOIN {etablissement} e ON e.id = p.etablissement_id
+    LEFT JOIN {categorie} cp ON cp.id = p.categorie_id
+    LEFT JOIN {categorie_etab} ce ON ce.id = p.categorie_etab_id
+    WHERE p.status = 1
+""".format(
+    produit=models.Produit._meta.db_table,
+    etablissement=models.Etablissement._meta.db_table,
+    categorie=models.CategorieProduit._meta.db_table,
+    categorie_etab=models.CategorieEtablissement._meta.db_table,
+)
+
+
+def disponible():
+    """L'index FTS5 n'existe que sur SQLite ; ailleurs la recherche passe par l'ORM."""
+    return connection.vendor == 'sqlite'
+
+
+def indexer(produits=None, etablissements=None, categories=None, categories_etab=None):
+    """Réindexe les produits donnés (ids), ou ceux d'un établissement ou d'une catégorie.
+
+    Les produits inactifs ou supprimés sortent de l'index ; tout se fait en
+    deux requêtes quel que soit le nombre de produits concernés.
+    """
+    if not disponible():
+        return
+    conditions, params = [], []
+    for colonne, ids in (('id', produits), ('etablissement_id', etablissements),
+                         ('categorie_id', categories), ('categorie_etab_id', categories_etab)):
+        if ids:
+            ids = list(ids)
+            conditions.append('%s IN (%s)' % (colonne, ', '.join(['%s'] * len(ids))))
+            params.extend(ids)
+    if not conditions:
+        return
+
+    selection = 'SELECT id FROM %s WHERE %s' % (models.Produit._meta.db_table, ' OR '.join(conditions))
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (TABLE, selection), params)
+        cursor.execute(
+            'INSERT INTO %s (rowid, nom, description, description_deal, etablissement, categories) %s AND p.id IN (%s)'
+            % (TABLE, _SELECT_DOCUMENTS, selection),
+            params,
+        )
+
+
+def desindexer(produit_id):
+    if disponible():
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % TABLE, [produit_id])
+
+
+def _requete_fts(terme):
+    # Chaque mot est mis entre guillemets : la saisie de l'utilisateur ne
+    # peut pas injecter d'opérateurs FTS5. Les mots d'au moins deux lettres
+    # sont cherchés comme préfixes (index de préfixes 2 et 3 de la migration).
+    mots = re.findall(r'\w+', terme or '')
+    return ' '.join('"%s"*' % mot if len(mot) > 1 else '"%s"' % mot for mot in mots[:10])
+
+
+def _extrait(texte):
+    return escape(texte).replace(_DEBUT, '<mark>').replace(_FIN, '</mark>')
+
+
+def rechercher_produits(terme, page=1, taille=RESULTATS_PAR_PAGE):
+    """Produits actifs correspondant à `terme`, classés par pertinence (bm25).
+
+    Retourne {'resultats': [(produit, extrait HTML)], 'page', 'suivante'} où
+    'suivante' vaut None sur la dernière page.
+    """
+    resultats = {'resultats': [], 'page': page, 'suivante': None}
+    requete = _requete_fts(terme)
+    if not requete:
+        return resultats
+
+    if disponible():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid, snippet(%s, -1, '%s', '%s', '…', 16) FROM %s WHERE %s MATCH %%s "
+                "ORDER BY bm25(%s, %s) LIMIT %%s OFFSET %%s"
+                % (TABLE, _DEBUT, _FIN, TABLE, TABLE, TABLE, _POIDS),
+                [requete, taille + 1, (page - 1) * taille],
+            )
+            lignes = cursor.fetchall()
+    else:
+        produits = models.Produit.objects.filter(status=True, nom__icontains=terme).order_by('-date_add')
+        lignes = list(produits.values_list('id', 'nom')[(page - 1) * taille:page * taille + 1])
+
+    if len(lignes) > taille:
+        lignes = lignes[:taille]
+        resultats['suivante'] = page + 1
+    produits = models.Produit.objects.with_effective_price().in_bulk([ligne[0] for ligne in lignes])
+    resultats['resultats'] = [
+        (produits[id], _extrait(extrait)) for id, extrait in lignes if id in produits
+    ]
+    return resultats
@@ -0,0 +1,171 @@
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from base.cache import bump_version
+from base.images import supprimer_variantes
+from . import associes, facettes, recherche, slugs
+from .models import CategorieEtablissement, CategorieProduit, DealAssocie, Etablissement, Produit
+from .utils import CATEGORIES_CACHE, catalogue_modifie
+
+
+@receiver([post_save, post_delete], sender=CategorieEtablissement)
+@receiver([post_save, post_delete], sender=CategorieProduit)
+@receiver([post_save, post_delete], sender=Produit)
+def invalider_arbre_categories(sender, **kwargs):
+    bump_version(CATEGORIES_CACHE)
+
+
+@receiver(post_save, sender=Produit)
+def indexer_produit(sender, instance, **kwargs):
+    recherche.indexer(produits=[instance.id])
+
+
+@receiver(post_delete, sender=Produit)
+def desindexer_produit(sender, instance, **kwargs):
+    recherche.desindexer(instance.id)
+
+
+@receiver(post_save, sender=Etablissement)
+def indexer_etablissement(sender, instance, **kwargs):
+    recherche.indexer(etablissements=[instance.id])
+
+
+@receiver(post_save, sender=CategorieProduit)
+def indexer_categorie(sender, instance, **kwargs):
+    recherche.indexer(categories=[instance.id])
+
+
+@receiver(post_save, sender=CategorieEtablissement)
+def indexer_categorie_etablissement(sender, instance, **kwargs):
+    recherche.indexer(categories_etab=[instance.id])
+
+
+@receiver(pre_save, sender=Produit)
+@receiver(pre_delete, sender=Produit)
+def lire_facettes_produit(sender, instance, **kwargs):
+    # Valeurs de facette avant modification, pour n'appliquer que la différence.
+    instance._facettes = facettes.cles_produit(instance.pk) if instance.pk else set()
+
+
+@receiver(post_save, sender=Produit)
+def compter_facettes_produit(sender, instance, **kwargs):
+    facettes.ajuster(getattr(instance, '_facettes', set()), facettes.cles_produit(instance.pk))
+
+
+@receiver(post_delete, sender=Produit)
+def decompter_facettes_produit(sender, instance, **kwargs):
+    facettes.ajuster(getattr(instance, '_facettes', set()), set())
+
+
+@receiver(pre_save, sender=Etablissement)
+def lire_ville_etablissement(sender, instance, **kwargs):
+    instance._ancienne_ville = (
+        Etablissement.objects.filter(pk=instance.pk).values_list('ville_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Etablissement)
+def deplacer_facette_ville(sender, instance, created, **kwargs):
+    ancienne = getattr(instance, '_ancienne_ville', None)
+    if created or ancienne == instance.ville_id:
+        return
+    facettes.deplacer_ville(instance, ancienne)
+
+
+@receiver(post_save, sender=Produit)
+def completer_deals_associes(sender, instance, created, **kwargs):
+    # Un nouveau deal peut compléter le top-K de sa catégorie : celui-ci sera
+    # recalculé par shop.cron (la fiche affiche les prix proches d'ici là).
+    if created:
+        DealAssocie.objects.filter(produit__categorie_id=instance.categorie_id).delete()
+        associes.a_recalculer(Produit.objects.filter(categorie_id=instance.categorie_id).exclude(id=instance.id))
+
+
+@receiver(pre_delete, sender=Produit)
+def retirer_deal_associe(sender, instance, **kwargs):
+    # Les top-K qui le proposaient perdent une ligne (CASCADE) : à compléter.
+    associes.a_recalculer(Produit.objects.filter(deals_associes__associe=instance))
+
+
+@receiver([post_save, post_delete], sender=CategorieEtablissement)
+@receiver([post_save, post_delete], sender=CategorieProduit)
+@receiver([post_save, post_delete], sender=Produit)
+def invalider_slugs(sender, created=True, **kwargs):
+    # Un slug n'est attribué qu'à la création : les autres enregistrements
+    # ne changent pas la table.
+    if created:
+        slugs.invalider()
+
+
+@receiver([post_save, post_delete], sender=CategorieEtablissement)
+@receiver([post_save, post_delete], sender=CategorieProduit)
+@receiver([post_save, post_delete], sender=Etablissement)
+@receiver([post_save, post_delete], sender=Produit)
+def dater_catalogue(sender, **kwargs):
+    catalogue_modifie()
+
+
+# Champs image de chaque modèle, dont les variantes sont servies en srcset
+# (créées hors requête par shop.cron.TraiterImagesCronJob).
+CHAMPS_IMAGES = {
+    CategorieEtablissement: ('couverture',),
+    CategorieProduit: ('couverture',),
+    Etablissement: ('logo', 'couverture'),
+    Produit: ('image', 'image_2', 'image_3'),
+}
+
+
+def _liberer(fichier, nom):
+    # Après validation : une transaction annulée garde son fichier.
+    def liberer():
+        if fichier.storage.delete(nom):
+            supprimer_variantes(nom)
+    transaction.on_commit(liberer)
+
+
+@receiver(pre_save, sender=CategorieEtablissement)
+@receiver(pre_save, sender=CategorieProduit)
+@receiver(pre_save, sender=Etablissement)
+@receiver(pre_save, sender=Produit)
+def lire_images(sender, instance, update_fields=None, **kwargs):
+    champs = CHAMPS_IMAGES[sender]
+    if update_fields is not None:
+        champs = [champ for champ in champs if champ in update_fields]
+    instance._images_avant = {}
+    if instance.pk and champs:
+        instance._images_avant = sender.objects.filter(pk=instance.pk).values(*champs).first() or {}
+
+    for champ, avant in instance._images_avant.items():
+        fichier = getattr(instance, champ)
+        if not avant or not fichier or fichier._committed:
+            continue
+        nom = fichier.storage.nom_pour(fichier.field.generate_filename(instance, fichier.name), fichier.file)
+        if nom == avant:
+            # Même contenu que le fichier déjà désigné : ni écriture ni
+            # nouvelle référence (rien ne serait libéré en retour).
+            fichier.name = nom
+            fichier._committed = True
+
+
+@receiver(post_save, sender=CategorieEtablissement)
+@receiver(post_save, sender=CategorieProduit)
+@receiver(post_save, sender=Etablissement)
+@receiver(post_save, sender=Produit)
+def liberer_images_remplacees(sender, instance, **kwargs):
+    for champ, nom in getattr(instance, '_images_avant', {}).items():
+        fichier = getattr(instance, champ)
+        if nom and nom != fichier.name:
+            _liberer(fichier, nom)
+
+
+@receiver(post_delete, sender=CategorieEtablissement)
+@receiver(post_delete, sender=CategorieProduit)
+@receiver(post_delete, sender=Etablissement)
+@receiver(post_delete, sender=Produit)
+def liberer_images(sender, instance, **kwargs):
+    for champ in CHAMPS_IMAGES[sender]:
+        fichier = getattr(instance, champ)
+        if fichier:
+            _liberer(fichier, fichier.name)
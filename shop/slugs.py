@@ -0,0 +1,49 @@
+from base.cache import bump_version, get_version
+from . import models
+
+
+SLUGS_CACHE = 'slugs'
+
+# Type → modèle, dans l'ordre de priorité si un même slug est partagé.
+TYPES = {
+    'categorie_produit': models.CategorieProduit,
+    'categorie_etab': models.CategorieEtablissement,
+    'produit': models.Produit,
+}
+CATEGORIES = ('categorie_produit', 'categorie_etab')
+
+# Table du processus : {slug: {type: pk}}, valable pour une version de SLUGS_CACHE.
+_registre = {'version': None, 'table': {}}
+
+
+def _construire():
+    table = {}
+    for type_, modele in TYPES.items():
+        for pk, slug in modele.objects.exclude(slug=None).values_list('pk', 'slug').iterator(chunk_size=2000):
+            table.setdefault(slug, {})[type_] = pk
+    return table
+
+
+def invalider():
+    """À appeler quand un slug apparaît ou disparaît : chaque processus reconstruira sa table."""
+    bump_version(SLUGS_CACHE)
+
+
+def resoudre(slug, types=CATEGORIES):
+    """Retourne (type, pk) du premier type de `types` portant ce slug, ou None.
+
+    La table est gardée en mémoire : une résolution ne coûte aucune requête
+    tant que la version de SLUGS_CACHE n'a pas changé.
+    """
+    version = get_version(SLUGS_CACHE)
+    if _registre['version'] != version:
+        _registre['table'] = _construire()
+        _registre['version'] = version
+
+    trouves = _registre['table'].get(slug)
+    if not trouves:
+        return None
+    for type_ in types:
+        if type_ in trouves:
+            return type_, trouves[type_]
+    return None
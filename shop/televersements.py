@@ -0,0 +1,169 @@
+import io
+import logging
+import os
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+# Formats acceptés et taille maximale (px) du plus grand côté après traitement.
+FORMATS_ACCEPTES = ('JPEG', 'PNG', 'WEBP')
+COTE_MAX = 2560
+# Au-delà, l'image est refusée avant d'être décodée (bombe de décompression).
+PIXELS_MAX = 40_000_000
+
+# Champs image que les marchands téléversent.
+IMAGES_PRODUIT = ('image', 'image_2', 'image_3')
+IMAGES_ETABLISSEMENT = ('logo', 'couverture')
+
+EN_COURS = (models.ImageEnAttente.EN_ATTENTE, models.ImageEnAttente.EN_COURS)
+
+# Une image réservée depuis plus longtemps appartient à un worker arrêté en
+# cours de route : elle est remise en file, au plus TENTATIVES_MAX fois.
+DELAI_TRAITEMENT = timedelta(minutes=10)
+TENTATIVES_MAX = 3
+
+
+class ImageRefusee(Exception):
+    pass
+
+
+def mettre_en_attente(objet, fichiers, champs):
+    """Dépose les fichiers téléversés dans la zone d'attente, sans les décoder.
+
+    `fichiers` est request.FILES ; seuls les `champs` présents sont pris.
+    Le traitement (validation, EXIF, recompression, variantes) est fait
+    plus tard par traiter_images().
+    """
+    cle = 'produit' if isinstance(objet, models.Produit) else 'etablissement'
+    attentes = []
+    for champ in champs:
+        if champ in fichiers:
+            # Un nouvel envoi remplace le refus du précédent
+            models.ImageEnAttente.objects.filter(
+                champ=champ, statut=models.ImageEnAttente.REFUSEE, **{cle: objet},
+            ).delete()
+            attentes.append(models.ImageEnAttente.objects.create(
+                champ=champ, fichier=fichiers[champ], **{cle: objet},
+            ))
+    return attentes
+
+
+def _recompresser(fichier):
+    try:
+        with Image.open(fichier) as image:
+            image.verify()
+        fichier.seek(0)
+        image = Image.open(fichier)
+        format = image.format
+        if format not in FORMATS_ACCEPTES:
+            raise ImageRefusee("Format non accepté : %s" % format)
+        if image.width * image.height > PIXELS_MAX:
+            raise ImageRefusee("Image trop grande")
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((COTE_MAX, COTE_MAX), Image.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError) as erreur:
+        raise ImageRefusee("Image illisible") from erreur
+
+    # Réenregistrer sans les métadonnées retire l'EXIF (position GPS comprise).
+    contenu = io.BytesIO()
+    if format == 'PNG':
+        image.save(contenu, format='PNG', optimize=True)
+        extension = 'png'
+    else:
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(contenu, format='JPEG', quality=85, optimize=True, progressive=True)
+        extension = 'jpg'
+    return contenu.getvalue(), extension
+
+
+def _refuser(attente, erreur):
+    attente.fichier.storage.delete(attente.fichier.name)
+    attente.statut = models.ImageEnAttente.REFUSEE
+    attente.erreur = erreur
+    attente.save(update_fields=['statut', 'erreur', 'date_update'])
+
+
+def traiter(attente):
+    """Traite une image réservée : remplace le fichier du champ puis enregistre l'objet.
+
+    L'enregistrement déclenche les signaux habituels ; les variantes sont
+    créées ensuite par le même cron (base.images). Une image traitée sort de la file ; une image
+    refusée y reste, avec la raison, pour être signalée au marchand.
+    """
+    objet = attente.produit or attente.etablissement
+    try:
+        with attente.fichier.open('rb') as fichier:
+            contenu, extension = _recompresser(fichier)
+    except ImageRefusee as erreur:
+        _refuser(attente, str(erreur))
+        return
+
+    racine, _ = os.path.splitext(os.path.basename(attente.fichier.name))
+    # Enregistré par save(), comme un envoi de formulaire (voir shop.signals.lire_images)
+    setattr(objet, attente.champ, ContentFile(contenu, name='%s.%s' % (racine, extension)))
+    objet.save(update_fields=[attente.champ, 'date_update'])
+    attente.fichier.delete(save=False)
+    attente.delete()
+
+
+def reprendre_bloquees():
+    """Remet en file les images restées réservées après l'arrêt d'un worker.
+
+    Au-delà de TENTATIVES_MAX, l'image est refusée et son fichier supprimé.
+    Retourne le nombre d'images remises en file.
+    """
+    bloquees = models.ImageEnAttente.objects.filter(
+        statut=models.ImageEnAttente.EN_COURS, date_update__lt=timezone.now() - DELAI_TRAITEMENT,
+    )
+    for attente in bloquees.filter(tentatives__gte=TENTATIVES_MAX):
+        _refuser(attente, "Traitement interrompu")
+    return bloquees.update(statut=models.ImageEnAttente.EN_ATTENTE, date_update=timezone.now())
+
+
+def traiter_images(limite=50):
+    """Traite les images en attente, les plus anciennes d'abord. Retourne le nombre traité.
+
+    Chaque image est réservée par un UPDATE conditionnel : plusieurs
+    processus peuvent tourner en même temps sans traiter deux fois la même.
+    Les réservations abandonnées sont d'abord reprises (reprendre_bloquees).
+    """
+    reprendre_bloquees()
+    attentes = models.ImageEnAttente.objects.filter(statut=models.ImageEnAttente.EN_ATTENTE)
+    nombre = 0
+    for id in attentes.order_by('date_add').values_list('id', flat=True)[:limite]:
+        reservee = attentes.filter(id=id).update(
+            statut=models.ImageEnAttente.EN_COURS, tentatives=F('tentatives') + 1, date_update=timezone.now(),
+        )
+        if not reservee:
+            continue
+        attente = models.ImageEnAttente.objects.select_related('produit', 'etablissement').get(id=id)
+        try:
+            traiter(attente)
+        except Exception:
+            logger.exception("Traitement de l'image %s impossible", id)
+            _refuser(attente, "Erreur de traitement")
+        nombre += 1
+    return nombre
+
+
+def avec_etat_images(produits):
+    """Annote les produits avec le nombre d'images en cours de traitement et refusées."""
+    return produits.annotate(
+        images_en_cours=Count('images_en_attente', filter=Q(images_en_attente__statut__in=EN_COURS)),
+        images_refusees=Count('images_en_attente', filter=Q(images_en_attente__statut=models.ImageEnAttente.REFUSEE)),
+    )
+
+
+def etat_images(objet):
+    """{champ: ImageEnAttente} des images de `objet` encore en file ou refusées."""
+    cle = 'produit' if isinstance(objet, models.Produit) else 'etablissement'
+    return {attente.champ: attente for attente in models.ImageEnAttente.objects.filter(**{cle: objet}).order_by('date_add')}
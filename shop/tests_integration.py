@@ -1,15 +1,23 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.core.files.storage import default_storage
+from django.utils import timezone
 from shop.models import (
     CategorieEtablissement, CategorieProduit,
-    Etablissement, Produit, Favorite
+    Etablissement, Produit, Favorite, ImageEnAttente
 )
 from customer.models import Customer, Panier, ProduitPanier, Commande
+from shop.televersements import mettre_en_attente, traiter_images
+from base.images import chemin_variante, generer_variantes_en_attente
+from base.storage import stockage_contenu
 from cities_light.models import City, Country
 from django.core.files.uploadedfile import SimpleUploadedFile
 from PIL import Image
 import io
+import os
+import shutil
+import tempfile
 from datetime import datetime, timedelta
 
 
@@ -277,3 +285,221 @@ class TestCoherenceDonnees(BaseShopIntegrationTestCase):
         self.assertFalse(
             Produit.objects.filter(id=produit.id).exists()
         )
+
+
+# =====================================================
+# FICHIERS ENVOYÉS — MÉDIAS TEMPORAIRES
+# =====================================================
+
+class BaseMediaIntegrationTestCase(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        reglages = override_settings(MEDIA_ROOT=self.media)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+
+        self.client = Client()
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123"
+        )
+        cat_etab = CategorieEtablissement.objects.create(
+            nom="Market", status=True
+        )
+        etablissement = Etablissement.objects.create(
+            user=vendeur, nom="Shop", nom_du_responsable="N",
+            prenoms_duresponsable="P", categorie=cat_etab,
+            adresse="T", contact_1="07", email="shop@test.com",
+            logo="logo.jpg", couverture="couverture.jpg", status=True
+        )
+        self.cat_prod = CategorieProduit.objects.create(
+            nom="Tech", categorie=cat_etab, status=True
+        )
+        self.produit, self.autre, self.troisieme = [
+            Produit.objects.create(
+                nom=nom, prix=1000, quantite=5, categorie=self.cat_prod,
+                etablissement=etablissement, status=True
+            )
+            for nom in ("Produit", "Autre", "Troisième")
+        ]
+
+
+# =====================================================
+# FILE DE TRAITEMENT DES IMAGES
+# =====================================================
+
+class TestIntegrationFileImages(BaseMediaIntegrationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username="vendeur", password="Pass123")
+
+    def _photo(self, nom="photo.jpg", taille=(3000, 200)):
+        exif = Image.Exif()
+        exif[0x010F] = "Telephone"  # Make
+        buf = io.BytesIO()
+        Image.new("RGB", taille, (20, 120, 20)).save(buf, format="JPEG", exif=exif)
+        return SimpleUploadedFile(nom, buf.getvalue(), content_type="image/jpeg")
+
+    def test_ajout_article_sans_traitement_dans_la_requete(self):
+        response = self.client.post(reverse("ajout-article"), {
+            "nom": "Nouveau", "description": "D", "prix": 1000, "quantite": 2,
+            "categorie": self.cat_prod.id, "image": self._photo(), "image_2": self._photo(),
+        })
+
+        self.assertEqual(response.status_code, 302)
+        produit = Produit.objects.get(nom="Nouveau")
+        self.assertEqual(produit.image.name, "b-1.jpg")
+        self.assertEqual(produit.images_en_attente.count(), 2)
+        self.assertContains(self.client.get(reverse("article-detail")), "Images en cours de traitement")
+
+    def test_traitement_par_le_worker(self):
+        mettre_en_attente(self.produit, {"image": self._photo()}, ("image",))
+
+        self.assertEqual(traiter_images(), 1)
+        # Puis les variantes, dans le même cron
+        self.assertEqual(generer_variantes_en_attente(stockage_contenu), 1)
+
+        self.produit.refresh_from_db()
+        with default_storage.open(self.produit.image.name) as fichier:
+            image = Image.open(fichier)
+            self.assertEqual(image.width, 2560)
+            self.assertEqual(len(image.getexif()), 0)
+        self.assertTrue(default_storage.exists(chemin_variante(self.produit.image.name, 270, "webp")))
+        self.assertFalse(ImageEnAttente.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media, "attente", "images")), [])
+
+    def test_fichier_non_image_refuse(self):
+        faux = SimpleUploadedFile("evil.jpg", b"<?php echo 'hack'; ?>", content_type="image/jpeg")
+        mettre_en_attente(self.produit, {"image": faux}, ("image",))
+
+        traiter_images()
+
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.image.name, "b-1.jpg")
+        attente = ImageEnAttente.objects.get()
+        self.assertEqual(attente.statut, ImageEnAttente.REFUSEE)
+        self.assertContains(
+            self.client.get(reverse("modifier", args=[self.produit.id])), "Image refusée"
+        )
+
+    def test_image_traitee_une_seule_fois(self):
+        mettre_en_attente(self.produit, {"image": self._photo()}, ("image",))
+        ImageEnAttente.objects.update(statut=ImageEnAttente.EN_COURS)
+
+        self.assertEqual(traiter_images(), 0)
+
+    def _abandonner(self, tentatives):
+        mettre_en_attente(self.produit, {"image": self._photo()}, ("image",))
+        ImageEnAttente.objects.update(
+            statut=ImageEnAttente.EN_COURS, tentatives=tentatives,
+            date_update=timezone.now() - timedelta(hours=1)
+        )
+
+    def test_reservation_abandonnee_reprise(self):
+        self._abandonner(1)
+
+        self.assertEqual(traiter_images(), 1)
+        self.assertFalse(ImageEnAttente.objects.exists())
+
+    def test_abandons_repetes_refuses(self):
+        self._abandonner(3)
+
+        self.assertEqual(traiter_images(), 0)
+        attente = ImageEnAttente.objects.get()
+        self.assertEqual(attente.statut, ImageEnAttente.REFUSEE)
+        self.assertEqual(attente.erreur, "Traitement interrompu")
+        self.assertEqual(os.listdir(os.path.join(self.media, "attente", "images")), [])
+
+
+# =====================================================
+# STOCKAGE ADRESSÉ PAR LE CONTENU
+# =====================================================
+
+class TestIntegrationStockageContenu(BaseMediaIntegrationTestCase):
+
+    def _photo(self, couleur=(10, 10, 200)):
+        buf = io.BytesIO()
+        Image.new("RGB", (300, 200), couleur).save(buf, format="JPEG")
+        return SimpleUploadedFile("IMG_0001.JPG", buf.getvalue(), content_type="image/jpeg")
+
+    def _fichiers(self):
+        dossier = os.path.join(self.media, "produis", "images")
+        return [os.path.join(racine, nom) for racine, _, noms in os.walk(dossier) for nom in noms]
+
+    def test_envois_identiques_ecrits_une_fois(self):
+        self.produit.image = self._photo()
+        self.produit.image_2 = self._photo()
+        self.produit.save()
+        self.autre.image = self._photo()
+        self.autre.save()
+
+        nom = self.produit.image.name
+        self.assertEqual(self.produit.image_2.name, nom)
+        self.assertEqual(self.autre.image.name, nom)
+        self.assertEqual(len(self._fichiers()), 1)
+        self.assertEqual(stockage_contenu.references(nom), 3)
+
+    def test_dossiers_repartis_par_empreinte(self):
+        self.produit.image = self._photo()
+        self.produit.save()
+
+        self.assertRegex(
+            self.produit.image.name,
+            r"^produis/images/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{28}\.jpg$",
+        )
+
+    def test_fichier_efface_avec_sa_derniere_reference(self):
+        self.produit.image = self._photo()
+        self.produit.save()
+        self.autre.image = self._photo()
+        self.autre.save()
+        nom = self.produit.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produit.image = self._photo(couleur=(0, 0, 0))
+            self.produit.save()
+        self.assertTrue(default_storage.exists(nom))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autre.delete()
+        self.assertFalse(default_storage.exists(nom))
+        self.assertFalse(default_storage.exists(chemin_variante(nom, 270, "webp")))
+        self.assertEqual(stockage_contenu.references(nom), 0)
+
+    def test_meme_contenu_renvoye_sans_nouvelle_reference(self):
+        self.produit.image = self._photo()
+        self.produit.save()
+        nom = self.produit.image.name
+
+        produit = Produit.objects.get(id=self.produit.id)
+        produit.image = self._photo()
+        produit.save()
+
+        self.assertEqual(produit.image.name, nom)
+        self.assertEqual(stockage_contenu.references(nom), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            produit.image = self._photo(couleur=(0, 0, 0))
+            produit.save()
+        self.assertFalse(default_storage.exists(nom))
+
+    def test_fichier_reecrit_apres_sa_liberation(self):
+        nom = stockage_contenu.save("produis/images/a.jpg", self._photo())
+        self.assertTrue(stockage_contenu.delete(nom))
+        self.assertFalse(default_storage.exists(nom))
+
+        self.assertEqual(stockage_contenu.save("produis/images/b.jpg", self._photo()), nom)
+
+        self.assertTrue(default_storage.exists(nom))
+        self.assertEqual(stockage_contenu.references(nom), 1)
+
+    def test_fichier_hors_compteur_conserve(self):
+        # Image par défaut, ou fichier enregistré avant ce stockage
+        default_storage.save("b-1.jpg", self._photo())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.troisieme.delete()
+
+        self.assertTrue(default_storage.exists("b-1.jpg"))
@@ -3,15 +3,30 @@ from django.contrib.auth.models import User
 from django.urls import reverse
 from django.db import connection
 from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.template import Context, Template
 from shop.models import (
     CategorieEtablissement, CategorieProduit,
-    Etablissement, Produit, Favorite
+    DealAssocie, Etablissement, Facette, Produit, Favorite
 )
-from customer.models import Customer
+from customer.models import Commande, Customer, ProduitPanier
+from shop.utils import balayer_promotions, date_catalogue, get_category_tree, paginer_produits
+from shop.cron import BalayerPromotionsCronJob
+from shop.associes import completer, deals_associes, enregistrer_commande
+from shop.recherche import rechercher_produits
+from shop.slugs import resoudre
+from base.images import chemin_variante, generer_variantes, generer_variantes_en_attente
+from base.storage import stockage_contenu
+from shop.facettes import barre_facettes, get_facettes, reconstruire
 from cities_light.models import City, Country
 from django.core.files.uploadedfile import SimpleUploadedFile
 from PIL import Image
 import io
+import datetime
+import shutil
+import tempfile
 
 
 class BaseShopPerformanceTestCase(TestCase):
@@ -177,3 +192,877 @@ class TestPerformanceDashboard(BaseShopPerformanceTestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertLessEqual(len(ctx), 15)
+
+
+# =====================================================
+# ARBRE DES CATÉGORIES — CACHE
+# =====================================================
+
+class TestPerformanceArbreCategories(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123"
+        )
+        for i in range(5):
+            cat_etab = CategorieEtablissement.objects.create(
+                nom=f"Market {i}", status=True
+            )
+            etablissement = Etablissement.objects.create(
+                user=vendeur if i == 0 else User.objects.create_user(
+                    username=f"vendeur{i}", password="Pass123"
+                ),
+                nom="Shop", nom_du_responsable="N",
+                prenoms_duresponsable="P", categorie=cat_etab,
+                adresse="T", contact_1="07", email="shop@test.com",
+                logo="logo.jpg", couverture="couverture.jpg", status=True
+            )
+            for j in range(3):
+                cat_prod = CategorieProduit.objects.create(
+                    nom=f"Tech {i}-{j}", categorie=cat_etab, status=True
+                )
+                Produit.objects.create(
+                    nom=f"P{i}-{j}", prix=1000, quantite=5,
+                    categorie=cat_prod, etablissement=etablissement,
+                    status=True
+                )
+
+    def test_arbre_construit_en_deux_requetes(self):
+        with self.assertNumQueries(2):
+            arbre = get_category_tree()
+
+        self.assertEqual(len(arbre), 5)
+        self.assertEqual(arbre[0]["nb_produits"], 3)
+        self.assertEqual(len(arbre[0]["enfants"]), 3)
+        self.assertEqual(arbre[0]["enfants"][0]["nb_produits"], 1)
+
+    def test_arbre_servi_depuis_le_cache(self):
+        get_category_tree()
+        with self.assertNumQueries(0):
+            get_category_tree()
+
+    def test_arbre_invalide_par_un_produit(self):
+        arbre = get_category_tree()
+        cat_prod = CategorieProduit.objects.get(nom="Tech 0-0")
+        Produit.objects.create(
+            nom="Nouveau", prix=1000, quantite=5, categorie=cat_prod,
+            etablissement=Etablissement.objects.get(user__username="vendeur"),
+            status=True
+        )
+
+        arbre = get_category_tree()
+        self.assertEqual(arbre[0]["nb_produits"], 4)
+
+
+
+# =====================================================
+# PAGINATION PAR CURSEUR
+# =====================================================
+
+class TestPerformancePaginationCurseur(TestCase):
+
+    def setUp(self):
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123"
+        )
+        cat_etab = CategorieEtablissement.objects.create(
+            nom="Market", status=True
+        )
+        etablissement = Etablissement.objects.create(
+            user=vendeur, nom="Shop", nom_du_responsable="N",
+            prenoms_duresponsable="P", categorie=cat_etab,
+            adresse="T", contact_1="07", email="shop@test.com",
+            logo="logo.jpg", couverture="couverture.jpg", status=True
+        )
+        self.cat_prod = CategorieProduit.objects.create(
+            nom="Tech", categorie=cat_etab, status=True
+        )
+        aujourdhui = datetime.date.today()
+        # Prix en double pour vérifier le départage par id
+        for i in range(30):
+            Produit.objects.create(
+                nom=f"P{i}", prix=1000 + (i % 7) * 100, quantite=5,
+                categorie=self.cat_prod, etablissement=etablissement,
+                date_debut_promo=aujourdhui if i % 3 == 0 else None,
+                date_fin_promo=aujourdhui + datetime.timedelta(days=i % 4) if i % 3 == 0 else None,
+                prix_promotionnel=500, status=True
+            )
+
+    def _parcourir(self, tri):
+        produits = Produit.objects.filter(status=True)
+        vus, curseur = [], None
+        while True:
+            page = paginer_produits(produits, tri, curseur, taille=7)
+            vus.extend(page["produits"])
+            curseur = page["suivant"]
+            if curseur is None:
+                return vus
+
+    def test_parcours_complet_sans_doublon(self):
+        for tri in ("recent", "prix_asc", "prix_desc", "fin_promo"):
+            vus = self._parcourir(tri)
+            self.assertEqual(len(vus), 30, tri)
+            self.assertEqual(len({p.id for p in vus}), 30, tri)
+
+    def test_tri_sur_le_prix_effectif(self):
+        vus = self._parcourir("prix_asc")
+        prix = [p.prix_promotionnel if p.check_promotion else p.prix for p in vus]
+        self.assertEqual(prix, sorted(prix))
+        self.assertEqual(prix[0], 500)
+
+    def test_fin_promo_en_premier(self):
+        vus = self._parcourir("fin_promo")
+        en_promo = [p for p in vus if p.check_promotion]
+        self.assertEqual(vus[:len(en_promo)], en_promo)
+        fins = [p.date_fin_promo for p in en_promo]
+        self.assertEqual(fins, sorted(fins))
+
+    def test_page_en_une_requete(self):
+        premiere = paginer_produits(Produit.objects.filter(status=True), "prix_desc")
+        with self.assertNumQueries(1):
+            page = paginer_produits(
+                Produit.objects.filter(status=True), "prix_desc", premiere["suivant"]
+            )
+        self.assertEqual(len(page["produits"]), 12)
+
+    def test_curseur_invalide_ignore(self):
+        page = paginer_produits(Produit.objects.all(), "recent", "falsifie")
+        self.assertEqual(len(page["produits"]), 12)
+
+    def test_fragment_json_page_suivante(self):
+        premiere = paginer_produits(Produit.objects.filter(status=True), "recent")
+        response = self.client.get(
+            reverse("produits_page"),
+            {"tri": "recent", "apres": premiere["suivant"], "slug": self.cat_prod.slug}
+        )
+        datas = response.json()
+        self.assertTrue(datas["success"])
+        self.assertIn("single-feature", datas["grille"])
+        self.assertIsNotNone(datas["suivant"])
+
+    def test_page_shop_limitee_et_triee(self):
+        response = self.client.get(reverse("shop"), {"tri": "prix_asc"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["produits"]), 12)
+        self.assertContains(response, "Voir plus de deals")
+
+
+
+# =====================================================
+# RECHERCHE PLEIN TEXTE
+# =====================================================
+
+class TestPerformanceRecherche(TestCase):
+
+    def setUp(self):
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123"
+        )
+        self.cat_etab = CategorieEtablissement.objects.create(
+            nom="Restaurants", status=True
+        )
+        self.etablissement = Etablissement.objects.create(
+            user=vendeur, nom="Chez Tantie", nom_du_responsable="N",
+            prenoms_duresponsable="P", categorie=self.cat_etab,
+            adresse="T", contact_1="07", email="shop@test.com",
+            logo="logo.jpg", couverture="couverture.jpg", status=True
+        )
+        self.cat_prod = CategorieProduit.objects.create(
+            nom="Grillades", categorie=self.cat_etab, status=True
+        )
+        self.poulet = self._produit(
+            "Poulet braisé", "Un poulet <b>entier</b> braisé au feu de bois"
+        )
+        self._produit("Massage relaxant", "Une heure de détente")
+
+    def _produit(self, nom, description, status=True):
+        return Produit.objects.create(
+            nom=nom, description=description, description_deal="Offre",
+            prix=1000, quantite=5, categorie=self.cat_prod,
+            etablissement=self.etablissement, status=status
+        )
+
+    def _ids(self, terme):
+        return [p.id for p, _ in rechercher_produits(terme)["resultats"]]
+
+    def test_recherche_nom_sans_accents_et_prefixe(self):
+        self.assertEqual(self._ids("braise"), [self.poulet.id])
+        self.assertEqual(self._ids("poul"), [self.poulet.id])
+
+    def test_recherche_etablissement_et_categorie(self):
+        self.assertEqual(len(self._ids("tantie")), 2)
+        self.assertEqual(len(self._ids("grillades")), 2)
+
+    def test_classement_par_pertinence(self):
+        self._produit("Brochettes", "Servies avec du poulet")
+        self.assertEqual(self._ids("poulet")[0], self.poulet.id)
+
+    def test_extrait_surligne_et_echappe(self):
+        _, extrait = rechercher_produits("entier")["resultats"][0]
+        self.assertIn("<mark>entier</mark>", extrait)
+        self.assertIn("&lt;b&gt;", extrait)
+
+    def test_syntaxe_fts_neutralisee(self):
+        self.assertEqual(self._ids('"poulet"*)(:'), [self.poulet.id])
+        self.assertEqual(self._ids("!!!"), [])
+
+    def test_index_synchronise(self):
+        self._produit("Poulet inactif", "Désactivé", status=False)
+        self.assertEqual(self._ids("inactif"), [])
+
+        self.poulet.nom = "Poisson grillé"
+        self.poulet.save()
+        self.assertEqual(self._ids("poisson"), [self.poulet.id])
+
+        self.etablissement.nom = "Maquis Bon Goût"
+        self.etablissement.save()
+        self.assertEqual(len(self._ids("maquis")), 2)
+
+        self.poulet.delete()
+        self.assertEqual(self._ids("poisson"), [])
+
+    def test_pagination_en_deux_requetes(self):
+        for i in range(15):
+            self._produit(f"Poulet {i}", "Poulet")
+
+        with self.assertNumQueries(2):
+            page = rechercher_produits("poulet", page=2)
+        self.assertEqual(len(page["resultats"]), 4)
+        self.assertIsNone(page["suivante"])
+        self.assertEqual(rechercher_produits("poulet")["suivante"], 2)
+
+    def test_page_recherche(self):
+        response = self.client.get(reverse("recherche"), {"q": "poulet"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Poulet braisé")
+
+
+
+# =====================================================
+# FACETTES — COMPTEURS PRÉCALCULÉS
+# =====================================================
+
+class TestPerformanceFacettes(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        country = Country.objects.create(name="CI", code2="CI", code3="CIV")
+        self.abidjan = City.objects.create(name="Abidjan", country=country)
+        self.bouake = City.objects.create(name="Bouaké", country=country)
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123"
+        )
+        self.cat_etab = CategorieEtablissement.objects.create(
+            nom="Market", status=True
+        )
+        self.etablissement = Etablissement.objects.create(
+            user=vendeur, nom="Shop", nom_du_responsable="N",
+            prenoms_duresponsable="P", categorie=self.cat_etab,
+            ville=self.abidjan, adresse="T", contact_1="07",
+            email="shop@test.com", logo="logo.jpg",
+            couverture="couverture.jpg", status=True
+        )
+        self.cat_prod = CategorieProduit.objects.create(
+            nom="Tech", categorie=self.cat_etab, status=True
+        )
+        aujourdhui = datetime.date.today()
+        self.promo = self._produit(
+            prix=20000, prix_promotionnel=3000, super_deal=True,
+            date_debut_promo=aujourdhui,
+            date_fin_promo=aujourdhui + datetime.timedelta(days=2)
+        )
+        for prix in (2000, 7000, 60000):
+            self._produit(prix=prix)
+
+    def _produit(self, **kwargs):
+        return Produit.objects.create(
+            nom="P", quantite=5, categorie=self.cat_prod,
+            etablissement=self.etablissement, status=True, **kwargs
+        )
+
+    def _nombre(self, facette, valeur):
+        ligne = Facette.objects.filter(contexte="", facette=facette, valeur=str(valeur)).first()
+        return ligne.nombre if ligne else 0
+
+    def test_compteurs_maintenus_a_l_ecriture(self):
+        self.assertEqual(self._nombre("categorie", self.cat_prod.id), 4)
+        self.assertEqual(self._nombre("ville", self.abidjan.id), 4)
+        self.assertEqual(self._nombre("promo", 1), 1)
+        self.assertEqual(self._nombre("super_deal", 1), 1)
+        # Prix effectif : 3000 et 2000 sous 5000
+        self.assertEqual(self._nombre("prix", 0), 2)
+
+        self.promo.status = False
+        self.promo.save()
+        self.assertEqual(self._nombre("promo", 1), 0)
+        self.assertEqual(self._nombre("categorie", self.cat_prod.id), 3)
+
+        Produit.objects.filter(prix=60000).get().delete()
+        self.assertEqual(self._nombre("prix", 4), 0)
+
+    def test_changement_de_ville_du_marchand(self):
+        self.etablissement.ville = self.bouake
+        self.etablissement.save()
+
+        self.assertEqual(self._nombre("ville", self.abidjan.id), 0)
+        self.assertEqual(self._nombre("ville", self.bouake.id), 4)
+
+    def test_reconstruction_identique(self):
+        self.promo.status = False
+        self.promo.save()
+        self.etablissement.ville = self.bouake
+        self.etablissement.save()
+        champs = ("contexte", "facette", "valeur", "nombre")
+        avant = set(Facette.objects.filter(nombre__gt=0).values_list(*champs))
+        reconstruire()
+        apres = set(Facette.objects.values_list(*champs))
+        self.assertEqual(avant, apres)
+
+    def test_facettes_servies_depuis_le_cache(self):
+        get_facettes()
+        with self.assertNumQueries(0):
+            facettes = get_facettes()
+        self.assertEqual(facettes["ville"][0]["libelle"], "Abidjan")
+
+    def test_volume_sans_effet_sur_les_facettes(self):
+        with CaptureQueriesContext(connection) as petit:
+            get_facettes()
+        for prix in range(50):
+            self._produit(prix=1000 + prix)
+        cache.clear()
+        with CaptureQueriesContext(connection) as grand:
+            get_facettes()
+        self.assertEqual(len(petit), len(grand))
+
+    def test_filtres_sur_la_page_shop(self):
+        response = self.client.get(reverse("shop"), {"promo": "1"})
+        self.assertEqual([p.id for p in response.context["produits"]], [self.promo.id])
+
+        response = self.client.get(reverse("shop"), {"prix": "1", "ville": self.abidjan.id})
+        self.assertEqual([p.prix for p in response.context["produits"]], [7000])
+        self.assertContains(response, "5000 à 10000 F")
+
+        response = self.client.get(reverse("shop"), {"prix": "99", "super_deal": "oui"})
+        self.assertEqual(len(response.context["produits"]), 4)
+
+    def _barre(self, filtres, *args):
+        return {
+            groupe["titre"]: {v["libelle"]: v["nombre"] for v in groupe["valeurs"]}
+            for groupe in barre_facettes(filtres, *args)
+        }
+
+    def test_compteurs_sous_les_filtres_actifs(self):
+        barre = self._barre({"promo": "1"})
+
+        self.assertEqual(barre["Prix"], {"Moins de 5000 F": 1})
+        self.assertEqual(barre["Villes"], {"Abidjan": 1})
+        # La facette active est comptée sans son propre filtre
+        self.assertEqual(barre["Promotion"], {"Promotion en cours": 1})
+
+        barre = self._barre({"prix": "0"})
+
+        self.assertEqual(barre["Prix"]["Plus de 50000 F"], 1)
+        self.assertEqual(barre["Villes"], {"Abidjan": 2})
+
+    def test_compteurs_filtres_sans_parcours_des_deals(self):
+        for prix in range(50):
+            self._produit(prix=1000 + prix)
+        cache.clear()
+        get_facettes()
+
+        with CaptureQueriesContext(connection) as ctx:
+            barre = self._barre({"promo": "1", "ville": str(self.abidjan.id)})
+
+        self.assertEqual(len(ctx), 1)
+        self.assertNotIn("shop_produit", ctx.captured_queries[0]["sql"])
+        # Sous plusieurs filtres, la valeur la plus rare (promo) donne les compteurs
+        self.assertEqual(barre["Prix"], {"Moins de 5000 F": 1})
+        self.assertEqual(barre["Villes"], {"Abidjan": 1})
+
+    def test_compteurs_filtres_en_cache(self):
+        self._barre({"promo": "1"})
+        with self.assertNumQueries(0):
+            self._barre({"promo": "1"})
+
+        self.promo.status = False
+        self.promo.save()
+
+        self.assertNotIn("Prix", self._barre({"promo": "1"}))
+
+    def test_compteurs_de_la_categorie_affichee(self):
+        autre = CategorieProduit.objects.create(nom="Mode", categorie=self.cat_etab, status=True)
+        Produit.objects.create(
+            nom="Robe", prix=8000, quantite=5, categorie=autre,
+            etablissement=self.etablissement, status=True
+        )
+
+        response = self.client.get(reverse("categorie", args=[autre.slug]))
+
+        barre = {g["titre"]: {v["libelle"]: v["nombre"] for v in g["valeurs"]} for g in response.context["facettes"]}
+        self.assertEqual(barre["Catégories"], {"Mode": 1})
+        self.assertEqual(barre["Prix"], {"5000 à 10000 F": 1})
+
+
+# =====================================================
+# PRIX EFFECTIF CALCULÉ PAR LA BASE
+# =====================================================
+
+class BasePrixTestCase(TestCase):
+
+    def setUp(self):
+        vendeur = User.objects.create_user(
+            username="vendeur", password="Pass123"
+        )
+        cat_etab = CategorieEtablissement.objects.create(
+            nom="Market", status=True
+        )
+        self.etablissement = Etablissement.objects.create(
+            user=vendeur, nom="Shop", nom_du_responsable="N",
+            prenoms_duresponsable="P", categorie=cat_etab,
+            adresse="T", contact_1="07", email="shop@test.com",
+            logo="logo.jpg", couverture="couverture.jpg", status=True
+        )
+        self.cat_prod = CategorieProduit.objects.create(
+            nom="Tech", categorie=cat_etab, status=True
+        )
+        aujourdhui = datetime.date.today()
+        jour = datetime.timedelta(days=1)
+        self.en_cours = self._produit("en_cours", aujourdhui - jour, aujourdhui + jour)
+        self.a_venir = self._produit("a_venir", aujourdhui + jour, aujourdhui + 2 * jour)
+        self.expiree = self._produit("expiree", aujourdhui - 2 * jour, aujourdhui - jour)
+        self.sans_promo = self._produit("sans_promo", None, None)
+
+    def _produit(self, nom, debut, fin):
+        return Produit.objects.create(
+            nom=nom, prix=1000, prix_promotionnel=400, quantite=5,
+            date_debut_promo=debut, date_fin_promo=fin,
+            categorie=self.cat_prod, etablissement=self.etablissement,
+            status=True
+        )
+
+
+class TestPerformancePrixEffectif(BasePrixTestCase):
+
+    def test_annotations_conformes_a_check_promotion(self):
+        for produit in Produit.objects.with_effective_price():
+            brut = Produit.objects.get(id=produit.id)
+            self.assertEqual(produit.en_promotion, brut.check_promotion, produit.nom)
+            self.assertEqual(produit.prix_effectif, brut.prix_de_vente, produit.nom)
+        self.assertEqual(
+            Produit.objects.with_effective_price().get(id=self.en_cours.id).prix_effectif, 400
+        )
+
+    def test_filtre_et_tri_en_sql(self):
+        produits = Produit.objects.with_effective_price()
+        self.assertEqual(
+            list(produits.filter(en_promotion=True).values_list("nom", flat=True)),
+            ["en_cours"]
+        )
+        self.assertEqual(produits.order_by("prix_effectif", "id").first(), self.en_cours)
+
+    def test_check_promotion_utilise_l_annotation(self):
+        produit = Produit.objects.with_effective_price().get(id=self.expiree.id)
+        produit.en_promotion = True
+        self.assertTrue(produit.check_promotion)
+
+    def test_with_effective_price_idempotent(self):
+        produits = Produit.objects.with_effective_price()
+        self.assertIs(produits.with_effective_price(), produits)
+
+
+# =====================================================
+# PRIX COURANT ENREGISTRÉ ET BALAYAGE DES PROMOTIONS
+# =====================================================
+
+class TestPerformanceBalayagePromotions(BasePrixTestCase):
+
+    def test_save_enregistre_prix_courant(self):
+        self.en_cours.refresh_from_db()
+        self.a_venir.refresh_from_db()
+        self.assertTrue(self.en_cours.promo_active)
+        self.assertEqual(self.en_cours.prix_courant, 400)
+        self.assertFalse(self.a_venir.promo_active)
+        self.assertEqual(self.a_venir.prix_courant, 1000)
+
+    def test_balayage_en_deux_update(self):
+        aujourdhui = datetime.date.today()
+        # Le jour change : la promotion à venir commence, celle en cours expire
+        Produit.objects.filter(id=self.a_venir.id).update(date_debut_promo=aujourdhui)
+        Produit.objects.filter(id=self.en_cours.id).update(
+            date_fin_promo=aujourdhui - datetime.timedelta(days=1)
+        )
+        Produit.objects.filter(id=self.sans_promo.id).update(promo_active=True)
+
+        with self.assertNumQueries(2):
+            bascules = balayer_promotions()
+
+        self.assertEqual(bascules, 3)
+        etats = dict(Produit.objects.values_list("nom", "prix_courant"))
+        self.assertEqual(etats, {
+            "en_cours": 1000, "a_venir": 400, "expiree": 1000, "sans_promo": 1000
+        })
+        self.assertEqual(balayer_promotions(), 0)
+
+    def test_cron_reconstruit_les_facettes(self):
+        Produit.objects.filter(id=self.a_venir.id).update(
+            date_debut_promo=datetime.date.today()
+        )
+        BalayerPromotionsCronJob().do()
+        self.assertEqual(Facette.objects.get(contexte="", facette="promo", valeur="1").nombre, 2)
+
+
+
+# =====================================================
+# DEALS ASSOCIÉS — CO-ACHATS
+# =====================================================
+
+class TestPerformanceDealsAssocies(BasePrixTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.autres = [
+            Produit.objects.create(
+                nom=f"P{i}", prix=1000 + i * 100, quantite=5,
+                categorie=self.cat_prod, etablissement=self.etablissement,
+                status=True
+            )
+            for i in range(4)
+        ]
+        client = User.objects.create_user(username="client", password="Pass123")
+        self.customer = Customer.objects.create(
+            user=client, adresse="T", contact_1="0708"
+        )
+
+    def _commander(self, *produits):
+        commande = Commande.objects.create(customer=self.customer, prix_total=0)
+        ProduitPanier.objects.bulk_create([
+            ProduitPanier(commande=commande, produit=produit)
+            for produit in produits
+        ])
+        enregistrer_commande(commande)
+
+    def test_co_achats_en_tete_puis_prix_proche(self):
+        p0, p1, p2, p3 = self.autres
+        self._commander(self.sans_promo, p3)
+        self._commander(self.sans_promo, p3, p2)
+        self._commander(self.sans_promo, p2)
+        self._commander(self.sans_promo, p3)
+
+        associes = deals_associes(self.sans_promo, nombre=4)
+
+        self.assertEqual(associes[:2], [p3, p2])
+        # Complété par les deals de même catégorie au prix le plus proche (1000)
+        self.assertEqual(associes[2].prix_courant, 1000)
+
+    def test_fiche_en_une_requete(self):
+        self._commander(self.sans_promo, self.autres[0])
+        with self.assertNumQueries(1):
+            associes = deals_associes(self.sans_promo)
+        self.assertEqual(associes[0], self.autres[0])
+        self.assertTrue(hasattr(associes[0], "en_promotion"))
+
+    def test_fiche_sans_top_k_en_lecture_seule(self):
+        with self.assertNumQueries(2):
+            associes = deals_associes(self.autres[0])
+        self.assertEqual(len(associes), 3)
+        self.assertNotIn(self.autres[0], associes)
+        self.assertFalse(DealAssocie.objects.exists())
+
+    def test_top_k_complete_par_le_cron(self):
+        attendus = deals_associes(self.autres[0])
+
+        self.assertEqual(completer(), Produit.objects.filter(status=True).count())
+        self.assertEqual(deals_associes(self.autres[0]), attendus)
+        self.assertEqual(completer(), 0)
+
+    def test_produit_sans_associe_non_repris(self):
+        seule = CategorieProduit.objects.create(nom="Seule", status=True)
+        isole = Produit.objects.create(
+            nom="Isolé", prix=1000, quantite=5, categorie=seule,
+            etablissement=self.etablissement, status=True
+        )
+        actifs = Produit.objects.filter(status=True).count()
+
+        for _ in range(actifs):
+            self.assertEqual(completer(limite=1), 1)
+
+        self.assertEqual(completer(limite=1), 0)
+        self.assertFalse(DealAssocie.objects.filter(produit=isole).exists())
+
+    def test_top_k_recalcule_apres_suppression(self):
+        completer()
+        retire = self.autres[1]
+        concernes = set(DealAssocie.objects.filter(associe=retire).values_list("produit_id", flat=True))
+
+        retire.delete()
+
+        self.assertEqual(completer(), len(concernes))
+
+    def test_deal_inactif_masque(self):
+        self._commander(self.sans_promo, self.autres[0])
+        Produit.objects.filter(id=self.autres[0].id).update(status=False)
+        self.assertNotIn(self.autres[0], deals_associes(self.sans_promo))
+
+    def test_page_detail(self):
+        response = self.client.get(reverse("product_detail", args=[self.sans_promo.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["produits"]), 3)
+
+
+# =====================================================
+# CACHE DE LA FICHE PRODUIT
+# =====================================================
+
+class TestPerformanceCacheFiche(BasePrixTestCase):
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.url = reverse("product_detail", args=[self.en_cours.slug])
+        self.client = Client(enforce_csrf_checks=True)
+
+    def test_visiteur_en_une_requete(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "en_cours")
+        self.assertNotContains(response, "<!--trou:")
+
+    def test_trous_propres_au_visiteur(self):
+        client = User.objects.create_user(username="client", password="Pass123")
+        Favorite.objects.create(user=client, produit=self.en_cours)
+        self.client.get(self.url)
+
+        connecte = Client()
+        connecte.login(username="client", password="Pass123")
+        response = connecte.get(self.url)
+
+        self.assertContains(response, 'zmdi zmdi-favorite"')
+        self.assertNotContains(self.client.get(self.url), 'zmdi zmdi-favorite"')
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+
+    def test_invalidation_a_la_modification(self):
+        self.client.get(self.url)
+
+        self.en_cours.description = "Nouvelle description"
+        self.en_cours.save()
+
+        self.assertContains(self.client.get(self.url), "Nouvelle description")
+
+    def test_produit_inconnu(self):
+        response = self.client.get(reverse("product_detail", args=["inconnu"]))
+        self.assertEqual(response.status_code, 404)
+
+
+# =====================================================
+# TABLE DES SLUGS
+# =====================================================
+
+class TestPerformanceSlugs(BasePrixTestCase):
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.cat_etab = self.cat_prod.categorie
+
+    def test_resolution_sans_requete(self):
+        resoudre(self.cat_prod.slug)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(resoudre(self.cat_prod.slug), ("categorie_produit", self.cat_prod.id))
+            self.assertEqual(resoudre(self.cat_etab.slug), ("categorie_etab", self.cat_etab.id))
+            self.assertEqual(resoudre(self.en_cours.slug, ("produit",)), ("produit", self.en_cours.id))
+            self.assertIsNone(resoudre("inconnu"))
+            self.assertIsNone(resoudre(self.en_cours.slug))
+
+    def test_table_rafraichie_a_la_creation(self):
+        resoudre(self.cat_prod.slug)
+
+        nouvelle = CategorieProduit.objects.create(nom="Maison", categorie=self.cat_etab, status=True)
+
+        self.assertEqual(resoudre(nouvelle.slug), ("categorie_produit", nouvelle.id))
+
+    def test_table_rafraichie_a_la_suppression(self):
+        slug = self.expiree.slug
+        resoudre(slug, ("produit",))
+
+        self.expiree.delete()
+
+        self.assertIsNone(resoudre(slug, ("produit",)))
+
+    def test_slug_inconnu_en_404(self):
+        self.assertEqual(self.client.get(reverse("categorie", args=["inconnu"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("product_detail", args=["inconnu"])).status_code, 404)
+
+    def test_page_categorie(self):
+        for slug in (self.cat_prod.slug, self.cat_etab.slug):
+            response = self.client.get(reverse("categorie", args=[slug]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context["produits"]), 4)
+
+
+# =====================================================
+# GET CONDITIONNEL SUR LE CATALOGUE
+# =====================================================
+
+class TestPerformanceGetConditionnel(BasePrixTestCase):
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.url = reverse("product_detail", args=[self.en_cours.slug])
+
+    def _etag(self):
+        # La première visite pose le cookie CSRF, qui entre dans l'ETag
+        self.client.get(self.url)
+        return self.client.get(self.url)["ETag"]
+
+    def test_page_inchangee_en_304_sans_requete(self):
+        etag = self._etag()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_last_modified_sans_cookie(self):
+        date = self.client.get(reverse("shop"))["Last-Modified"]
+        self.client.cookies.clear()
+
+        response = self.client.get(reverse("shop"), HTTP_IF_MODIFIED_SINCE=date)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_modification_du_catalogue(self):
+        etag = self._etag()
+
+        self.sans_promo.prix = 900
+        self.sans_promo.save()
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_propre_aux_cookies(self):
+        etag = self._etag()
+
+        self.client.cookies["csrftoken"] = "autre"
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_date_sans_parcours_des_tables(self):
+        self.client.get(reverse("shop"))
+        with self.assertNumQueries(0):
+            date_catalogue()
+
+    def test_client_connecte_sans_304(self):
+        User.objects.create_user(username="client", password="Pass123")
+        self.client.login(username="client", password="Pass123")
+
+        response = self.client.get(self.url)
+
+        self.assertFalse(response.has_header("ETag"))
+
+
+# =====================================================
+# VARIANTES DES IMAGES
+# =====================================================
+
+class TestPerformanceVariantesImages(BasePrixTestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        reglages = override_settings(MEDIA_ROOT=self.media)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        super().setUp()
+
+    def _photo(self, nom="photo.jpg", taille=(2000, 1500)):
+        buf = io.BytesIO()
+        Image.new("RGB", taille, (200, 30, 30)).save(buf, format="JPEG", quality=95)
+        return SimpleUploadedFile(nom, buf.getvalue(), content_type="image/jpeg")
+
+    def _televerser(self, photo):
+        self.en_cours.image = photo
+        self.en_cours.save()
+        return generer_variantes_en_attente(stockage_contenu)
+
+    def test_variantes_creees_hors_requete(self):
+        self.en_cours.image = self._photo()
+        self.en_cours.save()
+        nom = self.en_cours.image.name
+        self.assertFalse(default_storage.exists(chemin_variante(nom, 270, "webp")))
+
+        self.assertEqual(generer_variantes_en_attente(stockage_contenu), 1)
+
+        for largeur in (270, 540, 1080):
+            for format in ("webp", "jpeg"):
+                chemin = chemin_variante(nom, largeur, format)
+                self.assertTrue(default_storage.exists(chemin))
+                with default_storage.open(chemin) as fichier:
+                    self.assertEqual(Image.open(fichier).width, largeur)
+        self.assertLess(
+            default_storage.size(chemin_variante(nom, 270, "webp")),
+            default_storage.size(nom) / 10,
+        )
+        self.assertEqual(generer_variantes_en_attente(stockage_contenu), 0)
+
+    def test_variantes_non_refaites_si_la_source_ne_change_pas(self):
+        self._televerser(self._photo())
+
+        self.assertEqual(generer_variantes(self.en_cours.image.name), 0)
+
+    def test_pas_d_agrandissement(self):
+        self._televerser(self._photo(taille=(400, 300)))
+
+        with default_storage.open(chemin_variante(self.en_cours.image.name, 1080)) as fichier:
+            self.assertEqual(Image.open(fichier).width, 400)
+
+    def _rendre(self):
+        return Template(
+            "{% load images %}{% image_responsive produit.image alt=produit.nom %}"
+            "|{{ produit.image|variante:270 }}"
+        ).render(Context({"produit": self.en_cours}))
+
+    def test_srcset_dans_le_gabarit(self):
+        self._televerser(self._photo())
+
+        html = self._rendre()
+
+        self.assertIn('type="image/webp"', html)
+        self.assertIn("-270.webp 270w", html)
+        self.assertIn("-1080.jpg 1080w", html)
+        self.assertIn('alt="en_cours"', html)
+        self.assertIn("-270.jpg", html.split("|")[1])
+
+    def test_image_d_origine_sans_variantes(self):
+        self.en_cours.image = self._photo()
+        self.en_cours.save()
+        url = self.en_cours.image.url
+
+        html = self._rendre()
+
+        self.assertNotIn("srcset", html)
+        self.assertEqual(html, '<img src="%s" alt="en_cours" loading="lazy">|%s' % (url, url))
+
+        generer_variantes_en_attente(stockage_contenu)
+        self.assertIn("srcset", self._rendre())
+
+    def test_image_illisible_marquee_traitee(self):
+        nom = stockage_contenu.save("produis/images/faux.jpg", SimpleUploadedFile("faux.jpg", b"pas une image"))
+
+        self.assertEqual(generer_variantes_en_attente(stockage_contenu), 1)
+        self.assertEqual(generer_variantes_en_attente(stockage_contenu), 0)
+        self.assertFalse(default_storage.exists(chemin_variante(nom, 270)))
+
+    def test_commande_de_rattrapage(self):
+        nom = default_storage.save("produis/images/ancienne.jpg", self._photo())
+        Produit.objects.filter(id=self.en_cours.id).update(image=nom)
+
+        call_command("generer_variantes", stdout=io.StringIO())
+
+        self.assertTrue(default_storage.exists(chemin_variante(nom, 540, "webp")))
@@ -7,9 +7,12 @@ urlpatterns = [
     path('produit/<str:slug>', views.product_detail, name="product_detail"),
     path('cart', views.cart, name="cart"),
     path('checkout', views.checkout, name="checkout"),
+    path('produits/page', views.produits_page, name="produits_page"),
+    path('recherche/', views.recherche, name="recherche"),
     path('<str:slug>', views.single, name="categorie"),
     path('paiement/success', views.paiement_success, name="paiement_success"),
     path('paiement/details', views.post_paiement_details, name="paiement_detail"),
+    path('paiement/reserver', views.reserver_paiement, name="reserver_paiement"),
     path('toggle_favorite/<int:produit_id>/', views.toggle_favorite, name='toggle_favorite'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('ajout-article/', views.ajout_article, name='ajout-article'),
@@ -0,0 +1,177 @@
+import datetime
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Case, Count, DateField, F, Max, Q, Value, When
+from django.utils import timezone
+
+from base.cache import get_or_build
+from . import models
+from .models import promotion_en_cours
+
+
+CATEGORIES_CACHE = 'categories'
+
+# Fiches produit rendues pour tous les visiteurs (shop.views.product_detail).
+FICHES_CACHE = 'fiches'
+FICHES_TIMEOUT = 60 * 15
+
+# Date de la dernière modification du catalogue, tenue à jour par les signaux.
+CATALOGUE_MODIFIE = 'catalogue:modifie'
+
+PRODUITS_PAR_PAGE = 12
+CURSEUR_SALT = 'shop.curseur'
+
+# Tri proposé → (clé de tri, ordre décroissant). L'id départage les ex aequo,
+# ce qui rend l'ordre stable d'une page à l'autre.
+TRIS = {
+    'recent': ('date_add', True),
+    'prix_asc': ('prix_effectif', False),
+    'prix_desc': ('prix_effectif', True),
+    'fin_promo': ('fin_promo', False),
+}
+TRI_DEFAUT = 'recent'
+
+
+def _construire_arbre():
+    parents = models.CategorieEtablissement.objects.filter(status=True).annotate(
+        nb_produits=Count('produit_etab', filter=Q(produit_etab__status=True)),
+    ).order_by('id')
+    enfants = models.CategorieProduit.objects.annotate(
+        nb_produits=Count('produit', filter=Q(produit__status=True)),
+    ).order_by('id')
+
+    arbre = []
+    noeuds = {}
+    for categorie in parents:
+        noeud = {
+            'id': categorie.id,
+            'nom': categorie.nom,
+            'slug': categorie.slug,
+            'nb_produits': categorie.nb_produits,
+            'enfants': [],
+        }
+        noeuds[categorie.id] = noeud
+        arbre.append(noeud)
+
+    for categorie in enfants:
+        parent = noeuds.get(categorie.categorie_id)
+        if parent is not None:
+            parent['enfants'].append({
+                'id': categorie.id,
+                'nom': categorie.nom,
+                'slug': categorie.slug,
+                'nb_produits': categorie.nb_produits,
+            })
+    return arbre
+
+
+def get_category_tree():
+    """Arbre CategorieEtablissement → CategorieProduit avec le nombre de deals.
+
+    Construit en deux requêtes puis servi depuis le cache jusqu'à la prochaine
+    modification d'une catégorie ou d'un produit.
+    """
+    return get_or_build(CATEGORIES_CACHE, 'arbre', _construire_arbre)
+
+
+def _annoter_tri(produits, tri):
+    # Tri et curseur sur les colonnes enregistrées (indexées) ; l'annotation
+    # ne sert qu'à l'affichage.
+    produits = produits.with_effective_price()
+    if tri in ('prix_asc', 'prix_desc'):
+        return produits.annotate(cle_tri=F('prix_courant'))
+    if tri == 'fin_promo':
+        # Les deals sans promotion en cours passent après tous les autres.
+        return produits.annotate(cle_tri=Case(
+            When(promo_active=True, then=F('date_fin_promo')),
+            default=Value(datetime.date.max),
+            output_field=DateField(),
+        ))
+    return produits.annotate(cle_tri=F('date_add'))
+
+
+def _lire_curseur(curseur):
+    try:
+        return signing.loads(curseur, salt=CURSEUR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+
+
+def paginer_produits(produits, tri=None, curseur=None, taille=PRODUITS_PAR_PAGE):
+    """Une page de `produits` en pagination par curseur (keyset).
+
+    Au lieu d'un OFFSET, la page suivante repart de la clé de tri et de l'id du
+    dernier produit affiché : le coût d'une page ne dépend pas de sa position
+    dans le catalogue. Le curseur est signé pour ne pas être forgé.
+    Retourne {'produits', 'tri', 'suivant'} ; 'suivant' vaut None en fin de liste.
+    """
+    if tri not in TRIS:
+        tri = TRI_DEFAUT
+    _, decroissant = TRIS[tri]
+    produits = _annoter_tri(produits, tri)
+
+    position = _lire_curseur(curseur) if curseur else None
+    if position and position.get('tri') == tri:
+        valeur, dernier = position['cle'], position['id']
+        if decroissant:
+            produits = produits.filter(Q(cle_tri__lt=valeur) | Q(cle_tri=valeur, id__lt=dernier))
+        else:
+            produits = produits.filter(Q(cle_tri__gt=valeur) | Q(cle_tri=valeur, id__gt=dernier))
+
+    if decroissant:
+        produits = produits.order_by('-cle_tri', '-id')
+    else:
+        produits = produits.order_by('cle_tri', 'id')
+
+    page = list(produits[:taille + 1])
+    suivant = None
+    if len(page) > taille:
+        page = page[:taille]
+        dernier = page[-1]
+        cle = dernier.cle_tri
+        if isinstance(cle, (datetime.date, datetime.datetime)):
+            cle = cle.isoformat()
+        suivant = signing.dumps({'tri': tri, 'cle': cle, 'id': dernier.id}, salt=CURSEUR_SALT, compress=True)
+    return {'produits': page, 'tri': tri, 'suivant': suivant}
+
+
+def balayer_promotions():
+    """Bascule les produits dont la promotion a commencé ou pris fin.
+
+    Deux UPDATE groupés sur les colonnes indexées : seuls les produits dont
+    l'état enregistré ne correspond plus à la date du jour sont touchés.
+    Retourne le nombre de produits basculés.
+    """
+    maintenant = timezone.now()
+    ouvertes = models.Produit.objects.filter(promotion_en_cours(), promo_active=False).update(
+        promo_active=True, prix_courant=F('prix_promotionnel'), date_update=maintenant,
+    )
+    fermees = models.Produit.objects.filter(promo_active=True).exclude(promotion_en_cours()).update(
+        promo_active=False, prix_courant=F('prix'), date_update=maintenant,
+    )
+    if ouvertes or fermees:
+        catalogue_modifie(maintenant)
+    return ouvertes + fermees
+
+
+def catalogue_modifie(date=None):
+    """Note que le catalogue (ou ce qu'affichent ses pages) vient de changer."""
+    cache.set(CATALOGUE_MODIFIE, date or timezone.now(), None)
+
+
+def date_catalogue():
+    """Date de la dernière modification du catalogue, sans parcourir les tables.
+
+    Elle n'est recalculée en base que si le cache l'a perdue.
+    """
+    date = cache.get(CATALOGUE_MODIFIE)
+    if date is None:
+        dates = [
+            modele.objects.aggregate(date=Max('date_update'))['date']
+            for modele in (models.Produit, models.CategorieProduit,
+                           models.CategorieEtablissement, models.Etablissement)
+        ]
+        date = max(filter(None, dates), default=timezone.now())
+        cache.add(CATALOGUE_MODIFIE, date, None)
+    return date
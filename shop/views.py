@@ -2,44 +2,144 @@ from django.shortcuts import redirect, render,  get_object_or_404
 from . import models
 from customer import models as customer_models
 from django.contrib.auth.decorators import login_required
+import hashlib
 import json
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 # from cinetpay_sdk.s_d_k import Cinetpay
 from cities_light.models import City
 
 from django.contrib import messages
 from .models import Produit, Favorite, Etablissement, CategorieProduit
 from customer.models import Commande
+from customer.coupons import CouponInvalide, utiliser as utiliser_coupon
+from customer.stock import StockInsuffisant, confirmer, reserver
 
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.http import urlencode
+from base.cache import get_or_build, get_version, remplir_trous
+from base.images import VARIANTES_CACHE
+from website.signals import SITE_CACHE
+from .utils import CATEGORIES_CACHE, FICHES_CACHE, FICHES_TIMEOUT, date_catalogue, paginer_produits
+from .recherche import rechercher_produits
+from .facettes import barre_facettes, filtrer_produits, lire_filtres
+from .associes import deals_associes, enregistrer_commande
+from .slugs import CATEGORIES, resoudre
+from .televersements import (
+    IMAGES_ETABLISSEMENT, IMAGES_PRODUIT, avec_etat_images, etat_images, mettre_en_attente,
+)
 
 
 # Create your views here.
+def _etag_catalogue(request, *args, **kwargs):
+    # Les pages d'un client connecté dépendent de son compte : pas de 304.
+    if request.user.is_authenticated:
+        return None
+    # Les cookies (panier, jeton CSRF) entrent dans la signature : le
+    # navigateur ne réutilise sa copie que pour le même visiteur.
+    signature = '%s|%s|%s' % (
+        date_catalogue().timestamp(), request.get_full_path(), request.META.get('HTTP_COOKIE', ''),
+    )
+    return '"%s"' % hashlib.md5(signature.encode()).hexdigest()
+
+
+def _date_catalogue(request, *args, **kwargs):
+    if request.user.is_authenticated or request.COOKIES:
+        return None
+    return date_catalogue()
+
+
+catalogue_conditionnel = condition(etag_func=_etag_catalogue, last_modified_func=_date_catalogue)
+
+
+def _liste_produits(request, produits, categorie=None):
+    filtres = lire_filtres(request.GET)
+    if categorie is None:
+        facettes = barre_facettes(filtres)
+    else:
+        # Compteurs propres à la catégorie affichée
+        facette = 'categorie' if isinstance(categorie, models.CategorieProduit) else 'categorie_etab'
+        facettes = barre_facettes(filtres, (facette, str(categorie.pk)))
+    produits = filtrer_produits(produits, filtres)
+    page = paginer_produits(produits, request.GET.get('tri'), request.GET.get('apres'))
+    datas = {
+        'produits' : page['produits'],
+        'tri' : page['tri'],
+        'suivant' : page['suivant'],
+        'categorie' : categorie,
+        'filtres' : filtres,
+        'filtres_qs' : urlencode(filtres),
+        'facettes' : facettes,
+    }
+    return render(request, 'shop.html', datas)
+
+
+@catalogue_conditionnel
 def shop(request):
     produits = models.Produit.objects.filter(status=True)
+    return _liste_produits(request, produits)
+
+
+def produits_page(request):
+    # Page suivante de la liste en fragments HTML, pour le défilement infini
+    slug = request.GET.get('slug')
+    if slug:
+        try:
+            _, produits = _produits_categorie(slug)
+        except Http404:
+            return JsonResponse({'success': False, 'message': 'Catégorie introuvable'}, safe=False)
+    else:
+        produits = models.Produit.objects.filter(status=True)
+
+    produits = filtrer_produits(produits, lire_filtres(request.GET))
+    page = paginer_produits(produits, request.GET.get('tri'), request.GET.get('apres'))
     datas = {
-        'produits' : produits
+        'success': True,
+        'grille': render_to_string('produits-grille.html', {'produits': page['produits']}, request),
+        'liste': render_to_string('produits-liste.html', {'produits': page['produits']}, request),
+        'suivant': page['suivant'],
     }
-    return render(request, 'shop.html', datas)
+    return JsonResponse(datas, safe=False)
 
 
+def _rendre_fiche(request, produit_id):
+    produit = Produit.objects.with_effective_price().select_related('etablissement').get(id=produit_id)
+    datas = {
+        'produit': produit,
+        'produits': deals_associes(produit),
+        'rendu_partage': True,
+    }
+    return render_to_string('product-details.html', datas, request)
+
+
+@catalogue_conditionnel
 def product_detail(request, slug):
-    produit = get_object_or_404(Produit, slug=slug)
-    produits = Produit.objects.filter(categorie=produit.categorie).exclude(id=produit.id)[:3]
+    # La page commune à tous les visiteurs est servie depuis le cache, sous une
+    # clé qui change avec le produit ; seuls les trous (mini-panier, compte,
+    # favori, jeton CSRF) sont rendus pour la requête.
+    trouve = resoudre(slug, ('produit',))
+    if trouve is None:
+        raise Http404("Produit introuvable")
+    produit = get_object_or_404(Produit.objects.only('id', 'slug', 'date_update'), pk=trouve[1])
+    cle = '%s:%s:%s:%s:%s' % (
+        produit.id, produit.date_update.timestamp(),
+        get_version(SITE_CACHE), get_version(CATEGORIES_CACHE), get_version(VARIANTES_CACHE),
+    )
+    html = get_or_build(FICHES_CACHE, cle, lambda: _rendre_fiche(request, produit.id), FICHES_TIMEOUT)
 
-    
     is_favorited = False
     if request.user.is_authenticated:
         is_favorited = Favorite.objects.filter(user=request.user, produit=produit).exists()
 
     datas = {
         'produit': produit,
-        'produits': produits,
-        'is_favorited': is_favorited, 
+        'is_favorited': is_favorited,
     }
-    return render(request, 'product-details.html', datas)
+    return HttpResponse(remplir_trous(html, request, datas))
 
 
 def toggle_favorite(request, produit_id):
@@ -66,6 +166,7 @@ def cart(request):
 
 @login_required(login_url='login')
 def checkout(request):
+    # Lecture seule : le stock n'est réservé qu'au paiement (post_paiement_details)
     datas = {}
     return render(request, 'checkout.html', datas)
 
@@ -83,22 +184,75 @@ def paiement_success(request):
         return redirect('index')
 
 
-def single(request, slug):
+def recherche(request):
+    terme = request.GET.get('q', '').strip()
     try:
-        try:
-            categorie = models.CategorieProduit.objects.get(slug=slug)
-            produits = categorie.produit.all()
-        except:
-            categorie = models.CategorieEtablissement.objects.get(slug=slug)
-            produits = categorie.produit_etab.all()
-    except:
-        return redirect('shop')
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
 
+    resultats = rechercher_produits(terme, page)
     datas = {
-        'produits' : produits,
-        'categorie' : categorie
+        'terme': terme,
+        'resultats': resultats['resultats'],
+        'page': resultats['page'],
+        'suivante': resultats['suivante'],
     }
-    return render(request, 'shop.html', datas)
+    return render(request, 'recherche.html', datas)
+
+
+def _produits_categorie(slug):
+    trouve = resoudre(slug, CATEGORIES)
+    if trouve is None:
+        raise Http404("Catégorie introuvable")
+    type_, pk = trouve
+    if type_ == 'categorie_produit':
+        categorie = get_object_or_404(models.CategorieProduit, pk=pk)
+        produits = categorie.produit.filter(status=True)
+    else:
+        categorie = get_object_or_404(models.CategorieEtablissement, pk=pk)
+        produits = categorie.produit_etab.filter(status=True)
+    return categorie, produits
+
+
+@catalogue_conditionnel
+def single(request, slug):
+    categorie, produits = _produits_categorie(slug)
+    return _liste_produits(request, produits, categorie)
+
+
+@login_required(login_url='login')
+def reserver_paiement(request):
+    """Réserve le stock du panier quand l'acheteur lance le paiement.
+
+    La réservation tient STOCK_RESERVATION_DUREE ; post_paiement_details la
+    rattache à la commande. Sans paiement, customer.cron la rend au stock.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'message': "Une erreur s'est produite", 'success': False}, safe=False)
+
+    erreurs = []
+    try:
+        postdata = json.loads(request.body.decode('utf-8'))
+        panier = customer_models.Panier.objects.get(id=postdata['panier'], customer__user=request.user)
+        reserver(panier)
+        isSuccess = True
+        message = "Stock réservé"
+    except StockInsuffisant as erreur:
+        isSuccess = False
+        erreurs = erreur.erreurs
+        message = "Stock insuffisant : " + ", ".join(
+            "%s (%s disponible(s))" % (e['nom'], e['disponible']) for e in erreurs
+        )
+    except (ValueError, KeyError, customer_models.Panier.DoesNotExist):
+        isSuccess = False
+        message = "Une erreur s'est produite"
+    data = {
+        'message': message,
+        'success': isSuccess,
+        'erreurs': erreurs,
+    }
+    return JsonResponse(data, safe=False)
 
 
 def post_paiement_details(request):
@@ -111,6 +265,7 @@ def post_paiement_details(request):
     user = request.user
 
     url = ""
+    erreurs = []
     isSuccess = False
 
     _ = isSuccess
@@ -133,25 +288,44 @@ def post_paiement_details(request):
             }
 
             try:
-
-                commande = customer_models.Commande()
-                commande.customer = request.user.customer
-                commande.payment_url = 'payment_url'
-                commande.id_paiment = transaction_id
-                commande.transaction_id = transaction_id
-                commande.api_response_id = 'api_response_id'
-                commande.payment_token = 'payment_token'
-                commande.prix_total = panier.total_with_coupon
-                commande.save()
-
-                for i in customer_models.ProduitPanier.objects.filter(panier=panier):
-                    i.panier = None
-                    i.commande = commande
-                    i.save()
+                with transaction.atomic():
+                    commande = customer_models.Commande()
+                    commande.customer = request.user.customer
+                    commande.payment_url = 'payment_url'
+                    commande.id_paiment = transaction_id
+                    commande.transaction_id = transaction_id
+                    commande.api_response_id = 'api_response_id'
+                    commande.payment_token = 'payment_token'
+                    # Même moteur de prix que le panier affiché (customer.prix)
+                    commande.prix_total = panier.prix['total']
+                    if panier.prix['reduction']:
+                        # Une utilisation du coupon, décomptée par la base
+                        utiliser_coupon(panier.coupon_id)
+                    commande.save()
+                    # Réservation prise par reserver_paiement, reprise si elle a expiré :
+                    # un deal épuisé annule la commande
+                    confirmer(panier, commande)
+
+                    for i in customer_models.ProduitPanier.objects.filter(panier=panier):
+                        i.panier = None
+                        i.commande = commande
+                        i.save()
+                    panier.delete()
+                    # Les deals associés ne doivent pas faire échouer une commande passée :
+                    # calculés après le COMMIT, une erreur est seulement journalisée.
+                    transaction.on_commit(lambda: enregistrer_commande(commande), robust=True)
                 isSuccess = True
                 message = "Commande validée"
-                panier.delete()
 
+            except StockInsuffisant as erreur:
+                isSuccess = False
+                erreurs = erreur.erreurs
+                message = "Stock insuffisant : " + ", ".join(
+                    "%s (%s disponible(s))" % (e['nom'], e['disponible']) for e in erreurs
+                )
+            except CouponInvalide:
+                isSuccess = False
+                message = "Ce code coupon vient d'être épuisé, merci de rééssayer"
             except Exception as _:
                 isSuccess = False
                 message = "Une erreur s'est produite, merci de rééssayer"
@@ -164,7 +338,8 @@ def post_paiement_details(request):
     data = {
         'message': message,
         'success': isSuccess,
-        'payment_url' : url
+        'payment_url' : url,
+        'erreurs': erreurs,
     }
     return JsonResponse(data, safe=False)
 
@@ -218,24 +393,20 @@ def ajout_article(request):
         categorie_id = request.POST.get("categorie")
         categorie = get_object_or_404(CategorieProduit, id=categorie_id)
 
-        image = request.FILES.get("image")
-        image_2 = request.FILES.get("image_2")
-        image_3 = request.FILES.get("image_3")
-
-        Produit.objects.create(
+        produit = Produit.objects.create(
             nom=nom,
             description=description,
             prix=prix,
             categorie=categorie,
             etablissement=etablissement,
-            image=image,
-            image_2=image_2,
             quantite=quantite,
-            image_3=image_3,
             status=True,
         )
-
-        messages.success(request, "Article ajouté avec succès !")
+        # Les images sont traitées hors de la requête (shop.televersements)
+        if mettre_en_attente(produit, request.FILES, IMAGES_PRODUIT):
+            messages.success(request, "Article ajouté avec succès ! Ses images seront en ligne dans quelques instants.")
+        else:
+            messages.success(request, "Article ajouté avec succès !")
         return redirect("article-detail")
 
     
@@ -247,7 +418,7 @@ def ajout_article(request):
 @login_required
 def article_detail(request):
     etablissement = get_object_or_404(Etablissement, user=request.user)
-    articles = Produit.objects.filter(etablissement=etablissement)
+    articles = avec_etat_images(Produit.objects.filter(etablissement=etablissement))
 
     # Gestion des filtres
     search_query = request.GET.get("search", "")
@@ -291,18 +462,14 @@ def modifier_article(request, article_id):
         article.quantite = request.POST.get("quantite")
         article.categorie = get_object_or_404(CategorieProduit, id=request.POST.get("categorie"))
 
-        if "image" in request.FILES:
-            article.image = request.FILES["image"]
-        if "image_2" in request.FILES:
-            article.image_2 = request.FILES["image_2"]
-        if "image_3" in request.FILES:
-            article.image_3 = request.FILES["image_3"]
-
         article.save()
-        messages.success(request, "Article modifié avec succès !")
+        if mettre_en_attente(article, request.FILES, IMAGES_PRODUIT):
+            messages.success(request, "Article modifié avec succès ! Les nouvelles images seront en ligne dans quelques instants.")
+        else:
+            messages.success(request, "Article modifié avec succès !")
         return redirect("article-detail")
 
-    return render(request, "modifier-article.html", {"article": article, "categories": categories, "etablissement": etablissement,})
+    return render(request, "modifier-article.html", {"article": article, "categories": categories, "etablissement": etablissement, "images_en_attente": etat_images(article),})
 
 
 @login_required
@@ -383,15 +550,14 @@ def etablissement_parametre(request):
         etablissement.adresse = request.POST.get('adresse')
         etablissement.email = request.POST.get('email')
 
-        if 'logo' in request.FILES:
-            etablissement.logo = request.FILES['logo']
-        if 'couverture' in request.FILES:
-            etablissement.couverture = request.FILES['couverture']
-
         etablissement.save()
+        mettre_en_attente(etablissement, request.FILES, IMAGES_ETABLISSEMENT)
 
         messages.success(request, "Les informations de l'établissement ont été mises à jour avec succès.")
         return redirect('etablissement-parametre')
 
-    return render(request, 'etablissement-parametre.html', {'etablissement': etablissement})
+    return render(request, 'etablissement-parametre.html', {
+        'etablissement': etablissement,
+        'images_en_attente': etat_images(etablissement),
+    })
 
@@ -1,68 +1,60 @@
-from shop import models
+from shop.utils import get_category_tree
 from . import models as config_models
-from customer import models as customer_models
-from django.contrib.sessions.models import Session
-from cities_light.models import City
+from customer import utils as customer_utils
+from django.utils.functional import SimpleLazyObject
+from base.cache import get_or_build
+from .signals import SITE_CACHE
 
 
-def categories(request):
-    cat = models.CategorieEtablissement.objects.filter(status=True)
+def _site_infos():
+    try:
+        return config_models.SiteInfo.objects.latest('date_add')
+    except:
+        return None
 
-    return {'cat':cat}
 
+def _galeries():
+    return list(config_models.Galerie.objects.filter(status=True)[:6])
 
-def site_infos(request):
-    try:
-        infos = config_models.SiteInfo.objects.latest('date_add')
-    except:
-        infos = None
-    return {'infos':infos}
+
+def _horaires():
+    return list(config_models.Horaire.objects.filter(status=True))
 
 
-def cities(request):
+def categories(request):
+    cat = get_category_tree()
+
+    return {'cat':cat}
 
-    cities = City.objects.all()
 
-    return {'cities': cities}
+def site_infos(request):
+    infos = get_or_build(SITE_CACHE, 'infos', _site_infos)
+    return {'infos':infos}
 
 
 def galeries(request):
-    galerie = config_models.Galerie.objects.filter(status=True)[:6]
+    galerie = get_or_build(SITE_CACHE, 'galeries', _galeries)
 
     return {'galeries':galerie}
 
 
 def horaires(request):
-    horaire = config_models.Horaire.objects.filter(status=True)
+    horaire = get_or_build(SITE_CACHE, 'horaires', _horaires)
 
     return {'horaires':horaire}
 
 
+def contexte_partage():
+    """Contexte commun à tous les visiteurs, pour rendre une page partagée sans requête."""
+    contexte = {}
+    for processeur in (categories, site_infos, galeries, horaires):
+        contexte.update(processeur(None))
+    return contexte
+
+
 def cart(request):
-    carts = ""
-    try:
-        if not request.session.exists(request.session.session_key):
-            request.session.create()
-        session_id = Session.objects.get(session_key=request.session.session_key)
-        if request.user.is_authenticated:
-            try:
-                customer = customer_models.Customer.objects.get(user=request.user)
-                carts = customer_models.Panier.objects.get(customer=customer, session_id=session_id)
-            except Exception as e:
-
-                customer = customer_models.Customer.objects.get(user=request.user)
-                carts = customer_models.Panier()
-                carts.session_id = session_id
-                carts.customer = customer
-                carts.save()
-        else:
-            try:
-                carts = customer_models.Panier.objects.get(session_id=session_id)
-            except Exception as e:
-
-                carts = customer_models.Panier()
-                carts.session_id = session_id
-                carts.save()
-    except:
-        pass
-    return {'cart':carts}
\ No newline at end of file
+    # Le panier n'est résolu que si un template lit `cart.*`.
+    return {
+        'cart': SimpleLazyObject(lambda: customer_utils.get_cart(request) or ""),
+        'mini_cart': SimpleLazyObject(lambda: customer_utils.get_cart_summary(request)),
+    }
@@ -0,0 +1,34 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from base.cache import bump_version
+from cities_light.models import City
+from shop.utils import catalogue_modifie
+from .models import About, Appreciation, Banniere, Galerie, Horaire, Partenaire, SiteInfo
+from .utils import VILLES_CACHE
+
+
+SITE_CACHE = 'site'
+ACCUEIL_CACHE = 'accueil'
+
+
+@receiver([post_save, post_delete], sender=SiteInfo)
+@receiver([post_save, post_delete], sender=Galerie)
+@receiver([post_save, post_delete], sender=Horaire)
+def invalider_cache_site(sender, **kwargs):
+    bump_version(SITE_CACHE)
+    # L'en-tête et le pied des pages du catalogue affichent ces informations.
+    catalogue_modifie()
+
+
+@receiver([post_save, post_delete], sender=About)
+@receiver([post_save, post_delete], sender=Appreciation)
+@receiver([post_save, post_delete], sender=Banniere)
+@receiver([post_save, post_delete], sender=Partenaire)
+def invalider_accueil(sender, **kwargs):
+    bump_version(ACCUEIL_CACHE)
+
+
+@receiver([post_save, post_delete], sender=City)
+def invalider_index_villes(sender, **kwargs):
+    bump_version(VILLES_CACHE)
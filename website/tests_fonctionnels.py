@@ -1,5 +1,6 @@
 from django.test import TestCase
 from django.urls import reverse
+from cities_light.models import City, Country
 
 
 class TestWebsiteFonctionnels(TestCase):
@@ -13,3 +14,26 @@ class TestWebsiteFonctionnels(TestCase):
         response = self.client.get(reverse("about"))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "about-us.html")
+
+
+class TestRechercheVilles(TestCase):
+
+    def setUp(self):
+        pays = Country.objects.create(name="Côte d'Ivoire", code2="CI", code3="CIV")
+        City.objects.create(name="Abidjan", country=pays, population=4000000)
+        City.objects.create(name="Abengourou", country=pays, population=100000)
+        City.objects.create(name="Bouaké", country=pays, population=500000)
+
+    def test_recherche_par_prefixe(self):
+        response = self.client.get(reverse("villes"), {"q": "ab"})
+        self.assertEqual(response.status_code, 200)
+        noms = [v["text"] for v in response.json()["results"]]
+        self.assertEqual(noms, ["Abidjan, Côte d'Ivoire", "Abengourou, Côte d'Ivoire"])
+
+    def test_recherche_sans_accents(self):
+        response = self.client.get(reverse("villes"), {"q": "bouake"})
+        self.assertEqual(len(response.json()["results"]), 1)
+
+    def test_recherche_vide(self):
+        response = self.client.get(reverse("villes"))
+        self.assertEqual(response.json()["results"], [])
@@ -1,5 +1,12 @@
 from django.test import TestCase
+from django.contrib.auth.models import User
 from django.urls import reverse
+from base.cache import attendre_rafraichissements, bump_version
+from django.core.cache import cache
+from django.test import RequestFactory
+from website.models import Horaire
+from website.context_processors import horaires
+from website.signals import ACCUEIL_CACHE, SITE_CACHE
 
 
 class TestWebsiteIntegration(TestCase):
@@ -11,3 +18,66 @@ class TestWebsiteIntegration(TestCase):
     def test_about_sans_donnees(self):
         response = self.client.get(reverse("about"))
         self.assertEqual(response.status_code, 200)
+
+
+class TestCacheSite(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get("/")
+
+    def test_horaires_servis_depuis_le_cache(self):
+        Horaire.objects.create(titre="Lundi", description="8h-18h", status=True)
+        horaires(self.request)
+
+        with self.assertNumQueries(0):
+            data = horaires(self.request)
+        self.assertEqual([h.titre for h in data["horaires"]], ["Lundi"])
+
+    def test_modification_invalide_le_cache(self):
+        horaire = Horaire.objects.create(titre="Lundi", description="8h-18h", status=True)
+        horaires(self.request)
+
+        horaire.titre = "Mardi"
+        horaire.save()
+
+        self.assertEqual([h.titre for h in horaires(self.request)["horaires"]], ["Mardi"])
+
+
+class TestCacheAccueil(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_accueil_sans_requete(self):
+        self.client.get(reverse("index"))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("index"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Coups de coeur")
+        self.assertNotContains(response, "<!--trou:")
+
+    def test_page_partagee_sans_donnees_du_visiteur(self):
+        User.objects.create_user(username="visiteurconnecte", password="Pass123", last_name="V")
+        self.client.login(username="visiteurconnecte", password="Pass123")
+
+        response = self.client.get(reverse("index"))
+
+        self.assertContains(response, "visiteurconnecte")
+        _, _, html = cache.get("%s:index" % ACCUEIL_CACHE)
+        self.assertIn("<!--trou:", html)
+        self.assertNotIn("visiteurconnecte", html)
+        self.assertNotIn("csrfmiddlewaretoken", html)
+
+    def test_rafraichissement_en_arriere_plan(self):
+        self.client.get(reverse("index"))
+        version, _, _ = cache.get("%s:index" % ACCUEIL_CACHE)
+
+        bump_version(SITE_CACHE)
+        self.client.get(reverse("index"))
+        attendre_rafraichissements()
+
+        self.assertNotEqual(cache.get("%s:index" % ACCUEIL_CACHE)[0], version)
+
@@ -0,0 +1,62 @@
+from bisect import bisect_left
+
+from django.conf import settings
+from cities_light.abstract_models import to_search
+from cities_light.models import City
+
+from base.cache import get_version
+
+
+VILLES_CACHE = 'villes'
+
+# Index de préfixes propre au processus : une liste triée de
+# (nom normalisé, id de ville) parcourue par recherche dichotomique.
+_index = {'version': None, 'noms': [], 'villes': {}}
+
+
+def _noms_ville(ville):
+    noms = {ville.name, ville.name_ascii}
+    noms.update((ville.alternate_names or '').split(';'))
+    for langue in getattr(settings, 'CITIES_LIGHT_TRANSLATION_LANGUAGES', []):
+        noms.update(ville.translations.get(langue, []))
+    return {to_search(nom) for nom in noms if nom}
+
+
+def _construire_index():
+    noms = []
+    villes = {}
+    qs = City.objects.only(
+        'id', 'name', 'name_ascii', 'alternate_names', 'translations',
+        'display_name', 'population',
+    )
+    for ville in qs.iterator():
+        villes[ville.id] = (ville.display_name or ville.name, ville.population or 0)
+        noms.extend((nom, ville.id) for nom in _noms_ville(ville))
+    noms.sort()
+    return noms, villes
+
+
+def get_index_villes():
+    version = get_version(VILLES_CACHE)
+    if _index['version'] != version:
+        _index['noms'], _index['villes'] = _construire_index()
+        _index['version'] = version
+    return _index['noms'], _index['villes']
+
+
+def rechercher_villes(terme, limite=10):
+    """Villes dont un des noms (ou une traduction) commence par `terme`."""
+    prefixe = to_search(terme or '')
+    if not prefixe:
+        return []
+
+    noms, villes = get_index_villes()
+    trouvees = set()
+    position = bisect_left(noms, (prefixe,))
+    while position < len(noms) and noms[position][0].startswith(prefixe):
+        trouvees.add(noms[position][1])
+        position += 1
+
+    # Les villes les plus peuplées en premier
+    resultats = sorted(trouvees, key=lambda pk: (-villes[pk][1], villes[pk][0]))
+    return [{'id': pk, 'text': villes[pk][0]} for pk in resultats[:limite]]
@@ -1,24 +1,50 @@
 from django.shortcuts import render
+from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
 from . import models
+from .context_processors import contexte_partage
+from base.cache import get_or_build_stale, remplir_trous
+from base.images import VARIANTES_CACHE
 from shop import models as shop_models
+from shop.utils import CATEGORIES_CACHE
+from .signals import ACCUEIL_CACHE, SITE_CACHE
+from .utils import rechercher_villes
+
+
+# Durée (secondes) pendant laquelle la page d'accueil en cache est servie sans rafraîchissement.
+ACCUEIL_FRAICHEUR = 60 * 5
 
 
 # Create your views here.
-def index(request):
+def _rendre_accueil():
+    # Rendu hors requête (rafraîchi en arrière-plan) : aucun élément propre au
+    # visiteur, qui n'apparaît que dans les trous.
     about = models.About.objects.filter(status=True)[:1]
     partenaires = models.Partenaire.objects.filter(status=True)[:5]
     bannieres = models.Banniere.objects.filter(status=True)[:4]
     appreciations = models.Appreciation.objects.filter(status=True)
-    produits = shop_models.Produit.objects.filter(super_deal=True)[:3]
+    produits = shop_models.Produit.objects.with_effective_price().filter(super_deal=True)[:3]
     datas = {
         'about': about,
         'partenaires': partenaires,
         'appreciations': appreciations,
         'produits': produits,
         'bannieres': bannieres,
+        'rendu_partage': True,
     }
+    datas.update(contexte_partage())
+
+    return render_to_string('index.html', datas)
 
-    return render(request, 'index.html', datas)
+
+def index(request):
+    # La page est la même pour tous : elle est servie depuis le cache et
+    # rafraîchie en arrière-plan, seuls les trous sont rendus par visiteur.
+    html = get_or_build_stale(
+        ACCUEIL_CACHE, 'index', _rendre_accueil, ACCUEIL_FRAICHEUR,
+        depends_on=(SITE_CACHE, CATEGORIES_CACHE, VARIANTES_CACHE),
+    )
+    return HttpResponse(remplir_trous(html, request))
 
 
 def about(request):
@@ -29,4 +55,9 @@ def about(request):
         'why_choose': why_choose,
 
     }
-    return render(request, 'about-us.html', datas)
\ No newline at end of file
+    return render(request, 'about-us.html', datas)
+
+
+def villes(request):
+    resultats = rechercher_villes(request.GET.get('q', ''))
+    return JsonResponse({'results': resultats})